@@ -0,0 +1,274 @@
+"""Локальная замена VK API для бенчмарков.
+
+`FakeVkTransport` подставляется в `vk_api.VkApi` вместо `requests.Session`,
+так что через бота проходит настоящий код `vk_api`, метрик и трассировки,
+но ни один запрос не уходит в сеть.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from vk_api.longpoll import VkEventType
+
+COUNTRY_TITLES = [
+    "Россия",
+    "Украина",
+    "Беларусь",
+    "Казахстан",
+    "Азербайджан",
+    "Армения",
+    "Грузия",
+    "Израиль",
+    "США",
+    "Германия",
+]
+
+# сколько стран VK отдаёт без `need_all`
+POPULAR_COUNTRIES = 4
+
+# код ошибки VK API "слишком много запросов в секунду"
+TOO_MANY_RPS_CODE = 6
+
+
+class FakeEvent:
+    """Событие лонгпула с новым входящим сообщением."""
+
+    type = VkEventType.MESSAGE_NEW
+    to_me = True
+
+    def __init__(self, user_id: int, text: str) -> None:
+        self.user_id = user_id
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"FakeEvent(user_id={self.user_id!r}, text={self.text!r})"
+
+
+class FakeVkWorld:
+    """Детерминированный набор стран, городов и людей."""
+
+    def __init__(
+        self, seed: int = 0, cities_per_country: int = 50, search_size: int = 1000
+    ) -> None:
+        self.seed = seed
+        self.search_size = search_size
+        self.countries: List[Dict[str, Any]] = [
+            {"id": i + 1, "title": title} for i, title in enumerate(COUNTRY_TITLES)
+        ]
+        self.cities: Dict[int, List[Dict[str, Any]]] = {
+            country["id"]: [
+                {"id": country["id"] * 1000 + j, "title": f"Город {j}"}
+                for j in range(1, cities_per_country + 1)
+            ]
+            for country in self.countries
+        }
+        self._cities_by_id = {
+            city["id"]: city for cities in self.cities.values() for city in cities
+        }
+
+    def _rng(self, *key: Any) -> random.Random:
+        # строковое зерно, в отличие от hash(), не зависит от PYTHONHASHSEED
+        return random.Random(repr((self.seed,) + key))
+
+    def users_get(self, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        users = []
+        for user_id in map(int, str(values["user_ids"]).split(",")):
+            rng = self._rng("user", user_id)
+            user: Dict[str, Any] = {
+                "id": user_id,
+                "first_name": f"Имя{user_id}",
+                "last_name": f"Фамилия{user_id}",
+            }
+            # примерно у половины пользователей страна и город не указаны
+            if rng.random() < 0.5:
+                country = rng.choice(self.countries)
+                user["country"] = country
+                user["city"] = rng.choice(self.cities[country["id"]])
+            users.append(user)
+        return users
+
+    def get_countries(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        # как и VK: с `need_all` -- все страны по алфавиту,
+        # без него -- только основные, в порядке популярности
+        if int(values.get("need_all", 0)):
+            countries = sorted(self.countries, key=lambda c: c["title"])
+        else:
+            countries = self.countries[:POPULAR_COUNTRIES]
+        items = countries[: int(values.get("count", 100))]
+        return {"count": len(countries), "items": items}
+
+    def get_countries_by_id(self, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        ids = {int(i) for i in str(values["country_ids"]).split(",")}
+        return [country for country in self.countries if country["id"] in ids]
+
+    def get_cities(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        cities = self.cities.get(int(values["country_id"]), [])
+        query = values.get("q")
+        if query:
+            cities = [c for c in cities if c["title"].lower().startswith(query)]
+        items = cities[: int(values.get("count", 100))]
+        return {"count": len(cities), "items": items}
+
+    def get_cities_by_id(self, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        ids = [int(i) for i in str(values["city_ids"]).split(",")]
+        return [self._cities_by_id[i] for i in ids if i in self._cities_by_id]
+
+    def users_search(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        key = tuple(
+            values.get(k) for k in ("country", "city", "sex", "age_from", "age_to")
+        )
+        rng = self._rng("search", key)
+        count = min(int(values.get("count", 20)), self.search_size)
+        items = []
+        for _ in range(count):
+            person_id = rng.randrange(1, 10**9)
+            items.append(
+                {
+                    "id": person_id,
+                    "first_name": f"Имя{person_id}",
+                    "last_name": f"Фамилия{person_id}",
+                    "is_closed": rng.random() < 0.2,
+                    "can_access_closed": True,
+                }
+            )
+        return {"count": count, "items": items}
+
+    def photos_get(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        owner_id = int(values["owner_id"])
+        rng = self._rng("photos", owner_id)
+        items = [
+            {
+                "id": photo_id,
+                "owner_id": owner_id,
+                "likes": {"count": rng.randrange(0, 500), "user_likes": 0},
+            }
+            for photo_id in range(1, rng.randrange(1, 20) + 1)
+        ]
+        return {"count": len(items), "items": items}
+
+    def execute(self, values: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        """VKScript тут не выполнить, поэтому понимаем только скрипт
+        `vkinder.ranking.RANK_CODE`: лайки фотографий профиля по анкетам."""
+        result: List[Optional[Dict[str, Any]]] = []
+        for owner_id in str(values["owner_ids"]).split(","):
+            photos = self.photos_get({"owner_id": owner_id})["items"]
+            result.append(
+                {
+                    "ids": [photo["id"] for photo in photos],
+                    "likes": [photo["likes"]["count"] for photo in photos],
+                }
+            )
+        return result
+
+
+class FakeResponse:
+    ok = True
+    status_code = 200
+
+    def __init__(self, payload: Any) -> None:
+        self.content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class FakeVkTransport:
+    """HTTP-сессия, которая отвечает за VK API из `FakeVkWorld`.
+
+    `latency` -- задержка каждого ответа в секундах. `rate_limit` -- сколько
+    запросов в секунду разрешено на один токен (0 -- без ограничения); при
+    превышении, как и настоящий VK, возвращается ошибка с кодом 6.
+    С вероятностью `stall_probability` ответ зависает на `stall` секунд.
+    """
+
+    def __init__(
+        self,
+        world: FakeVkWorld,
+        latency: float = 0.0,
+        rate_limit: float = 0,
+        stall_probability: float = 0.0,
+        stall: float = 0.0,
+    ) -> None:
+        self.world = world
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.stall_probability = stall_probability
+        self.stall = stall
+        self.stalls = 0
+        self._rng = random.Random(world.seed)
+        self.headers: Dict[str, str] = {}
+        self.calls: Counter = Counter()
+        self.rate_limited = 0
+        self._requests: Dict[str, Deque[float]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "users.get": world.users_get,
+            "users.search": world.users_search,
+            "database.getCountries": world.get_countries,
+            "database.getCountriesById": world.get_countries_by_id,
+            "database.getCities": world.get_cities,
+            "database.getCitiesById": world.get_cities_by_id,
+            "photos.get": world.photos_get,
+            "execute": world.execute,
+            "messages.send": lambda values: random.randrange(10**6),
+            "messages.getLongPollServer": lambda values: {
+                "key": "fake",
+                "server": "localhost/fake-longpoll",
+                "ts": 1,
+            },
+        }
+
+    def _is_rate_limited(self, token: str) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            requests = self._requests[token]
+            while requests and now - requests[0] >= 1:
+                requests.popleft()
+            if len(requests) >= self.rate_limit:
+                self.rate_limited += 1
+                return True
+            requests.append(now)
+            return False
+
+    def post(
+        self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> FakeResponse:
+        method = url.rsplit("/", 1)[-1]
+        values = dict(data or {})
+        token = values.pop("access_token", "")
+
+        delay = self.latency
+        if self.stall_probability:
+            with self._lock:
+                if self._rng.random() < self.stall_probability:
+                    self.stalls += 1
+                    delay += self.stall
+        if delay:
+            time.sleep(delay)
+
+        if self._is_rate_limited(token):
+            return FakeResponse(
+                {
+                    "error": {
+                        "error_code": TOO_MANY_RPS_CODE,
+                        "error_msg": "Too many requests per second",
+                        "request_params": [],
+                    }
+                }
+            )
+
+        with self._lock:
+            self.calls[method] += 1
+
+        handler = self._handlers.get(method)
+        if handler is None:
+            return FakeResponse(
+                {"error": {"error_code": 3, "error_msg": f"Unknown method {method}"}}
+            )
+        return FakeResponse({"response": handler(values)})
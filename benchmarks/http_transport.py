@@ -0,0 +1,219 @@
+"""Общий пул соединений `VkTransport` против отдельной сессии на каждый токен.
+
+Поднимает локальный HTTP-сервер вместо api.vk.ru, который, как настоящий,
+закрывает простаивающие keep-alive соединения, а на каждое новое соединение
+тратит `--handshake` секунд (так изображается установка TLS). Запросы идут
+через настоящий `vk_api` по токенам по кругу: сначала каждый токен со своей
+`requests.Session` (как по умолчанию делает `vk_api`), потом все через один
+`VkTransport`.
+
+    python -m benchmarks.http_transport --tokens 10 --requests 300
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import cycle
+from typing import Any, Dict, List, Optional, Sequence
+
+import requests
+
+from benchmarks.fake_vk import FakeVkWorld
+from benchmarks.load_test import percentile
+from vkinder.metrics import Metrics
+from vkinder.session import VkSession
+from vkinder.tracing import Tracer
+from vkinder.transport import VkTransport
+
+VK_API_URL = "https://api.vk.ru"
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Локальный HTTP-сервер, который на любой метод отвечает выдачей поиска."""
+
+    daemon_threads = True
+
+    def __init__(self, body: bytes, keepalive: float, handshake: float) -> None:
+        self.body = body
+        self.gzipped_body = gzip.compress(body)
+        self.keepalive = keepalive
+        self.handshake = handshake
+        self.connections = 0
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # как и у nginx перед api.vk.ru, иначе заголовки и тело ответа по уже
+    # открытому соединению упираются в delayed ACK
+    disable_nagle_algorithm = True
+    server: StandInServer
+
+    def setup(self) -> None:
+        super().setup()
+        # сервер закрывает соединение, если по нему ничего не пришло
+        # за `keepalive` секунд
+        self.connection.settimeout(self.server.keepalive)
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = self.server.body
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = self.server.gzipped_body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class LocalSession(requests.Session):
+    """HTTP-сессия, которая ходит на локальный сервер вместо api.vk.ru."""
+
+    base_url = ""
+
+    def request(  # type: ignore[override]
+        self, method: str, url: str, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        url = url.replace(VK_API_URL, self.base_url)
+        return super().request(method, url, *args, **kwargs)
+
+
+class LocalVkTransport(LocalSession, VkTransport):
+    pass
+
+
+def measure(
+    sessions: List[VkSession], requests_count: int, interval: float
+) -> List[float]:
+    latencies = []
+    tokens = cycle(sessions)
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        next(tokens).method("users.search", {"count": 1000})
+        latencies.append(time.perf_counter() - started)
+        time.sleep(interval)
+    return latencies
+
+
+def run_variant(
+    server: StandInServer, args: argparse.Namespace, shared: bool
+) -> Dict[str, float]:
+    metrics = Metrics()
+    tracer = Tracer()
+    http: List[requests.Session]
+    if shared:
+        transport = LocalVkTransport(metrics, pool_size=args.tokens)
+        http = [transport] * args.tokens
+    else:
+        http = [LocalSession() for _ in range(args.tokens)]
+    for session in http:
+        session.base_url = server.url  # type: ignore[attr-defined]
+
+    sessions = [
+        VkSession(f"token{i}", metrics, tracer, f"user{i}", http[i])
+        for i in range(args.tokens)
+    ]
+    for session in sessions:
+        session.RPS_DELAY = 0
+
+    with server.lock:
+        server.connections = 0
+    latencies = measure(sessions, args.requests, args.interval)
+    with server.lock:
+        connections = server.connections
+
+    for session in set(http):
+        session.close()
+    stats = {
+        "connections": connections,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+    if shared:
+        received, decoded = (
+            transport.bytes_total.labels(direction=direction).value
+            for direction in ("received", "decoded")
+        )
+        stats["received_bytes_per_request"] = received / args.requests
+        stats["decoded_bytes_per_request"] = decoded / args.requests
+    return stats
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    body = json.dumps(
+        {"response": FakeVkWorld(seed=args.seed).users_search({"count": 1000})},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    server = StandInServer(body, args.keepalive, args.handshake)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return {
+            "per_token": run_variant(server, args, shared=False),
+            "shared": run_variant(server, args, shared=True),
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument(
+        "--interval", type=float, default=0.02, help="пауза между запросами, секунды"
+    )
+    parser.add_argument(
+        "--keepalive",
+        type=float,
+        default=0.1,
+        help="через сколько секунд простоя сервер закрывает соединение",
+    )
+    parser.add_argument(
+        "--handshake",
+        type=float,
+        default=0.03,
+        help="сколько секунд занимает установка соединения",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    results = run(args)
+    print(f"{'':<12}{'connections':>12}{'p50, ms':>10}{'p99, ms':>10}")
+    for name, stats in results.items():
+        print(
+            f"{name:<12}{stats['connections']:>12.0f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    shared = results["shared"]
+    print(
+        f"Response size: {shared['received_bytes_per_request'] / 1024:.1f} KiB "
+        f"on the wire, {shared['decoded_bytes_per_request'] / 1024:.1f} KiB decoded"
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
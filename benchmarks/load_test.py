@@ -0,0 +1,258 @@
+"""Нагрузочный тест бота без сети.
+
+Прогоняет тысячи пользователей по полному сценарию (initial -> hello ->
+страна -> город -> пол -> возраст -> просмотр результатов) через настоящий
+`Bot` с подменённым VK API и печатает пропускную способность, задержки по
+состояниям, число запросов к VK на один сценарий и рост памяти.
+
+    python -m benchmarks.load_test --users 2000 --browse 10
+"""
+
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from vkinder.bot import Bot
+from vkinder.config import Config
+from vkinder.models import User
+from vkinder.storage.base import BaseStorage, ItemNotFoundInStorageError
+from vkinder.storage.memory_storage import MemoryStorage, PersistentStorage
+
+AGE_RANGES = ["16-20", "20-25", "25-30", "30-35", "35-40", "40-50"]
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (или пиковый, если /proc недоступен)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def journey(
+    world: FakeVkWorld, rng: random.Random, user_id: int, browse: int
+) -> Iterator[str]:
+    """Сообщения, которые пользователь отправляет боту по ходу сценария."""
+    country = rng.choice(world.countries)
+    city = rng.choice(world.cities[country["id"]])
+
+    yield "Привет"
+    yield "Новый поиск"
+    yield country["title"]
+    yield city["title"]
+    yield rng.choice(["Мужской", "Женский", "Любой"])
+    yield rng.choice(AGE_RANGES)
+    for _ in range(browse):
+        yield rng.choice(["Да", "Нет"])
+    yield "Отмена"
+
+
+def make_bot(
+    storage: BaseStorage,
+    transport: FakeVkTransport,
+    tokens: int,
+    rps_delay: float,
+    **kwargs: Any,
+) -> Bot:
+    config = Config(
+        vk_user_tokens=",".join(f"token{i}" for i in range(tokens)),
+        vk_group_token="group-token",
+        vk_group_id=1,
+    )
+    bot = Bot(config, storage, http=transport, **kwargs)  # type: ignore
+    for session in [*bot._sessions, bot.group_session]:
+        session.RPS_DELAY = rps_delay
+    return bot
+
+
+def drive(
+    bot: Bot, storage: BaseStorage, events: Iterable[FakeEvent]
+) -> Tuple[Dict[str, List[float]], float]:
+    """Прогоняет события через бота и замеряет время каждого по состояниям."""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    started = time.perf_counter()
+    for event in events:
+        try:
+            state = storage.get(User, event.user_id).state
+        except ItemNotFoundInStorageError:
+            state = "initial"
+
+        event_started = time.perf_counter()
+        bot.handle_event(event)  # type: ignore
+        latencies[state].append(time.perf_counter() - event_started)
+    return latencies, time.perf_counter() - started
+
+
+def build_report(
+    users: int,
+    latencies: Dict[str, List[float]],
+    elapsed: float,
+    transport: FakeVkTransport,
+    rss_before: int,
+    rss_after: int,
+    prefetch: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    events = sum(len(values) for values in latencies.values())
+    total_calls = sum(transport.calls.values())
+    return {
+        "users": users,
+        "events": events,
+        "seconds": elapsed,
+        "events_per_second": events / elapsed if elapsed else 0.0,
+        "states": {
+            state: {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+            for state, values in sorted(latencies.items())
+        },
+        "vk_calls_per_journey": total_calls / users if users else 0.0,
+        "vk_calls": dict(transport.calls.most_common()),
+        "vk_rate_limited": transport.rate_limited,
+        "prefetch": prefetch or {},
+        "rss_before_bytes": rss_before,
+        "rss_after_bytes": rss_after,
+        "rss_growth_per_user_bytes": (rss_after - rss_before) / users if users else 0,
+    }
+
+
+def make_storage(persistent: bool, tmp_dir: str) -> BaseStorage:
+    if persistent:
+        return PersistentStorage(Path(tmp_dir) / "data.pickle")
+    return MemoryStorage()
+
+
+def interleave(
+    rng: random.Random, journeys: Dict[int, Iterator[str]]
+) -> Iterator[FakeEvent]:
+    """Пользователи пишут вперемешку, как в настоящем лонгпуле."""
+    active = list(journeys)
+    while active:
+        index = rng.randrange(len(active))
+        user_id = active[index]
+        text = next(journeys[user_id], None)
+        if text is None:
+            active[index] = active[-1]
+            active.pop()
+            continue
+        yield FakeEvent(user_id, text)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    world = FakeVkWorld(seed=args.seed, search_size=args.search_size)
+    transport = FakeVkTransport(
+        world, latency=args.vk_latency, rate_limit=args.rate_limit
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = make_storage(args.persistent, tmp_dir)
+        rps_delay = 1 / args.rate_limit if args.rate_limit else 0
+        bot = make_bot(storage, transport, args.tokens, rps_delay)
+        transport.calls.clear()
+
+        journeys = {
+            user_id: journey(world, rng, user_id, args.browse)
+            for user_id in range(1, args.users + 1)
+        }
+        rss_before = rss_bytes()
+        latencies, elapsed = drive(bot, storage, interleave(rng, journeys))
+        rss_after = rss_bytes()
+        bot.ranker.shutdown(wait=True)
+        bot.prefetcher.shutdown(wait=True)
+        bot.budget.shutdown(wait=True)
+
+    return build_report(
+        args.users,
+        latencies,
+        elapsed,
+        transport,
+        rss_before,
+        rss_after,
+        bot.prefetcher.stats(),
+    )
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"{report['events']} events from {report['users']} users "
+        f"in {report['seconds']:.2f}s: {report['events_per_second']:.0f} events/s"
+    )
+    print(f"{'state':<22}{'events':>8}{'p50, ms':>10}{'p99, ms':>10}")
+    for state, stats in report["states"].items():
+        print(
+            f"{state:<22}{stats['count']:>8}"
+            f"{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+    print(f"VK calls per journey: {report['vk_calls_per_journey']:.1f}")
+    for method, count in report["vk_calls"].items():
+        print(f"  {method:<28}{count:>8}")
+    prefetch = report["prefetch"]
+    if prefetch:
+        print(
+            f"Prefetched searches: hit rate {prefetch['hit_rate']:.0%}, "
+            f"{prefetch['saved_seconds']:.2f}s of waiting saved, "
+            f"{prefetch.get('wasted', 0):.0f} wasted, "
+            f"{prefetch.get('skipped', 0):.0f} skipped for lack of free tokens"
+        )
+    if report["vk_rate_limited"]:
+        print(f"Rate limited VK calls: {report['vk_rate_limited']}")
+    print(
+        f"RSS: {report['rss_before_bytes'] / 2 ** 20:.1f} MiB -> "
+        f"{report['rss_after_bytes'] / 2 ** 20:.1f} MiB "
+        f"({report['rss_growth_per_user_bytes'] / 1024:.1f} KiB per user)"
+    )
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--browse", type=int, default=10, help="сколько анкет смотрит пользователь"
+    )
+    parser.add_argument("--tokens", type=int, default=3)
+    parser.add_argument(
+        "--search-size", type=int, default=1000, help="размер выдачи users.search"
+    )
+    parser.add_argument(
+        "--vk-latency", type=float, default=0.0, help="задержка VK API, секунды"
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=0, help="лимит запросов в секунду на токен"
+    )
+    parser.add_argument(
+        "--persistent", action="store_true", help="использовать PersistentStorage"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="куда сохранить отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
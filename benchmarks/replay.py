@@ -0,0 +1,190 @@
+"""Воспроизведение записанного трафика через бота.
+
+Читает запись, сделанную `vkinder.recording.Recorder` (RECORD_FILE), и
+прогоняет события через `Bot`. Ответы VK берутся из той же записи, а если
+подходящего ответа нет (или указан `--vk stub`) -- из `FakeVkWorld`.
+Печатает тот же отчёт, что и `benchmarks.load_test`, так что версии бота
+можно сравнивать на реальной смеси запросов.
+
+    python -m benchmarks.replay recording.jsonl.gz --speed 0
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, Optional, Sequence, Set
+
+from benchmarks.fake_vk import FakeEvent, FakeResponse, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import (
+    build_report,
+    drive,
+    make_bot,
+    make_storage,
+    print_report,
+    rss_bytes,
+)
+from vkinder.recording import read_recording, request_key
+
+
+class ReplayVkTransport(FakeVkTransport):
+    """Отвечает записанными ответами, а при их отсутствии -- из `FakeVkWorld`."""
+
+    def __init__(self, world: FakeVkWorld, use_recorded: bool = True) -> None:
+        super().__init__(world)
+        self.use_recorded = use_recorded
+        self.replayed = 0
+        self.stubbed = 0
+        self.stubbed_methods: Counter = Counter()
+        self._responses: Dict[str, Deque[Any]] = defaultdict(deque)
+
+    def add_response(self, method: str, params: Dict[str, Any], response: Any) -> None:
+        if self.use_recorded:
+            self._responses[request_key(method, params)].append(response)
+
+    def post(
+        self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> FakeResponse:
+        method = url.rsplit("/", 1)[-1]
+        key = request_key(method, data or {})
+        responses = self._responses.get(key)
+        if not responses:
+            self.stubbed += 1
+            self.stubbed_methods[method] += 1
+            return super().post(url, data, **kwargs)
+
+        response = responses.popleft()
+        if not responses:
+            del self._responses[key]
+        with self._lock:
+            self.calls[method] += 1
+            self.replayed += 1
+        return FakeResponse({"response": response})
+
+
+def replay_events(
+    records: Iterator[Dict[str, Any]],
+    transport: ReplayVkTransport,
+    speed: float,
+    users: Set[int],
+) -> Iterator[FakeEvent]:
+    """События из записи.
+
+    Ответы VK записываются после события, во время обработки которого они
+    были получены, поэтому перед тем как отдать событие, дочитываем запись
+    до следующего события. Так в памяти держатся ответы только на одно
+    событие, и запись любой длины читается потоково.
+    """
+    pending: Optional[Dict[str, Any]] = None
+    replay_started = time.monotonic()
+    # время в записи отсчитывается от запуска бота, а не от первого события
+    offset: Optional[float] = None
+
+    def emit(record: Dict[str, Any]) -> FakeEvent:
+        nonlocal offset
+        if speed > 0:
+            if offset is None:
+                offset = record["t"]
+            delay = (record["t"] - offset) / speed
+            delay -= time.monotonic() - replay_started
+            if delay > 0:
+                time.sleep(delay)
+        users.add(record["user_id"])
+        return FakeEvent(record["user_id"], record["text"])
+
+    for record in records:
+        if record["kind"] == "vk":
+            transport.add_response(
+                record["method"], record["params"], record["response"]
+            )
+        elif record["kind"] == "event":
+            if pending is not None:
+                yield emit(pending)
+            pending = record
+    if pending is not None:
+        yield emit(pending)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    world = FakeVkWorld(seed=args.seed)
+    transport = ReplayVkTransport(world, use_recorded=args.vk == "recorded")
+    users: Set[int] = set()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = make_storage(args.persistent, tmp_dir)
+        bot = make_bot(storage, transport, args.tokens, 0)
+        if args.prefetch is not None:
+            bot.prefetcher.count = args.prefetch
+        transport.calls.clear()
+
+        rss_before = rss_bytes()
+        events = replay_events(
+            read_recording(args.recording), transport, args.speed, users
+        )
+        latencies, elapsed = drive(bot, storage, events)
+        rss_after = rss_bytes()
+        bot.ranker.shutdown(wait=True)
+        bot.prefetcher.shutdown(wait=True)
+        bot.budget.shutdown(wait=True)
+
+    report = build_report(
+        len(users),
+        latencies,
+        elapsed,
+        transport,
+        rss_before,
+        rss_after,
+        bot.prefetcher.stats(),
+    )
+    report["vk_replayed"] = transport.replayed
+    report["vk_stubbed"] = transport.stubbed
+    report["vk_stubbed_methods"] = dict(transport.stubbed_methods)
+    return report
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("recording", type=Path)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="множитель скорости: 1 -- как в записи, 0 -- как можно быстрее",
+    )
+    parser.add_argument(
+        "--vk",
+        choices=["recorded", "stub"],
+        default="recorded",
+        help="откуда брать ответы VK",
+    )
+    parser.add_argument("--tokens", type=int, default=3)
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        help="сколько поисков запрашивать заранее (по умолчанию -- из настроек)",
+    )
+    parser.add_argument(
+        "--persistent", action="store_true", help="использовать PersistentStorage"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="куда сохранить отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    print(
+        f"VK responses: {report['vk_replayed']} replayed, "
+        f"{report['vk_stubbed']} stubbed"
+    )
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
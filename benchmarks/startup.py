@@ -0,0 +1,188 @@
+"""Время запуска бота: импорт модулей и время до обработки первого события.
+
+Каждый замер делается в отдельном процессе, чтобы модули не были уже
+импортированы. Для времени до первого события бот собирается так же, как в
+`vkinder.main`, с базой из `--users` пользователей (по `--matches` анкет
+у каждого) и фейковым VK API с задержкой `--vk-latency`.
+
+    python -m benchmarks.startup --users 1000 --matches 200
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+MODULES = [
+    "vkinder.models",
+    "vkinder.storage.memory_storage",
+    "vkinder.bot",
+    "vkinder.main",
+]
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def run_child(args: List[str]) -> str:
+    return subprocess.run(
+        [sys.executable, *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def import_time(module: str, repeat: int) -> float:
+    script = IMPORT_SCRIPT.format(module=module)
+    return statistics.median(float(run_child(["-c", script])) for _ in range(repeat))
+
+
+def make_database(data_file: Path, users: int, matches: int) -> None:
+    from vkinder.models import Match, Search, User
+    from vkinder.storage.memory_storage import PersistentStorage
+
+    storage = PersistentStorage(data_file)
+    for user_id in range(1, users + 1):
+        search_id = uuid.uuid4()
+        storage.save(
+            User(
+                vk_id=user_id,
+                state="list_matches",
+                first_name=f"Имя{user_id}",
+                last_name=f"Фамилия{user_id}",
+                current_search=search_id,
+                current_search_item=0,
+            )
+        )
+        found = [
+            Match(
+                uuid=uuid.uuid4(),
+                search_id=search_id,
+                vk_id=user_id * 10_000 + rank,
+                first_name="",
+                last_name="",
+                rank=rank,
+                photos="",
+            )
+            for rank in range(matches)
+        ]
+        storage.save(
+            Search(
+                uuid=search_id,
+                user_id=user_id,
+                datetime="2020-01-01T00:00:00",
+                country_id=1,
+                city_id=1001,
+                sex=1,
+                age_from=20,
+                age_to=25,
+                order=tuple(match.id for match in found),
+            )
+        )
+        for match in found:
+            storage.save(match)
+    storage.persist()
+
+
+def first_event(data_file: Path, vk_latency: float) -> Dict[str, float]:
+    """Запускается в отдельном процессе: собирает бота и отдаёт ему событие."""
+    started = time.perf_counter()
+    from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+    from vkinder.config import Config
+    from vkinder.main import create_bot
+
+    imported = time.perf_counter()
+    config = Config(
+        vk_user_tokens="token0,token1,token2",
+        vk_group_token="group-token",
+        vk_group_id=1,
+        metrics_log_interval=0,
+    )
+    transport = FakeVkTransport(FakeVkWorld(), latency=vk_latency)
+    bot = create_bot(config, data_file, http=transport)  # type: ignore[arg-type]
+    ready = time.perf_counter()
+    bot.handle_event(FakeEvent(1, "Да"))  # type: ignore[arg-type]
+    handled = time.perf_counter()
+    return {
+        "import_s": imported - started,
+        "bot_ready_s": ready - started,
+        "first_event_s": handled - started,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "import_s": {module: import_time(module, args.repeat) for module in MODULES}
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file = Path(tmp_dir) / "data.pickle"
+        make_database(data_file, args.users, args.matches)
+        report["database_bytes"] = data_file.stat().st_size
+
+        runs = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            output = run_child(
+                [
+                    "-m",
+                    "benchmarks.startup",
+                    "--child",
+                    str(data_file),
+                    "--vk-latency",
+                    str(args.vk_latency),
+                ]
+            )
+            result = json.loads(output.splitlines()[-1])
+            result["process_s"] = time.perf_counter() - started
+            runs.append(result)
+    report["first_event_s"] = {
+        key: statistics.median(run[key] for run in runs) for key in runs[0]
+    }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("Import time (median):")
+    for module, seconds in report["import_s"].items():
+        print(f"  {module:<34}{seconds * 1000:>8.1f} ms")
+    print(
+        f"Time to first event, database {report['database_bytes'] / 2 ** 20:.1f} MiB:"
+    )
+    for key, seconds in report["first_event_s"].items():
+        print(f"  {key:<34}{seconds * 1000:>8.1f} ms")
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument(
+        "--vk-latency", type=float, default=0.05, help="задержка VK API, секунды"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", type=Path, help="куда сохранить отчёт в JSON")
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(first_event(args.child, args.vk_latency)))
+        return
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,396 @@
+"""Микробенчмарк хранилищ на синтетических данных vkinder.
+
+Для каждого хранилища и каждого размера базы (`--users` пользователей, по
+`--searches` поисков у каждого и до `--matches` анкет в поиске) заполняет
+базу и гоняет те же обращения к хранилищу, что делают состояния бота.
+Печатает число операций в секунду, время `persist` и чтения базы, размер
+файла и память процесса. Каждый замер идёт в отдельном процессе, чтобы
+память одного хранилища не путалась с памятью другого.
+
+    python -m benchmarks.storage --users 1000 5000 --json storage.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from benchmarks.load_test import rss_bytes
+from vkinder.models import Match, Search, Seen, User
+from vkinder.seen import SeenFilter
+from vkinder.storage.base import BaseStorage, StorageItem
+from vkinder.storage.memory_storage import MemoryStorage, PersistentStorage
+from vkinder.storage.traced import TracedStorage
+from vkinder.tracing import Tracer
+
+BACKENDS = ["memory", "persistent", "traced"]
+
+
+def make_storage(backend: str, tmp_dir: str) -> BaseStorage:
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "persistent":
+        return PersistentStorage(Path(tmp_dir) / "data.pickle")
+    if backend == "traced":
+        # так хранилище оборачивает бот; трассировка выключена, как обычно
+        return TracedStorage(MemoryStorage(), Tracer())
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def make_dataset(
+    users: int, searches: int, matches: int, seed: int = 0
+) -> Iterator[StorageItem]:
+    """Пользователи с историей поисков, как после долгой работы бота.
+
+    В поиске от десятой части `matches` до `matches` анкет, у анкет есть
+    фотографии; анкеты до текущей просмотрены, и примерно треть из них
+    понравилась. Последний поиск пользователя -- текущий.
+    """
+    rng = random.Random(seed)
+    for user_id in range(1, users + 1):
+        seen = SeenFilter()
+        search_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(searches)]
+        current_item = 0
+        for day, search_id in enumerate(search_ids, start=1):
+            size = rng.randint(max(1, matches // 10), max(1, matches))
+            current_item = rng.randrange(size)
+            found = []
+            for rank in range(size):
+                vk_id = rng.randrange(1, 500_000_000)
+                viewed = rank < current_item
+                if viewed:
+                    seen.add(vk_id)
+                found.append(
+                    Match(
+                        uuid=uuid.UUID(int=rng.getrandbits(128)),
+                        search_id=search_id,
+                        vk_id=vk_id,
+                        first_name=f"Имя{vk_id % 1000}",
+                        last_name=f"Фамилия{vk_id % 1000}",
+                        seen=viewed,
+                        liked=viewed and rng.random() < 0.3,
+                        rank=rank,
+                        photos=",".join(
+                            f"photo{vk_id}_{rng.randrange(10_000_000)}"
+                            for _ in range(3)
+                        ),
+                    )
+                )
+            age_from = rng.randrange(16, 40)
+            yield Search(
+                uuid=search_id,
+                user_id=user_id,
+                datetime=f"2020-01-{day % 28 + 1:02d}T12:00:00",
+                country_id=1,
+                city_id=1001,
+                sex=rng.choice([1, 2]),
+                age_from=age_from,
+                age_to=age_from + 5,
+                order=tuple(match.id for match in found),
+            )
+            yield from found
+        yield Seen(user_id=user_id, slices=seen.slices, count=seen.count)
+        yield User(
+            vk_id=user_id,
+            state="list_matches",
+            first_name=f"Имя{user_id}",
+            last_name=f"Фамилия{user_id}",
+            country_id=1,
+            city_id=1001,
+            sex=1,
+            age_from=20,
+            age_to=25,
+            current_search=search_ids[-1] if search_ids else None,
+            current_search_item=current_item,
+        )
+
+
+def ops_per_second(op: Callable[[], Any], duration: float) -> Tuple[float, float]:
+    """Время первого вызова `op` и сколько раз в секунду она выполняется
+    потом. Первый вызов замеряется отдельно: в нём, например, строятся
+    индексы `MemoryStorage`."""
+    started = time.perf_counter()
+    op()
+    first = time.perf_counter() - started
+
+    count = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while True:
+        op()
+        count += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            return first, count / (now - started)
+
+
+def access_patterns(
+    storage: BaseStorage, users: int, matches: int, rng: random.Random
+) -> Dict[str, Callable[[], Any]]:
+    """Обращения к хранилищу из состояний бота, на случайных пользователях."""
+
+    def user() -> User:
+        return storage.get(User, rng.randint(1, users))
+
+    def get_user() -> None:
+        user()
+
+    def update_user() -> None:
+        # смена состояния после каждого события (Bot._handle_message)
+        def set_state(user: User) -> None:
+            user.state = "list_matches"
+
+        storage.update(User, rng.randint(1, users), set_state)
+
+    def current_match() -> None:
+        # ListMatchesState.current_match
+        search = storage.get(Search, user().current_search)
+        assert search.order is not None
+        storage.get(Match, rng.choice(search.order))
+
+    def mark_match() -> None:
+        # ListMatchesState.leave
+        search = user().current_search
+        match = storage.query(Match).filter(search_id=search).first()
+        assert match is not None
+
+        def mark(match: Match) -> None:
+            match.seen = True
+            match.liked = not match.liked
+
+        storage.update(Match, match.id, mark)
+
+    def history_page() -> None:
+        # SearchHistoryState: последние поиски, по 5 на страницу
+        query = storage.query(Search).filter(user_id=rng.randint(1, users))
+        list(query.reversed().limit(6))
+
+    def liked_page() -> None:
+        # LikedMatchesState: понравившиеся анкеты поиска, по 10 на страницу
+        search = user().current_search
+        list(storage.query(Match).filter(search_id=search, liked=True).limit(11))
+
+    def update_seen() -> None:
+        # SeenProfiles.add
+        def change(seen: Seen) -> None:
+            seen.count += 1
+
+        storage.update(Seen, rng.randint(1, users), change)
+
+    def create_search() -> None:
+        # SelectAgeState.leave: новый поиск со всеми анкетами выдачи
+        search_id = uuid.uuid4()
+        found = [
+            Match(
+                uuid=uuid.uuid4(),
+                search_id=search_id,
+                vk_id=rank + 1,
+                first_name="",
+                last_name="",
+                rank=rank,
+            )
+            for rank in range(matches)
+        ]
+        storage.save(
+            Search(
+                uuid=search_id,
+                user_id=rng.randint(1, users),
+                datetime="2020-02-01T12:00:00",
+                country_id=1,
+                city_id=1001,
+                sex=1,
+                age_from=20,
+                age_to=25,
+                order=tuple(match.id for match in found),
+            )
+        )
+        for match in found:
+            storage.save(match)
+
+    def storage_stats() -> None:
+        # команда /storage и эндпоинт метрик
+        storage.stats()
+
+    def find_users() -> None:
+        # полный перебор, как в запросах без индекса
+        storage.find(User, lambda user: user.state == "hello_again")
+
+    return {
+        "get_user": get_user,
+        "update_user": update_user,
+        "current_match": current_match,
+        "mark_match": mark_match,
+        "history_page": history_page,
+        "liked_page": liked_page,
+        "update_seen": update_seen,
+        "create_search": create_search,
+        "storage_stats": storage_stats,
+        "find_users": find_users,
+    }
+
+
+def measure(
+    backend: str,
+    users: int,
+    searches: int,
+    matches: int,
+    duration: float,
+    repeat: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Замер одного хранилища на базе одного размера."""
+    rng = random.Random(seed)
+    rss_before = rss_bytes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = make_storage(backend, tmp_dir)
+
+        started = time.perf_counter()
+        counts: Dict[str, int] = {}
+        for item in make_dataset(users, searches, matches, seed):
+            storage.save(item)
+            counts[item.type] = counts.get(item.type, 0) + 1
+        fill_s = time.perf_counter() - started
+        rss_after = rss_bytes()
+
+        persist_runs: List[float] = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            storage.persist()
+            persist_runs.append(time.perf_counter() - started)
+
+        file_bytes: Optional[int] = None
+        load_s: Optional[float] = None
+        if isinstance(storage, PersistentStorage):
+            file_bytes = storage.file.stat().st_size
+            started = time.perf_counter()
+            PersistentStorage(storage.file)
+            load_s = time.perf_counter() - started
+
+        first_call_s: Dict[str, float] = {}
+        ops: Dict[str, float] = {}
+        for name, op in access_patterns(storage, users, matches, rng).items():
+            first_call_s[name], ops[name] = ops_per_second(op, duration)
+
+    return {
+        "backend": backend,
+        "users": users,
+        "items": counts,
+        "fill_s": fill_s,
+        "ops_per_second": ops,
+        "first_call_s": first_call_s,
+        "persist_s": statistics.median(persist_runs),
+        "load_s": load_s,
+        "file_bytes": file_bytes,
+        "rss_bytes": rss_after,
+        "rss_growth_bytes": rss_after - rss_before,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    runs = []
+    for users in args.users:
+        for backend in args.backends:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.storage",
+                    "--child",
+                    backend,
+                    "--users",
+                    str(users),
+                    "--searches",
+                    str(args.searches),
+                    "--matches",
+                    str(args.matches),
+                    "--duration",
+                    str(args.duration),
+                    "--repeat",
+                    str(args.repeat),
+                    "--seed",
+                    str(args.seed),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        "searches_per_user": args.searches,
+        "max_matches_per_search": args.matches,
+        "runs": runs,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for run in report["runs"]:
+        items = ", ".join(f"{count} {type}" for type, count in run["items"].items())
+        print(f"{run['backend']}, {run['users']} users ({items}):")
+        print(f"  {'fill':<16}{run['fill_s']:>10.2f} s")
+        print(f"  {'persist':<16}{run['persist_s'] * 1000:>10.1f} ms")
+        if run["load_s"] is not None:
+            print(f"  {'load':<16}{run['load_s'] * 1000:>10.1f} ms")
+        if run["file_bytes"] is not None:
+            print(f"  {'file':<16}{run['file_bytes'] / 2 ** 20:>10.1f} MiB")
+        print(
+            f"  {'RSS':<16}{run['rss_bytes'] / 2 ** 20:>10.1f} MiB "
+            f"(+{run['rss_growth_bytes'] / 2 ** 20:.1f} MiB for data)"
+        )
+        for name, ops in run["ops_per_second"].items():
+            first = run["first_call_s"][name] * 1000
+            print(f"  {name:<16}{ops:>10.0f} ops/s, first call {first:.1f} ms")
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--users", type=int, nargs="+", default=[1000], help="размеры базы"
+    )
+    parser.add_argument(
+        "--searches", type=int, default=1, help="сколько поисков у пользователя"
+    )
+    parser.add_argument(
+        "--matches", type=int, default=1000, help="сколько анкет в поиске, не больше"
+    )
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="сколько секунд гонять операцию"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="сколько раз замерять persist"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="куда сохранить отчёт в JSON")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.child:
+        result = measure(
+            args.child,
+            args.users[0],
+            args.searches,
+            args.matches,
+            args.duration,
+            args.repeat,
+            args.seed,
+        )
+        print(json.dumps(result))
+        return
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""Хвостовые задержки VK API с `VkClient` и без него.
+
+Отправляет одни и те же запросы в фейковый VK API, который иногда
+"зависает", сначала напрямую через сессии по кругу (как делал бот раньше),
+потом через `VkClient` с дедлайнами, повторами и дублированием запросов.
+
+    python -m benchmarks.vk_client --requests 500 --stall-probability 0.01
+"""
+
+import argparse
+import sys
+import time
+from itertools import cycle
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.fake_vk import FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import percentile
+from vkinder.metrics import Metrics
+from vkinder.session import VkSession
+from vkinder.tracing import Tracer
+from vkinder.vk_client import VkClient
+
+
+def measure(call: Callable[[int], object], requests: int) -> List[float]:
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    world = FakeVkWorld(seed=args.seed)
+    transport = FakeVkTransport(
+        world,
+        latency=args.latency,
+        stall_probability=args.stall_probability,
+        stall=args.stall,
+    )
+    metrics = Metrics()
+    tracer = Tracer()
+    sessions = [
+        VkSession(f"token{i}", metrics, tracer, f"user{i}", transport)  # type: ignore
+        for i in range(args.tokens)
+    ]
+    for session in sessions:
+        session.RPS_DELAY = 0
+
+    def values(i: int) -> Dict[str, object]:
+        return {"user_ids": i + 1}
+
+    bare = cycle(sessions)
+    results = {
+        "bare": summary(
+            measure(lambda i: next(bare).method("users.get", values(i)), args.requests)
+        )
+    }
+
+    client = VkClient(
+        sessions, metrics, tracer, default_deadline=args.deadline, retries=2
+    )
+    # прогрев: клиенту нужна статистика задержек, чтобы оценить p95
+    measure(lambda i: client.method("users.get", values(i)), 50)
+    results["client"] = summary(
+        measure(lambda i: client.method("users.get", values(i)), args.requests)
+    )
+    client.shutdown()
+    return results
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--stall-probability", type=float, default=0.01)
+    parser.add_argument("--stall", type=float, default=1.0)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    results = run(parse_args(argv))
+    print(f"{'':<8}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}{'max, ms':>10}")
+    for name, stats in results.items():
+        print(
+            f"{name:<8}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+            f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
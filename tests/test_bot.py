@@ -0,0 +1,41 @@
+import random
+from typing import Any, Dict, List
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import journey, make_bot
+from vkinder.models import User
+from vkinder.storage.memory_storage import MemoryStorage
+from vkinder.vk_client import DeadlineExceededError
+
+
+def test_keeps_handling_events_when_vk_times_out() -> None:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+    sent: List[Dict[str, Any]] = []
+    transport._handlers["messages.send"] = sent.append
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=2, rps_delay=0)
+    # без поиска заранее, чтобы users.search делался при выборе возраста
+    bot.prefetcher.prefetch = lambda *args: None  # type: ignore[assignment]
+
+    messages = list(journey(world, random.Random(1), 1, browse=0))
+    for text in messages[:5]:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+    assert storage.get(User, 1).state == "select_age"
+
+    def timeout(*args: Any, **kwargs: Any) -> Any:
+        raise DeadlineExceededError()
+
+    method = bot.vk.method
+    bot.vk.method = timeout  # type: ignore[assignment]
+    sent.clear()
+    bot.handle_event(FakeEvent(1, messages[5]))  # type: ignore[arg-type]
+
+    assert "попробуйте ещё раз позже" in sent[-1]["message"]
+    assert storage.get(User, 1).state == "select_age"
+
+    # VK ожил -- тот же ответ доходит до результатов поиска
+    bot.vk.method = method  # type: ignore[assignment]
+    bot.handle_event(FakeEvent(1, messages[5]))  # type: ignore[arg-type]
+    assert storage.get(User, 1).state == "list_matches"
+    bot.ranker.shutdown(wait=True)
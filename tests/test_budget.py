@@ -0,0 +1,139 @@
+import time
+import uuid
+from typing import Any, Dict, List
+
+import pytest
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.bot import Bot
+from vkinder.budget import LatencyBudget
+from vkinder.metrics import Metrics
+from vkinder.models import Match, Search, User
+from vkinder.storage.memory_storage import MemoryStorage
+from vkinder.tracing import Tracer
+
+
+def make(photos_latency: float, sent: List[Dict[str, Any]]) -> Bot:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+
+    def photos_get(values: Dict[str, Any]) -> Dict[str, Any]:
+        time.sleep(photos_latency)
+        return world.photos_get(values)
+
+    transport._handlers["photos.get"] = photos_get
+    transport._handlers["messages.send"] = sent.append
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=2, rps_delay=0)
+    bot.budget.budgets = {"list_matches": 0.1}
+    bot.budget.overload_threshold = 2
+
+    search_id = uuid.uuid4()
+    # фотографий у анкет нет, как будто оценка ещё не дошла до них
+    matches = [
+        Match(
+            uuid=uuid.uuid4(),
+            search_id=search_id,
+            vk_id=1000 + rank,
+            first_name="Имя",
+            last_name="Фамилия",
+            rank=rank,
+        )
+        for rank in range(5)
+    ]
+    storage.save(
+        Search(
+            uuid=search_id,
+            user_id=1,
+            datetime="2020-01-01T00:00:00",
+            country_id=1,
+            city_id=1001,
+            sex=1,
+            age_from=20,
+            age_to=25,
+            order=tuple(match.id for match in matches),
+        )
+    )
+    for match in matches:
+        storage.save(match)
+    storage.save(
+        User(
+            vk_id=1,
+            state="list_matches",
+            current_search=search_id,
+            current_search_item=0,
+        )
+    )
+    return bot
+
+
+def degraded(bot: Bot) -> Dict[str, float]:
+    counter = bot.metrics.counter("vkinder_degraded_total", "", ["state", "path"])
+    return {values[1]: child.value for values, child in counter.children()}
+
+
+def test_sends_photos_after_the_match_when_vk_is_slow() -> None:
+    sent: List[Dict[str, Any]] = []
+    bot = make(photos_latency=0.3, sent=sent)
+
+    started = time.perf_counter()
+    bot.handle_event(FakeEvent(1, "Да"))  # type: ignore[arg-type]
+    elapsed = time.perf_counter() - started
+    bot.budget.shutdown(wait=True)
+
+    assert elapsed < 0.3
+    match, question, late = sent
+    assert "attachment" not in match
+    assert "keyboard" in question
+    assert late["message"] == match["message"]
+    assert late["attachment"].startswith("photo1001_")
+    assert degraded(bot) == {"deferred": 1}
+
+
+def test_skips_photos_under_sustained_overload() -> None:
+    sent: List[Dict[str, Any]] = []
+    bot = make(photos_latency=0.3, sent=sent)
+
+    for _ in range(3):
+        bot.handle_event(FakeEvent(1, "Нет"))  # type: ignore[arg-type]
+    bot.budget.shutdown(wait=True)
+
+    stats = degraded(bot)
+    assert stats["deferred"] == 2
+    assert stats["skipped"] == 1
+    # пока фотографии шли, пользователь уже листал дальше
+    assert stats["dropped"] == 2
+    assert not any("attachment" in message for message in sent)
+
+
+def test_waits_for_photos_within_budget() -> None:
+    sent: List[Dict[str, Any]] = []
+    bot = make(photos_latency=0, sent=sent)
+
+    bot.handle_event(FakeEvent(1, "Да"))  # type: ignore[arg-type]
+
+    assert sent[0]["attachment"].startswith("photo1001_")
+    assert len(sent) == 2
+    assert degraded(bot) == {}
+
+
+def test_failed_probe_does_not_stop_lookups() -> None:
+    budget = LatencyBudget(
+        Metrics(),
+        Tracer(),
+        {"list_matches": 0.05},
+        overload_threshold=1,
+        overload_cooldown=0,
+    )
+
+    def private_profile() -> str:
+        raise ValueError("access denied")
+
+    assert budget.within("list_matches", lambda: time.sleep(0.2))[0] is None
+    # пробный вызов после перегрузки падает сам, а не по времени
+    with pytest.raises(ValueError):
+        budget.within("list_matches", private_profile)
+
+    assert budget.within("list_matches", lambda: "photo1_1") == ("photo1_1", None)
+    budget.shutdown(wait=True)
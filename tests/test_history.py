@@ -0,0 +1,72 @@
+from typing import List
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.bot import Bot
+from vkinder.models import Match, User
+from vkinder.state.history import MATCHES_PAGE, SEARCHES_PAGE
+from vkinder.storage.memory_storage import MemoryStorage
+
+
+def send(bot: Bot, *texts: str) -> None:
+    for text in texts:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+
+
+def test_browses_searches_and_liked_matches() -> None:
+    world = FakeVkWorld()
+    storage = MemoryStorage()
+    transport = FakeVkTransport(world)
+    messages: List[str] = []
+    transport._handlers["messages.send"] = lambda values: messages.append(
+        values["message"]
+    )
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+
+    def last_lines() -> List[str]:
+        return messages[-1].splitlines()[1:]
+
+    country = world.countries[0]
+    city = world.cities[country["id"]][0]
+
+    send(bot, "Привет")
+    ages = ["20-25", "25-30", "30-35", "35-40", "40-50", "16-20", "42"]
+    for age in ages:
+        send(bot, "Новый поиск", country["title"], city["title"], "Любой", age)
+        if age == "16-20":
+            send(bot, *["Да", "Нет"] * (MATCHES_PAGE + 1))
+        send(bot, "Отмена")
+    bot.ranker.shutdown(wait=True)
+
+    send(bot, "История поисков")
+    assert storage.get(User, 1).state == "search_history"
+    first_page = last_lines()
+    assert len(first_page) == SEARCHES_PAGE
+    # сначала последние поиски
+    assert first_page[0].endswith("42-42 лет")
+    assert first_page[1].endswith("16-20 лет")
+
+    send(bot, "Ещё")
+    second_page = last_lines()
+    assert len(second_page) == len(ages) - SEARCHES_PAGE
+    assert second_page[-1].endswith("20-25 лет")
+
+    send(bot, "Назад", "История поисков", "2")
+    assert storage.get(User, 1).state == "liked_matches"
+    liked = storage.query(Match).filter(
+        search_id=storage.get(User, 1).history_search, liked=True
+    )
+    assert liked.count() == MATCHES_PAGE + 1
+    first_liked = last_lines()
+    assert len(first_liked) == MATCHES_PAGE
+
+    send(bot, "Ещё")
+    second_liked = last_lines()
+    assert len(second_liked) == 1
+    assert set(first_liked + second_liked) == {
+        f"{match.first_name} {match.last_name}: https://vk.com/id{match.vk_id}"
+        for match in liked
+    }
+
+    send(bot, "Отмена")
+    assert storage.get(User, 1).state == "hello_again"
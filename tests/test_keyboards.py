@@ -0,0 +1,44 @@
+import json
+from typing import Any
+
+import pytest
+from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+
+from vkinder.state import states
+from vkinder.state._render import Layout, render_keyboard
+
+
+def expected(layout: Layout) -> Any:
+    """Клавиатура, собранная через `VkKeyboard` кнопка за кнопкой."""
+    keyboard = VkKeyboard(one_time=True)
+    for i, row in enumerate(layout):
+        if i:
+            keyboard.add_line()
+        for label, color in row:
+            keyboard.add_button(label, color=color)
+    return json.loads(keyboard.get_keyboard())
+
+
+@pytest.mark.parametrize("key", sorted(states))
+def test_state_keyboards_match_vk_api(key: str) -> None:
+    state = states[key]
+    if state.keyboard is None:
+        assert state.keyboard_json is None
+        return
+
+    assert state.keyboard_json is not None
+    assert json.loads(state.keyboard_json) == expected(state.keyboard)
+
+
+def test_dynamic_keyboard_matches_vk_api() -> None:
+    layout: Layout = (
+        (("Москва", VkKeyboardColor.PRIMARY), ("Омск", VkKeyboardColor.PRIMARY)),
+        (("Назад", VkKeyboardColor.SECONDARY),),
+    )
+
+    rendered = json.loads(render_keyboard(layout))
+
+    assert rendered == expected(layout)
+    assert rendered["one_time"] is True
+    assert [len(row) for row in rendered["buttons"]] == [2, 1]
+    assert rendered["buttons"][0][0]["color"] == "primary"
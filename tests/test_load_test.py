@@ -0,0 +1,18 @@
+from benchmarks.load_test import parse_args, run
+
+
+def test_runs_full_journeys_offline() -> None:
+    args = parse_args(["--users", "5", "--browse", "3", "--search-size", "20"])
+
+    report = run(args)
+
+    # 6 шагов до результатов, 3 оценки и отмена
+    assert report["events"] == 5 * 10
+    assert report["states"]["list_matches"]["count"] == 5 * 4
+    # каждый поиск либо запрошен заранее, либо запрошен при выборе возраста
+    prefetch = report["prefetch"]
+    assert prefetch["hit"] + prefetch["miss"] == 5
+    assert report["vk_calls"]["users.search"] == (
+        prefetch["miss"] + prefetch.get("fetched", 0) + prefetch.get("failed", 0)
+    )
+    assert report["vk_rate_limited"] == 0
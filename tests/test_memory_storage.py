@@ -1,13 +1,18 @@
+import threading
+from pathlib import Path
+from typing import List, Type
 from uuid import UUID, uuid4
 
 import pytest
 
+from vkinder.storage import memory_storage
 from vkinder.storage.base import (
     ItemAlreadyExistsInStorageError,
     ItemNotFoundInStorageError,
+    ItemVersionConflictError,
     StorageItem,
 )
-from vkinder.storage.memory_storage import MemoryStorage
+from vkinder.storage.memory_storage import MemoryStorage, PersistentStorage
 
 
 class Apple(StorageItem):
@@ -22,6 +27,28 @@ class Apple(StorageItem):
         return self.uuid
 
 
+class Pear(Apple):
+    type = "pear"
+    indexes = (("color",),)
+
+
+class Tree(StorageItem):
+    type = "tree"
+
+    uuid: UUID
+
+    @property
+    def id(self) -> UUID:
+        return self.uuid
+
+
+class Fruit(Apple):
+    type = "fruit"
+    references = (("tree_id", "tree"),)
+
+    tree_id: UUID
+
+
 @pytest.fixture()
 def storage() -> MemoryStorage:
     return MemoryStorage()
@@ -103,3 +130,276 @@ class TestFind:
         # without duplicates
         assert len(set(apple.uuid for apple in red_apples)) == 2
         assert all(apple.color == "red" for apple in red_apples)
+
+
+@pytest.mark.parametrize("type", [Apple, Pear])
+class TestQuery:
+    def fill(self, storage: MemoryStorage, type: Type[Apple]) -> List[Apple]:
+        items = [
+            type(uuid=uuid4(), color=color, weight=weight)
+            for color, weight in [
+                ("red", 0.3),
+                ("green", 0.1),
+                ("red", 0.1),
+                ("red", 0.2),
+            ]
+        ]
+        for item in items:
+            storage.save(item)
+        return items
+
+    def test_filters_in_insertion_order(
+        self, storage: MemoryStorage, type: Type[Apple]
+    ) -> None:
+        items = self.fill(storage, type)
+
+        red = list(storage.query(type).filter(color="red"))
+
+        assert [item.id for item in red] == [items[0].id, items[2].id, items[3].id]
+
+    def test_offset_limit_and_count(
+        self, storage: MemoryStorage, type: Type[Apple]
+    ) -> None:
+        items = self.fill(storage, type)
+        red = storage.query(type).filter(color="red")
+
+        assert red.count() == 3
+        assert red.offset(1).count() == 2
+        assert red.offset(1).limit(1).count() == 1
+        assert red.offset(2).first().id == items[3].id  # type: ignore[union-attr]
+        assert red.offset(3).first() is None
+        assert storage.query(type).filter(color="red", weight=0.1).count() == 1
+
+    def test_offset_and_limit_in_any_order(
+        self, storage: MemoryStorage, type: Type[Apple]
+    ) -> None:
+        items = [type(uuid=uuid4(), color="red", weight=i) for i in range(10)]
+        for item in items:
+            storage.save(item)
+        expected = [item.id for item in items[2:7]]
+
+        for query in [
+            storage.query(type).filter(color="red"),
+            storage.query(type).filter(color="red").order_by("weight"),
+            storage.query(type),
+        ]:
+            for page in [query.offset(2).limit(5), query.limit(5).offset(2)]:
+                assert [item.id for item in page] == expected
+                assert page.count() == 5
+        # так же, как `LIMIT 10 OFFSET 5` в SQL
+        red = storage.query(type).filter(color="red")
+        assert red.limit(10).offset(5).count() == red.offset(5).limit(10).count() == 5
+        assert red.limit(3).offset(5).count() == red.offset(5).limit(3).count() == 3
+
+    def test_order_by(self, storage: MemoryStorage, type: Type[Apple]) -> None:
+        self.fill(storage, type)
+
+        weights = [
+            apple.weight
+            for apple in storage.query(type).filter(color="red").order_by("-weight")
+        ]
+
+        assert weights == [0.3, 0.2, 0.1]
+
+    def test_sees_changes_after_save(
+        self, storage: MemoryStorage, type: Type[Apple]
+    ) -> None:
+        items = self.fill(storage, type)
+        assert storage.query(type).filter(color="green").count() == 1
+
+        items[0].color = "green"
+        storage.save(items[0])
+
+        assert storage.query(type).filter(color="green").count() == 2
+        assert storage.query(type).filter(color="red").count() == 2
+
+    def test_pages_with_cursor(self, storage: MemoryStorage, type: Type[Apple]) -> None:
+        items = self.fill(storage, type)
+        red = storage.query(type).filter(color="red")
+
+        assert [item.id for item in red.after(items[0].id)] == [
+            items[2].id,
+            items[3].id,
+        ]
+        assert [item.id for item in red.after(items[0].id).limit(1)] == [items[2].id]
+        assert red.after(items[0].id).count() == 2
+        assert red.after(items[3].id).first() is None
+        # объекта нет в выдаче
+        assert red.after(items[1].id).count() == 0
+
+    def test_reversed(self, storage: MemoryStorage, type: Type[Apple]) -> None:
+        items = self.fill(storage, type)
+        red = storage.query(type).filter(color="red").reversed()
+
+        assert [item.id for item in red] == [items[3].id, items[2].id, items[0].id]
+        assert [item.id for item in red.after(items[3].id).limit(1)] == [items[2].id]
+        assert red.offset(1).count() == 2
+        weights = [apple.weight for apple in red.order_by("weight")]
+        assert weights == [0.3, 0.2, 0.1]
+
+    def test_cursor_survives_changes(
+        self, storage: MemoryStorage, type: Type[Apple]
+    ) -> None:
+        items = self.fill(storage, type)
+        red = storage.query(type).filter(color="red")
+        list(red)
+
+        items[0].color = "green"
+        storage.save(items[0])
+        storage.save(type(uuid=uuid4(), color="red", weight=0.5))
+
+        assert [item.weight for item in red.after(items[2].id)] == [0.2, 0.5]
+
+
+class TestVersions:
+    def test_get_returns_a_copy(self, storage: MemoryStorage) -> None:
+        item = Apple(uuid=uuid4(), color="red", weight=0.2)
+        storage.save(item)
+
+        storage.get(Apple, item.id).color = "green"
+
+        assert storage.get(Apple, item.id).color == "red"
+
+    def test_rejects_stale_save(self, storage: MemoryStorage) -> None:
+        storage.save(Apple(uuid=uuid4(), color="red", weight=0.2))
+        item_id = next(iter(storage._data[Apple.type]))
+        first = storage.get(Apple, item_id)
+        second = storage.get(Apple, item_id)
+
+        first.color = "green"
+        storage.save(first)
+        second.weight = 0.3
+        with pytest.raises(ItemVersionConflictError):
+            storage.save(second)
+
+        stored = storage.get(Apple, item_id)
+        assert (stored.color, stored.weight, stored.version) == ("green", 0.2, 2)
+
+    def test_update_retries_on_conflict(self, storage: MemoryStorage) -> None:
+        item = Apple(uuid=uuid4(), color="red", weight=0.2)
+        storage.save(item)
+        calls = 0
+
+        def change(apple: Apple) -> None:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                # кто-то успел изменить объект между чтением и записью
+                storage.update(Apple, item.id, lambda other: None)
+            apple.color = "green"
+
+        updated = storage.update(Apple, item.id, change)
+
+        assert calls == 2
+        assert updated.version == storage.get(Apple, item.id).version == 3
+
+    def test_concurrent_updates_are_not_lost(self, storage: MemoryStorage) -> None:
+        item = Apple(uuid=uuid4(), color="red", weight=0)
+        storage.save(item)
+
+        def increment(apple: Apple) -> None:
+            apple.weight += 1
+
+        def worker() -> None:
+            for _ in range(100):
+                storage.update(Apple, item.id, increment, attempts=1000)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert storage.get(Apple, item.id).weight == 400
+
+    def test_update_many(self, storage: MemoryStorage) -> None:
+        items = [Pear(uuid=uuid4(), color="red", weight=i) for i in range(3)]
+        for item in items:
+            storage.save(item)
+        assert storage.query(Pear).filter(color="red").count() == 3
+
+        def change(pear: Pear) -> None:
+            pear.color = "green"
+
+        storage.update_many(Pear, {item.id: change for item in items[:2]})
+
+        stored = [storage.get(Pear, item.id) for item in items]
+        assert [(pear.color, pear.version) for pear in stored] == [
+            ("green", 2),
+            ("green", 2),
+            ("red", 1),
+        ]
+        assert storage.query(Pear).filter(color="red").count() == 1
+        with pytest.raises(ItemNotFoundInStorageError):
+            storage.update_many(Pear, {uuid4(): change})
+
+    def test_persists_snapshot(self, tmp_path: Path) -> None:
+        storage = PersistentStorage(tmp_path / "data.pickle")
+        item = Apple(uuid=uuid4(), color="red", weight=0.2)
+        storage.save(item)
+        storage.persist()
+        item.color = "green"
+        storage.save(item)
+
+        loaded = PersistentStorage(tmp_path / "data.pickle").get(Apple, item.id)
+
+        assert (loaded.color, loaded.version) == ("red", 1)
+
+
+class TestStats:
+    def test_counts_rows_and_references(self, storage: MemoryStorage) -> None:
+        apple_tree, pear_tree, cut_tree = uuid4(), uuid4(), uuid4()
+        storage.save(Tree(uuid=apple_tree))
+        storage.save(Tree(uuid=pear_tree))
+        fruits = {apple_tree: 3, pear_tree: 1, cut_tree: 2}
+        for tree_id, count in fruits.items():
+            for _ in range(count):
+                storage.save(Fruit(uuid=uuid4(), color="", weight=0, tree_id=tree_id))
+
+        stats = storage.stats(top=2)
+
+        assert stats.tables["tree"].rows == 2
+        assert stats.tables["fruit"].rows == 6
+        assert stats.tables["fruit"].bytes > stats.tables["tree"].bytes > 0
+        fruit = stats.references["fruit.tree_id"]
+        assert fruit.largest == [(apple_tree, 3), (cut_tree, 2)]
+        assert fruit.orphaned == 2
+        assert (stats.persist_seconds, stats.snapshot_bytes) == (None, None)
+
+        storage.save(Tree(uuid=cut_tree))
+        assert storage.stats().references["fruit.tree_id"].orphaned == 0
+        # ради статистики индексы не строятся
+        assert not storage._indexes.get("fruit")
+
+    def test_samples_references_without_index(
+        self, storage: MemoryStorage, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(memory_storage, "REFERENCE_SAMPLE", 4)
+        tree = uuid4()
+        for _ in range(6):
+            storage.save(Fruit(uuid=uuid4(), color="", weight=0, tree_id=tree))
+
+        fruit = storage.stats().references["fruit.tree_id"]
+
+        assert fruit.sampled
+        assert fruit.largest == [(tree, 4)]
+
+        # по уже построенному индексу считается всё
+        storage._index(Fruit, ("tree_id",))
+        fruit = storage.stats().references["fruit.tree_id"]
+        assert not fruit.sampled
+        assert fruit.largest == [(tree, 6)]
+
+    def test_reports_last_persist(self, tmp_path: Path) -> None:
+        file = tmp_path / "data.pickle"
+        storage = PersistentStorage(file)
+        storage.save(Apple(uuid=uuid4(), color="red", weight=0.2))
+        storage.persist()
+
+        stats = storage.stats()
+
+        assert stats.persist_seconds is not None
+        assert stats.snapshot_bytes == file.stat().st_size
+        # после чтения с диска размер объектов оценивается по выборке
+        loaded = PersistentStorage(file).stats()
+        assert loaded.tables["apple"] == stats.tables["apple"]
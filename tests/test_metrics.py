@@ -0,0 +1,69 @@
+from urllib.request import urlopen
+
+import pytest
+
+from vkinder.metrics import Metrics, MetricsServer
+
+
+@pytest.fixture()
+def metrics() -> Metrics:
+    return Metrics()
+
+
+class TestHistogram:
+    def test_renders_cumulative_buckets(self, metrics: Metrics) -> None:
+        histogram = metrics.histogram("test_seconds", "test", ["state"], [0.1, 1.0])
+        histogram.labels(state="hello").observe(0.05)
+        histogram.labels(state="hello").observe(0.5)
+        histogram.labels(state="hello").observe(5)
+
+        rendered = metrics.render()
+
+        assert 'test_seconds_bucket{state="hello",le="0.1"} 1' in rendered
+        assert 'test_seconds_bucket{state="hello",le="1.0"} 2' in rendered
+        assert 'test_seconds_bucket{state="hello",le="+Inf"} 3' in rendered
+        assert 'test_seconds_count{state="hello"} 3' in rendered
+
+    def test_estimates_quantiles(self, metrics: Metrics) -> None:
+        histogram = metrics.histogram("test_seconds", "test", [], [0.1, 1.0])
+        for _ in range(99):
+            histogram.labels().observe(0.01)
+        histogram.labels().observe(0.5)
+
+        assert histogram.labels().quantile(0.5) == 0.1
+        assert histogram.labels().quantile(1.0) == 1.0
+
+    def test_raises_on_wrong_labels(self, metrics: Metrics) -> None:
+        with pytest.raises(ValueError):
+            metrics.state_latency.labels(state="hello")
+
+
+class TestCounter:
+    def test_escapes_label_values(self, metrics: Metrics) -> None:
+        metrics.vk_errors.labels(method='a"b', token="user0").inc()
+
+        assert 'method="a\\"b"' in metrics.render()
+
+
+class TestMetricsServer:
+    def test_serves_metrics(self, metrics: Metrics) -> None:
+        metrics.vk_errors.labels(method="users.get", token="user0").inc(2)
+        server = MetricsServer(metrics, port=0).start()
+        try:
+            with urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                body = response.read().decode("utf-8")
+        finally:
+            server.stop()
+
+        assert 'vkinder_vk_errors_total{method="users.get",token="user0"} 2.0' in body
+
+
+class TestGauge:
+    def test_collects_before_rendering(self, metrics: Metrics) -> None:
+        gauge = metrics.gauge("test_rows", "test", ["type"])
+        rows = {"apple": 1}
+        metrics.on_collect(lambda: gauge.labels(type="apple").set(rows["apple"]))
+
+        assert 'test_rows{type="apple"} 1' in metrics.render()
+        rows["apple"] = 5
+        assert 'test_rows{type="apple"} 5' in metrics.render()
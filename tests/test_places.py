@@ -0,0 +1,130 @@
+import json
+from typing import Any, Dict, List
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.models import User
+from vkinder.places import Place, TrigramIndex, edit_distance
+from vkinder.storage.memory_storage import MemoryStorage
+
+
+def make_index(*titles: str) -> TrigramIndex:
+    index = TrigramIndex()
+    index.update(Place(id, title) for id, title in enumerate(titles, start=1))
+    return index
+
+
+def buttons(message: Dict[str, Any]) -> List[str]:
+    return [
+        button["action"]["label"]
+        for row in json.loads(message["keyboard"])["buttons"]
+        for button in row
+    ]
+
+
+def test_edit_distance() -> None:
+    assert edit_distance("москва", "москва", 2) == 0
+    assert edit_distance("масква", "москва", 2) == 1
+    assert edit_distance("мсокв", "москва", 2) == 3
+    assert edit_distance("a", "abcdef", 2) == 3
+
+
+def test_resolves_exact_titles_and_typos() -> None:
+    index = make_index("Москва", "Санкт-Петербург", "Мосальск", "Орёл", "Омск")
+
+    assert index.resolve("москва").exact == Place(1, "Москва")
+    assert index.resolve("  санкт петербург ").exact == Place(2, "Санкт-Петербург")
+    assert index.resolve("орел").exact == Place(4, "Орёл")
+
+    typo = index.resolve("Масква")
+    assert typo.exact is None
+    assert typo.suggestions[0] == Place(1, "Москва")
+    assert index.resolve("петербург").suggestions == []
+    assert index.resolve("санкт-питербур").suggestions == [Place(2, "Санкт-Петербург")]
+    # начало названия
+    assert index.resolve("моск").suggestions[0] == Place(1, "Москва")
+    assert index.resolve("Владивосток").suggestions == []
+
+
+def test_updates_incrementally() -> None:
+    index = make_index("Москва", "Омск")
+
+    index.update([Place(1, "Москва"), Place(3, "Тверь")], keep=[2])
+    assert len(index) == 3
+    index.update([Place(1, "Moscow"), Place(3, "Тверь")])
+
+    assert len(index) == 2
+    assert index.resolve("омск").exact is None
+    assert index.resolve("москва").exact is None
+    assert index.resolve("moscow").exact == Place(1, "Moscow")
+
+
+def test_suggests_cities_without_asking_vk() -> None:
+    world = FakeVkWorld()
+    world.cities[1][0]["title"] = "Екатеринбург"
+    world.cities[1][1]["title"] = "Новосибирск"
+    transport = FakeVkTransport(world)
+    sent: List[Dict[str, Any]] = []
+    transport._handlers["messages.send"] = sent.append
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+
+    for text in ["Привет", "Новый поиск", "Росия", "Россия"]:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+    assert storage.get(User, 1).country_id == 1
+    calls = transport.calls.copy()
+
+    bot.handle_event(FakeEvent(1, "екатеренбург"))  # type: ignore[arg-type]
+    assert storage.get(User, 1).state == "select_city_error"
+    assert buttons(sent[-1])[0] == "Екатеринбург"
+
+    bot.handle_event(FakeEvent(1, "Екатеринбург"))  # type: ignore[arg-type]
+    assert storage.get(User, 1).city_id == world.cities[1][0]["id"]
+    # ни одного поиска города через VK
+    lookups = transport.calls - calls
+    assert lookups["database.getCities"] == 0
+
+
+def test_offers_countries_without_asking_vk() -> None:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+    sent: List[Dict[str, Any]] = []
+    transport._handlers["messages.send"] = sent.append
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+    bot.places.countries()
+    calls = transport.calls.copy()
+
+    for text in ["Привет", "Новый поиск"]:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+    # популярные страны, а не первые по алфавиту из полного списка
+    assert buttons(sent[-1]) == ["Россия", "Украина", "Беларусь", "Казахстан", "Отмена"]
+
+    for text in ["Россия", "Назад"]:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+    assert storage.get(User, 1).state == "select_country"
+    # сохранённая страна первой и без повтора среди остальных
+    assert buttons(sent[-1])[0] == "Россия"
+    assert buttons(sent[-1]).count("Россия") == 1
+
+    lookups = transport.calls - calls
+    assert lookups["database.getCountries"] == 0
+    assert lookups["database.getCountriesById"] == 0
+
+
+def test_offers_saved_city_without_asking_vk() -> None:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+    sent: List[Dict[str, Any]] = []
+    transport._handlers["messages.send"] = sent.append
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+
+    for text in ["Привет", "Новый поиск", "Россия", "Город 7"]:
+        bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+    calls = transport.calls.copy()
+
+    bot.handle_event(FakeEvent(1, "Назад"))  # type: ignore[arg-type]
+    assert storage.get(User, 1).state == "select_city"
+    assert buttons(sent[-1])[0] == "Город 7"
+    assert (transport.calls - calls)["database.getCitiesById"] == 0
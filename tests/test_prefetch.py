@@ -0,0 +1,70 @@
+import time
+from typing import Any, Dict
+
+from benchmarks.fake_vk import FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.bot import Bot
+from vkinder.storage.memory_storage import MemoryStorage
+
+PARAMS = {"country": 1, "city": 1001, "sex": 0, "count": 20}
+CHOICES = [
+    {"age_from": 16, "age_to": 20},
+    {"age_from": 20, "age_to": 25},
+    {"age_from": 25, "age_to": 30},
+]
+
+
+def make(tokens: int, latency: float = 0.0) -> Bot:
+    transport = FakeVkTransport(FakeVkWorld(), latency=latency)
+    return make_bot(MemoryStorage(), transport, tokens=tokens, rps_delay=0)
+
+
+def values(choice: Dict[str, Any]) -> Dict[str, Any]:
+    return {**PARAMS, **choice}
+
+
+def test_prefetched_search_saves_waiting() -> None:
+    bot = make(tokens=3, latency=0.05)
+    prefetcher = bot.prefetcher
+
+    prefetcher.prefetch(1, PARAMS, CHOICES)
+    time.sleep(0.2)
+    response = prefetcher.take(1, values(CHOICES[0]), CHOICES[0])
+    prefetcher.shutdown(wait=True)
+
+    assert response == bot.vk.method("users.search", values(CHOICES[0]))
+    stats = prefetcher.stats()
+    assert stats["hit"] == 1
+    assert stats["hit_rate"] == 1
+    assert stats["saved_seconds"] >= 0.04
+    # второй по популярности поиск тоже успел прийти, но не пригодился
+    assert stats["fetched"] == 2
+    assert stats["wasted"] == 1
+
+
+def test_prefers_popular_choices() -> None:
+    bot = make(tokens=3)
+    prefetcher = bot.prefetcher
+    for _ in range(2):
+        prefetcher.take(1, values(CHOICES[2]), CHOICES[2])
+
+    prefetcher.prefetch(2, PARAMS, CHOICES)
+    response = prefetcher.take(2, values(CHOICES[2]), CHOICES[2])
+
+    assert response is not None
+    assert prefetcher.stats()["hit"] == 1
+
+
+def test_leaves_the_last_free_token_alone() -> None:
+    bot = make(tokens=1)
+    prefetcher = bot.prefetcher
+
+    prefetcher.prefetch(1, PARAMS, CHOICES)
+    response = prefetcher.take(1, values(CHOICES[0]), CHOICES[0])
+    prefetcher.shutdown(wait=True)
+
+    assert response is None
+    stats = prefetcher.stats()
+    # второй поиск мог отмениться, не начавшись
+    assert stats["skipped"] >= 1
+    assert "fetched" not in stats
@@ -0,0 +1,199 @@
+import uuid
+from typing import Any, Dict, List
+
+from benchmarks.fake_vk import FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.models import Match, Search, User
+from vkinder.ranking import score_photos
+from vkinder.state.list_matches import ListMatchesState
+from vkinder.storage.memory_storage import MemoryStorage
+
+
+def make_search(storage: MemoryStorage, size: int) -> List[Match]:
+    search_id = uuid.uuid4()
+    matches = [
+        Match(
+            uuid=uuid.uuid4(),
+            search_id=search_id,
+            vk_id=vk_id,
+            first_name="",
+            last_name="",
+            rank=rank,
+        )
+        for rank, vk_id in enumerate(range(1000, 1000 + size))
+    ]
+    storage.save(
+        Search(
+            uuid=search_id,
+            user_id=1,
+            datetime="2020-01-01T00:00:00",
+            country_id=1,
+            city_id=1001,
+            sex=1,
+            age_from=20,
+            age_to=25,
+            order=tuple(match.id for match in matches),
+        )
+    )
+    for match in matches:
+        storage.save(match)
+    return matches
+
+
+def test_score_photos_takes_three_most_liked() -> None:
+    photos = {"ids": [1, 2, 3, 4], "likes": [5, 50, 0, 10]}
+
+    score, attachment = score_photos(42, photos)
+
+    assert score == 65
+    assert attachment == "photo42_2,photo42_4,photo42_1"
+    assert score_photos(42, None) == (0, "")
+
+
+def test_ranks_top_slice_now_and_the_rest_in_background() -> None:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=2, rps_delay=0)
+    bot.ranker.top_slice = 30
+
+    storage.save(User(vk_id=1, state="list_matches", current_search=None))
+    matches = make_search(storage, 100)
+    search_id = matches[0].search_id
+
+    bot.ranker.rank(1, matches)
+    bot.ranker.shutdown(wait=True)
+
+    def score(match: Match) -> int:
+        photos = world.execute({"owner_ids": match.vk_id})[0]
+        return score_photos(match.vk_id, photos)[0]
+
+    ranked = sorted(matches, key=lambda match: match.rank)
+    assert [match.rank for match in ranked] == list(range(100))
+    top, rest = ranked[:30], ranked[30:]
+    assert {match.vk_id for match in top} == set(range(1000, 1030))
+    assert [score(match) for match in top] == sorted(map(score, top), reverse=True)
+    assert [score(match) for match in rest] == sorted(map(score, rest), reverse=True)
+    stored = list(storage.query(Match).filter(search_id=search_id))
+    assert all(match.photos for match in stored)
+    # 100 анкет -- это 2 пачки сразу и 3 в фоне
+    assert transport.calls["execute"] == 5
+    assert transport.calls["photos.get"] == 0
+
+    best = storage.query(Match).filter(search_id=search_id, rank=0).first()
+    assert best is not None
+    assert best.id == ranked[0].id
+    assert best.photos == ranked[0].photos
+
+
+def test_browsing_never_sees_a_half_done_reorder() -> None:
+    storage = MemoryStorage()
+    bot = make_bot(storage, FakeVkTransport(FakeVkWorld()), tokens=2, rps_delay=0)
+    bot.ranker.top_slice = 10
+    matches = make_search(storage, 60)
+    storage.save(
+        User(
+            vk_id=1,
+            state="list_matches",
+            current_search=matches[0].search_id,
+            current_search_item=0,
+        )
+    )
+
+    def browse() -> List[uuid.UUID]:
+        user = storage.get(User, 1)
+        shown = []
+        for item in range(len(matches)):
+            user.current_search_item = item
+            shown.append(ListMatchesState.current_match(bot, user)[1].id)
+        return shown
+
+    views = []
+    set_field = bot.ranker._set
+
+    def set_and_browse(fields: Dict[uuid.UUID, Dict[str, Any]]) -> None:
+        set_field(fields)
+        views.append(browse())
+
+    bot.ranker._set = set_and_browse  # type: ignore[assignment]
+    bot.ranker.rank(1, matches)
+    bot.ranker.shutdown(wait=True)
+
+    assert views
+    everyone = {match.id for match in matches}
+    for shown in views:
+        assert len(shown) == len(everyone)
+        assert set(shown) == everyone
+
+
+def test_ranks_when_execute_answers_for_fewer_matches() -> None:
+    world = FakeVkWorld()
+    transport = FakeVkTransport(world)
+    # ответ обрезан: на последние анкеты пачки ничего нет
+    transport._handlers["execute"] = lambda values: world.execute(values)[:-5]
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+    storage.save(User(vk_id=1, state="list_matches", current_search=None))
+    matches = make_search(storage, 20)
+
+    bot.ranker.rank(1, matches)
+    bot.ranker.shutdown(wait=True)
+
+    search = storage.get(Search, matches[0].search_id)
+    assert search.order is not None
+    assert set(search.order) == {match.id for match in matches}
+    # у анкет без ответа фотографии запросятся при просмотре
+    assert all(storage.get(Match, match.id).photos is None for match in matches[-5:])
+    assert all(storage.get(Match, match.id).photos for match in matches[:-5])
+
+
+def test_keeps_vk_order_when_execute_answer_is_malformed() -> None:
+    transport = FakeVkTransport(FakeVkWorld())
+    transport._handlers["execute"] = lambda values: [{"ids": [1]}]
+    storage = MemoryStorage()
+    bot = make_bot(storage, transport, tokens=1, rps_delay=0)
+    storage.save(User(vk_id=1, state="list_matches", current_search=None))
+    matches = make_search(storage, 5)
+
+    bot.ranker.rank(1, matches)
+    bot.ranker.shutdown(wait=True)
+
+    search = storage.get(Search, matches[0].search_id)
+    assert search.order == tuple(match.id for match in matches)
+
+
+def test_saves_scores_in_one_pass_per_batch() -> None:
+    storage = MemoryStorage()
+    bot = make_bot(storage, FakeVkTransport(FakeVkWorld()), tokens=2, rps_delay=0)
+    bot.ranker.top_slice = 25
+    bot.ranker.background_limit = 50
+    storage.save(User(vk_id=1, state="list_matches", current_search=None))
+    matches = make_search(storage, 200)
+
+    writes: List[int] = []
+    update_many = storage.update_many
+
+    def count_writes(type: Any, changes: Dict[Any, Any]) -> None:
+        writes.append(len(changes))
+        update_many(type, changes)
+
+    saved: List[str] = []
+    save = storage.save
+
+    def count_saves(item: Any, overwrite: bool = True) -> None:
+        saved.append(item.type)
+        save(item, overwrite)
+
+    storage.update_many = count_writes  # type: ignore[assignment]
+    storage.save = count_saves  # type: ignore[assignment]
+    bot.ranker.rank(1, matches)
+    bot.ranker.shutdown(wait=True)
+
+    # анкеты по одной не сохраняются: по записи на пачку из execute
+    # и на каждую перестановку
+    assert Match.type not in saved
+    assert len(writes) <= 3 + 2
+    assert sum(writes) <= 2 * 75
+    # дальше фоновой оценки анкеты не трогаются
+    assert all(storage.get(Match, match.id).photos for match in matches[:75])
+    assert all(storage.get(Match, match.id).photos is None for match in matches[75:])
@@ -0,0 +1,102 @@
+import gzip
+import random
+from pathlib import Path
+
+from benchmarks.fake_vk import FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import drive, interleave, journey, make_bot
+from benchmarks.replay import parse_args, run
+from vkinder.recording import Recorder, read_recording
+from vkinder.storage.memory_storage import MemoryStorage
+
+
+def record(file: Path, users: int) -> None:
+    world = FakeVkWorld(search_size=20)
+    recorder = Recorder(file, secret="secret")
+    storage = MemoryStorage()
+    bot = make_bot(storage, FakeVkTransport(world), 2, 0, recorder=recorder)
+    # поиски заранее зависят от того, свободны ли токены, и делают запись
+    # и воспроизведение недетерминированными
+    bot.prefetcher.count = 0
+    rng = random.Random(0)
+    journeys = {
+        user_id: journey(world, rng, user_id, 3) for user_id in range(1, users + 1)
+    }
+    drive(bot, storage, interleave(rng, journeys))
+    recorder.close()
+
+
+class TestRecorder:
+    def test_anonymizes_users(self, tmp_path: Path) -> None:
+        file = tmp_path / "recording.jsonl.gz"
+        record(file, users=2)
+
+        records = list(read_recording(file))
+        events = [r for r in records if r["kind"] == "event"]
+        assert len(events) == 2 * 10
+        assert {event["user_id"] for event in events}.isdisjoint({1, 2})
+
+        content = gzip.decompress(file.read_bytes()).decode("utf-8")
+        assert "access_token" not in content
+        assert "token0" not in content
+        assert '"Имя1"' not in content
+
+    def test_scrubs_contacts_from_messages(self, tmp_path: Path) -> None:
+        file = tmp_path / "recording.jsonl.gz"
+        recorder = Recorder(file, secret="secret")
+        for text in [
+            "Россия",
+            "20-25",
+            "пиши +7 (912) 345-67-89 или ivan@mail.ru",
+            "моя страница https://vk.com/id1 и vk.com/durov",
+            "привет! " * 10,
+        ]:
+            recorder.record_event(1, text)
+        recorder.close()
+
+        texts = [r["text"] for r in read_recording(file) if r["kind"] == "event"]
+
+        assert texts == [
+            "Россия",
+            "20-25",
+            "пиши <number> или <email>",
+            "моя страница <url> и <url>",
+            "<text>",
+        ]
+
+    def test_uses_stable_pseudonyms(self, tmp_path: Path) -> None:
+        first = Recorder(tmp_path / "first.jsonl.gz", secret="secret")
+        second = Recorder(tmp_path / "second.jsonl.gz", secret="secret")
+
+        assert first.pseudonym(42) == second.pseudonym(42)
+        assert first.pseudonym(42) != first.pseudonym(43)
+
+    def test_reads_truncated_recording(self, tmp_path: Path) -> None:
+        file = tmp_path / "recording.jsonl.gz"
+        record(file, users=2)
+        file.write_bytes(file.read_bytes()[:-20])
+
+        assert list(read_recording(file))
+
+
+class TestReplay:
+    def test_replays_recorded_responses(self, tmp_path: Path) -> None:
+        file = tmp_path / "recording.jsonl.gz"
+        record(file, users=3)
+
+        report = run(parse_args([str(file), "--prefetch", "0"]))
+
+        assert report["users"] == 3
+        assert report["events"] == 3 * 10
+        assert report["states"]["list_matches"]["count"] == 3 * 4
+        # без записи отвечаем только на запрос лонгпул-сервера при запуске
+        assert report["vk_stubbed_methods"] == {"messages.getLongPollServer": 1}
+        assert report["vk_replayed"] > 0
+
+    def test_replays_with_stubbed_vk(self, tmp_path: Path) -> None:
+        file = tmp_path / "recording.jsonl.gz"
+        record(file, users=3)
+
+        report = run(parse_args([str(file), "--vk", "stub"]))
+
+        assert report["events"] == 3 * 10
+        assert report["vk_replayed"] == 0
@@ -0,0 +1,78 @@
+import random
+from pathlib import Path
+from typing import List
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.metrics import Metrics
+from vkinder.models import Match, User
+from vkinder.seen import SeenFilter, SeenProfiles
+from vkinder.storage.memory_storage import MemoryStorage, PersistentStorage
+
+
+def test_filter_remembers_added_ids() -> None:
+    bloom = SeenFilter(capacity=10_000, error_rate=0.01)
+    added = random.Random(1).sample(range(1_000_000_000), 5000)
+
+    for vk_id in added:
+        bloom.add(vk_id)
+
+    assert all(vk_id in bloom for vk_id in added)
+    others = range(1_000_000_000 + 1, 1_000_000_000 + 20_001)
+    false_positives = sum(vk_id in bloom for vk_id in others)
+    assert false_positives / len(others) < 0.01
+    # память растёт вместе с числом анкет, а не выделяется сразу под capacity:
+    # ~2 байта на анкету плюс незаполненная часть последнего слоя
+    assert sum(map(len, bloom.slices)) < 5000 * 3
+
+
+def test_filter_forgets_oldest_ids_beyond_capacity() -> None:
+    bloom = SeenFilter(capacity=1000, error_rate=0.01)
+
+    for vk_id in range(10_000):
+        bloom.add(vk_id)
+
+    assert all(vk_id in bloom for vk_id in range(9500, 10_000))
+    assert sum(vk_id in bloom for vk_id in range(1000)) < 50
+    assert sum(map(len, bloom.slices)) < 1000 * 2 * 2
+
+
+def test_profiles_are_persisted(tmp_path: Path) -> None:
+    storage = PersistentStorage(tmp_path / "data.pickle")
+    seen = SeenProfiles(storage, Metrics())
+
+    for vk_id in range(100):
+        seen.add(1, vk_id)
+    storage.persist()
+
+    loaded = SeenProfiles(PersistentStorage(tmp_path / "data.pickle"), Metrics())
+    people = [{"id": vk_id} for vk_id in range(50, 150)]
+    assert [person["id"] for person in loaded.unseen(1, people)] == list(
+        range(100, 150)
+    )
+    assert list(loaded.unseen(2, people)) == people
+
+
+def test_new_search_skips_rated_profiles() -> None:
+    world = FakeVkWorld()
+    storage = MemoryStorage()
+    bot = make_bot(storage, FakeVkTransport(world), tokens=1, rps_delay=0)
+    country = world.countries[0]
+    city = world.cities[country["id"]][0]
+
+    def search(rated: int) -> List[Match]:
+        texts = ["Новый поиск", country["title"], city["title"], "Любой", "20-25"]
+        for text in texts + ["Да"] * rated:
+            bot.handle_event(FakeEvent(1, text))  # type: ignore[arg-type]
+        search_id = storage.get(User, 1).current_search
+        return list(storage.query(Match).filter(search_id=search_id))
+
+    bot.handle_event(FakeEvent(1, "Привет"))  # type: ignore[arg-type]
+    first = search(rated=5)
+    bot.handle_event(FakeEvent(1, "Отмена"))  # type: ignore[arg-type]
+    second = search(rated=0)
+    bot.ranker.shutdown(wait=True)
+
+    rated = {match.vk_id for match in first if match.seen}
+    assert len(rated) == 5
+    assert {match.vk_id for match in second} == {match.vk_id for match in first} - rated
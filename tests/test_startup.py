@@ -0,0 +1,123 @@
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Optional
+from uuid import UUID, uuid4
+
+import pytest
+
+from vkinder.state import StateName, StateRegistry, states
+from vkinder.storage.base import StorageItem
+from vkinder.storage.memory_storage import PersistentStorage
+
+# в отдельном процессе, чтобы модули состояний не были уже импортированы
+LAZY_STATE_SCRIPT = """
+import sys
+from vkinder.state import states
+
+before = sorted(m for m in sys.modules if m.startswith("vkinder.state."))
+state = states["select_sex"]
+after = sorted(m for m in sys.modules if m.startswith("vkinder.state."))
+print(before)
+print(after)
+print(state.__name__, state.keyboard_json is not None)
+print(sorted(states._loaded))
+"""
+
+
+class TestStateRegistry:
+    def test_loads_only_requested_state(self) -> None:
+        output = subprocess.run(
+            [sys.executable, "-c", LAZY_STATE_SCRIPT],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()
+
+        before, after, state, loaded = output
+        assert before == "[]"
+        assert after == str(
+            ["vkinder.state._base", "vkinder.state._render", "vkinder.state.select_sex"]
+        )
+        assert state == "SelectSexState True"
+        assert loaded == "['select_sex']"
+
+    def test_imports_module_on_first_access(self) -> None:
+        registry = StateRegistry(
+            {StateName.SELECT_AGE: "vkinder.state.select_age:SelectAgeState"}
+        )
+        assert not registry._loaded
+
+        state = registry["select_age"]
+
+        assert registry._loaded == {"select_age": state}
+        assert state.keyboard_json is not None
+        assert registry["select_age"] is state
+
+    def test_raises_on_unknown_state(self) -> None:
+        with pytest.raises(KeyError):
+            states["no_such_state"]
+        assert "no_such_state" not in states
+
+
+class Apple(StorageItem):
+    type = "apple"
+
+    uuid: UUID
+    color: str
+
+    @property
+    def id(self) -> UUID:
+        return self.uuid
+
+
+class SlowStorage(PersistentStorage):
+    """Читает файл, только когда тест разрешит."""
+
+    def __init__(self, file: Path, error: Optional[Exception] = None) -> None:
+        self.may_load = threading.Event()
+        self.error = error
+        super().__init__(file, background=True)
+
+    def _load(self) -> None:
+        self.may_load.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        super()._load()
+
+
+class TestBackgroundLoad:
+    def test_waits_for_load(self, tmp_path: Path) -> None:
+        file = tmp_path / "data.pickle"
+        item = Apple(uuid=uuid4(), color="red")
+        storage = PersistentStorage(file)
+        storage.save(item)
+        storage.persist()
+
+        loading = SlowStorage(file)
+        found = []
+        reader = threading.Thread(
+            target=lambda: found.append(loading.get(Apple, item.id))
+        )
+        reader.start()
+        reader.join(timeout=0.1)
+        assert reader.is_alive()
+
+        loading.may_load.set()
+        reader.join(timeout=5)
+        assert found[0].color == "red"
+        loading.save(Apple(uuid=uuid4(), color="green"))
+        assert len(loading.find(Apple, lambda apple: True)) == 2
+
+    def test_reraises_load_error(self, tmp_path: Path) -> None:
+        loading = SlowStorage(tmp_path / "data.pickle", OSError("disk is gone"))
+        loading.may_load.set()
+
+        with pytest.raises(OSError, match="disk is gone"):
+            loading.get(Apple, uuid4())
+        # и не затирает файл пустыми данными
+        with pytest.raises(OSError, match="disk is gone"):
+            loading.save(Apple(uuid=uuid4(), color="red"))
+        with pytest.raises(OSError, match="disk is gone"):
+            loading.persist()
@@ -0,0 +1,36 @@
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.storage import BACKENDS, make_dataset, measure
+
+
+def test_dataset_is_consistent() -> None:
+    items = list(make_dataset(users=3, searches=2, matches=50))
+
+    by_type: Dict[str, List[Any]] = {}
+    for item in items:
+        by_type.setdefault(item.type, []).append(item)
+    assert len(by_type["user"]) == 3
+    assert len(by_type["seen"]) == 3
+    assert len(by_type["search"]) == 6
+    search_ids = {search.uuid for search in by_type["search"]}
+    assert {match.search_id for match in by_type["match"]} == search_ids
+    sizes = Counter(match.search_id for match in by_type["match"])
+    assert all(5 <= size <= 50 for size in sizes.values())
+    assert {user.current_search for user in by_type["user"]} <= search_ids
+
+
+def test_measures_every_backend() -> None:
+    for backend in BACKENDS:
+        result = measure(
+            backend, users=5, searches=2, matches=20, duration=0.01, repeat=1
+        )
+
+        assert result["items"]["user"] == 5
+        assert all(ops > 0 for ops in result["ops_per_second"].values())
+        assert set(result["first_call_s"]) == set(result["ops_per_second"])
+        if backend == "persistent":
+            assert result["file_bytes"] > 0
+            assert result["load_s"] is not None
+        else:
+            assert result["file_bytes"] is None
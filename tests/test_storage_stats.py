@@ -0,0 +1,26 @@
+from typing import Any, Dict, List
+
+from benchmarks.fake_vk import FakeEvent, FakeVkTransport, FakeVkWorld
+from benchmarks.load_test import make_bot
+from vkinder.storage.memory_storage import MemoryStorage
+
+
+def test_storage_command_is_for_admins_only() -> None:
+    transport = FakeVkTransport(FakeVkWorld())
+    sent: List[Dict[str, Any]] = []
+    transport._handlers["messages.send"] = sent.append
+    bot = make_bot(MemoryStorage(), transport, tokens=1, rps_delay=0)
+    bot.admin_ids = {1}
+
+    bot.handle_event(FakeEvent(2, "Привет"))  # type: ignore[arg-type]
+    sent.clear()
+    bot.handle_event(FakeEvent(2, "/storage"))  # type: ignore[arg-type]
+    assert not any("Хранилище" in message["message"] for message in sent)
+
+    bot.handle_event(FakeEvent(1, "/storage"))  # type: ignore[arg-type]
+    report = next(m["message"] for m in sent if m["user_id"] == 1)
+    assert report.startswith("Хранилище:")
+    assert "user: 2 шт." in report
+
+    rendered = bot.metrics.render()
+    assert 'vkinder_storage_rows{type="user"} 2' in rendered
@@ -0,0 +1,77 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from vkinder.tracing import Tracer
+
+
+class TestTracer:
+    def test_builds_span_tree(self) -> None:
+        tracer = Tracer(enabled=True, slow_threshold=float("inf"))
+
+        with tracer.event("event", user_id=1) as root:
+            with tracer.span("state.leave", state="hello"):
+                with tracer.span("vk", method="users.get"):
+                    pass
+            with tracer.span("state.enter", state="select_country"):
+                pass
+
+        assert root is not None
+        assert [span.name for span in root.children] == ["state.leave", "state.enter"]
+        assert root.children[0].children[0].attrs == {"method": "users.get"}
+
+    def test_does_nothing_if_disabled(self) -> None:
+        tracer = Tracer(enabled=False)
+
+        with tracer.event("event") as root:
+            with tracer.span("vk") as span:
+                pass
+
+        assert root is None
+        assert span is None
+
+    def test_dumps_slow_event_to_log(self, caplog: pytest.LogCaptureFixture) -> None:
+        tracer = Tracer(enabled=True, slow_threshold=0)
+
+        with caplog.at_level(logging.WARNING):
+            with tracer.event("event", user_id=1):
+                for _ in range(3):
+                    with tracer.span("storage.save", type="match"):
+                        pass
+
+        assert "Slow event" in caplog.text
+        assert "storage.save x3" in caplog.text
+
+    def test_dumps_profile_to_dir(self, tmp_path: Path) -> None:
+        tracer = Tracer(enabled=True, slow_threshold=0, profile=True, dump_dir=tmp_path)
+
+        with tracer.event("event"):
+            pass
+
+        assert len(list(tmp_path.glob("*.txt"))) == 1
+        assert len(list(tmp_path.glob("*.prof"))) == 1
+
+    def test_keeps_every_dump(self, tmp_path: Path) -> None:
+        tracer = Tracer(enabled=True, slow_threshold=0, profile=True, dump_dir=tmp_path)
+
+        for name in ["first", "second"]:
+            with tracer.event(name):
+                pass
+
+        trees = sorted(path.read_text() for path in tmp_path.glob("*.txt"))
+        assert [tree.split()[0] for tree in trees] == ["first", "second"]
+        for tree in tmp_path.glob("*.txt"):
+            assert tree.with_name(tree.stem + ".prof").exists()
+
+    def test_records_errors(self) -> None:
+        tracer = Tracer(enabled=True, slow_threshold=float("inf"))
+
+        with pytest.raises(ValueError):
+            with tracer.event("event") as root:
+                with tracer.span("vk"):
+                    raise ValueError()
+
+        assert root is not None
+        assert root.error == "ValueError"
+        assert root.children[0].error == "ValueError"
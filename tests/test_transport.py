@@ -0,0 +1,39 @@
+import json
+import threading
+from typing import Iterator
+
+import pytest
+
+from benchmarks.http_transport import StandInServer
+from vkinder.metrics import Metrics
+from vkinder.transport import VkTransport
+
+
+@pytest.fixture()
+def server() -> Iterator[StandInServer]:
+    body = json.dumps({"response": {"items": [{"id": 1}] * 500}}).encode("utf-8")
+    server = StandInServer(body, keepalive=5, handshake=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_reuses_connections_and_counts_bytes(server: StandInServer) -> None:
+    metrics = Metrics()
+    transport = VkTransport(metrics, pool_size=2)
+
+    for _ in range(3):
+        response = transport.post(f"{server.url}/method/users.get", {"user_ids": 1})
+        assert len(response.json()["response"]["items"]) == 500
+    transport.close()
+
+    assert server.connections == 1
+    assert transport.requests_total.labels().value == 3
+    assert transport.connections_total.labels().value == 1
+    received = transport.bytes_total.labels(direction="received").value
+    decoded = transport.bytes_total.labels(direction="decoded").value
+    # ответ пришёл сжатым
+    assert 0 < received < decoded
+    assert "vkinder_http_connections_total 1" in metrics.render()
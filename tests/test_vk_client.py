@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+import requests
+from vk_api.exceptions import ApiError
+
+from vkinder.metrics import Metrics
+from vkinder.tracing import Tracer
+from vkinder.vk_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    VkClient,
+)
+
+
+class FakeSession:
+    def __init__(self, behavior: Callable[[int], Any]) -> None:
+        self.behavior = behavior
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def method(self, method: str, values: Optional[Dict[str, Any]] = None) -> Any:
+        with self.lock:
+            self.calls += 1
+            return self.behavior(self.calls)
+
+
+def api_error(code: int) -> ApiError:
+    return ApiError(None, "users.get", {}, False, {"error_code": code})
+
+
+def make_client(sessions: List[FakeSession], **kwargs: Any) -> VkClient:
+    kwargs.setdefault("backoff", 0)
+    return VkClient(sessions, Metrics(), Tracer(), **kwargs)  # type: ignore
+
+
+class TestRetries:
+    def test_retries_transient_errors_of_reads(self) -> None:
+        def behavior(call: int) -> Any:
+            if call < 3:
+                raise requests.ConnectionError()
+            return "ok"
+
+        session = FakeSession(behavior)
+        client = make_client([session], retries=2)
+
+        assert client.method("users.get") == "ok"
+        assert session.calls == 3
+
+    def test_does_not_retry_writes(self) -> None:
+        def behavior(call: int) -> Any:
+            raise requests.ConnectionError()
+
+        session = FakeSession(behavior)
+        client = make_client([session], retries=2)
+
+        with pytest.raises(requests.ConnectionError):
+            client.method("messages.send")
+        assert session.calls == 1
+
+    def test_does_not_retry_client_errors(self) -> None:
+        def behavior(call: int) -> Any:
+            raise api_error(100)
+
+        session = FakeSession(behavior)
+        client = make_client([session], retries=2)
+
+        with pytest.raises(ApiError):
+            client.method("users.get")
+        assert session.calls == 1
+        assert not client.breaker.is_open
+
+
+class TestDeadline:
+    def test_raises_if_vk_does_not_answer_in_time(self) -> None:
+        session = FakeSession(lambda call: time.sleep(0.5))
+        client = make_client([session], retries=0, default_deadline=0.05)
+
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            client.method("users.get")
+        assert time.monotonic() - started < 0.4
+
+
+class TestHedging:
+    def test_sends_second_request_if_first_is_slow(self) -> None:
+        def slow(call: int) -> Any:
+            # первые ответы быстрые, чтобы набрать статистику, потом -- зависание
+            if call > 25:
+                time.sleep(1)
+            return "slow"
+
+        slow_session = FakeSession(slow)
+        fast_session = FakeSession(lambda call: "fast")
+        client = make_client(
+            [slow_session, fast_session], retries=0, default_deadline=5
+        )
+        for _ in range(50):
+            client.method("users.get")
+
+        started = time.monotonic()
+        responses = {client.method("users.get") for _ in range(2)}
+        assert responses == {"fast"}
+        assert time.monotonic() - started < 0.5
+
+
+class TestCircuitBreaker:
+    def test_rejects_requests_while_open(self) -> None:
+        def behavior(call: int) -> Any:
+            raise api_error(10)
+
+        session = FakeSession(behavior)
+        client = make_client(
+            [session], retries=0, breaker_threshold=2, breaker_cooldown=60
+        )
+
+        for _ in range(2):
+            with pytest.raises(ApiError):
+                client.method("users.get")
+        with pytest.raises(CircuitOpenError):
+            client.method("users.get")
+        assert session.calls == 2
+
+    def test_closes_after_successful_probe(self) -> None:
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure()
+        assert breaker.is_open
+
+        assert breaker.allow()
+        # пока идёт пробный запрос, остальные отклоняются
+        assert not breaker.allow()
+        breaker.record_success()
+
+        assert not breaker.is_open
+        assert breaker.allow()
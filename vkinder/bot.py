@@ -1,68 +1,271 @@
 import logging
-from itertools import cycle
-from typing import NoReturn
+from typing import TYPE_CHECKING, NoReturn, Optional
 
-import vk_api
-from vk_api.longpoll import VkEventType, VkLongPoll
+import requests
+from vk_api.longpoll import Event, VkEventType, VkLongPoll
 
-from vkinder.config import Config
+from vkinder.budget import LatencyBudget
 from vkinder.helpers import write_msg
+from vkinder.metrics import Metrics
 from vkinder.models import User
+from vkinder.places import PlaceResolver
+from vkinder.prefetch import SearchPrefetcher
+from vkinder.ranking import Ranker
+from vkinder.seen import SeenProfiles
+from vkinder.session import VkSession
 from vkinder.state import StateName, states
-from vkinder.storage.base import BaseStorage, ItemNotFoundInStorageError
+from vkinder.storage.base import (
+    BaseStorage,
+    ItemAlreadyExistsInStorageError,
+    ItemNotFoundInStorageError,
+    StorageStats,
+)
+from vkinder.storage.traced import TracedStorage
+from vkinder.tracing import Tracer
+from vkinder.transport import VkTransport
+from vkinder.vk_client import VkClient, VkClientError
+
+if TYPE_CHECKING:
+    from vkinder.config import Config
+    from vkinder.recording import Recorder
 
 logger = logging.getLogger(__name__)
 
 
+def format_storage_stats(stats: StorageStats) -> str:
+    """Сводка по хранилищу для команды /storage."""
+    lines = ["Хранилище:"]
+    for type, table in sorted(stats.tables.items()):
+        lines.append(f"{type}: {table.rows} шт., ~{table.bytes / 2 ** 20:.1f} МиБ")
+    for reference, groups in sorted(stats.references.items()):
+        sampled = " (по выборке)" if groups.sampled else ""
+        lines.append(
+            f"{reference}{sampled}: без родителя {groups.orphaned}, больше всего:"
+        )
+        lines.extend(f"  {id}: {size}" for id, size in groups.largest)
+    if stats.persist_seconds is not None and stats.snapshot_bytes is not None:
+        lines.append(
+            f"Последнее сохранение: {stats.persist_seconds * 1000:.0f} мс, "
+            f"{stats.snapshot_bytes / 2 ** 20:.1f} МиБ"
+        )
+    return "\n".join(lines)
+
+
 class Bot:
-    def __init__(self, config: Config, storage: BaseStorage) -> None:
-        self.storage = storage
+    def __init__(
+        self,
+        config: "Config",
+        storage: BaseStorage,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+        http: Optional[requests.Session] = None,
+        recorder: Optional["Recorder"] = None,
+    ) -> None:
+        self.metrics = metrics or Metrics()
+        self.tracer = tracer or Tracer()
+        self.storage = TracedStorage(storage, self.tracer)
+        self.recorder = recorder
+        self.admin_ids = set(config.admin_ids)
 
         tokens = config.vk_user_tokens.split(",")
         logger.debug("Found %s access tokens!", len(tokens))
-        self._sessions = [vk_api.VkApi(token=token) for token in tokens]
+
+        if http is None:
+            # все токены ходят к одному и тому же api.vk.ru, так что пул
+            # соединений у них общий; VkClient отправляет до 4 запросов
+            # одновременно на каждый токен
+            pool_size = config.vk_http_pool_size or 4 * (len(tokens) + 1)
+            http = VkTransport(self.metrics, pool_size)
+        self._sessions = [
+            VkSession(token, self.metrics, self.tracer, f"user{i}", http, recorder)
+            for i, token in enumerate(tokens)
+        ]
         # будем использовать все сессии по очереди, чтобы обойти ограничение
         # на 3 запроса в секунду. а вдруг случится хайлоад?
-        self.sessions = cycle(self._sessions)
+        self.vk = VkClient(
+            self._sessions,
+            self.metrics,
+            self.tracer,
+            "user",
+            deadlines=config.vk_deadlines,
+            default_deadline=config.vk_default_deadline,
+            retries=config.vk_retries,
+            hedge=config.vk_hedge,
+            breaker_threshold=config.vk_breaker_threshold,
+            breaker_cooldown=config.vk_breaker_cooldown,
+        )
 
-        self.group_session = vk_api.VkApi(token=config.vk_group_token)
+        self.group_session = VkSession(
+            config.vk_group_token, self.metrics, self.tracer, "group", http, recorder
+        )
+        self.group_vk = VkClient(
+            [self.group_session],
+            self.metrics,
+            self.tracer,
+            "group",
+            deadlines=config.vk_deadlines,
+            default_deadline=config.vk_default_deadline,
+            retries=config.vk_retries,
+            breaker_threshold=config.vk_breaker_threshold,
+            breaker_cooldown=config.vk_breaker_cooldown,
+        )
         self.longpoll = VkLongPoll(self.group_session, config.vk_group_id)
 
-    @property
-    def session(self) -> vk_api.VkApi:
-        return next(self.sessions)
+        self.ranker = Ranker(
+            self.vk,
+            self.storage,
+            self.metrics,
+            top_slice=config.ranking_top_slice,
+            background_limit=config.ranking_background_limit,
+            workers=len(self._sessions),
+        )
+        self.prefetcher = SearchPrefetcher(
+            self.vk,
+            self.metrics,
+            count=config.prefetch_searches,
+            reserve=config.prefetch_reserved_tokens,
+            ttl=config.prefetch_ttl,
+        )
+        self.budget = LatencyBudget(
+            self.metrics,
+            self.tracer,
+            config.latency_budgets,
+            overload_threshold=config.latency_overload_threshold,
+            overload_cooldown=config.latency_overload_cooldown,
+            workers=len(self._sessions),
+        )
+        self.places = PlaceResolver(
+            self.vk, self.metrics, refresh_interval=config.places_refresh_interval
+        )
+        self.seen = SeenProfiles(
+            self.storage,
+            self.metrics,
+            capacity=config.seen_capacity,
+            error_rate=config.seen_error_rate,
+        )
+
+        self._storage_rows = self.metrics.gauge(
+            "vkinder_storage_rows", "Объекты в хранилище по типам", ["type"]
+        )
+        self._storage_bytes = self.metrics.gauge(
+            "vkinder_storage_bytes",
+            "Примерный объём объектов в памяти по типам",
+            ["type"],
+        )
+        self._storage_orphaned = self.metrics.gauge(
+            "vkinder_storage_orphaned",
+            "Объекты, ссылающиеся на удалённые или не сохранённые объекты",
+            ["reference"],
+        )
+        self._storage_snapshot_bytes = self.metrics.gauge(
+            "vkinder_storage_snapshot_bytes",
+            "Размер последнего сохранённого на диск снимка хранилища",
+            [],
+        )
+        self.metrics.on_collect(self._collect_storage_stats)
+
+    def _collect_storage_stats(self) -> None:
+        stats = self.storage.stats(top=0)
+        for type, table in stats.tables.items():
+            self._storage_rows.labels(type=type).set(table.rows)
+            self._storage_bytes.labels(type=type).set(table.bytes)
+        for reference, groups in stats.references.items():
+            self._storage_orphaned.labels(reference=reference).set(groups.orphaned)
+        if stats.snapshot_bytes is not None:
+            self._storage_snapshot_bytes.set(stats.snapshot_bytes)
 
     def run(self) -> NoReturn:
         for event in self.longpoll.listen():
-            if not (event.type == VkEventType.MESSAGE_NEW and event.to_me):
-                continue
+            self.handle_event(event)
 
-            # проверим, новый ли этот пользователь или нет
+        raise Exception("The previous loop should never exit!")
+
+    def handle_event(self, event: Event) -> None:
+        if not (event.type == VkEventType.MESSAGE_NEW and event.to_me):
+            return
+
+        if self.recorder is not None:
+            self.recorder.record_event(event.user_id, event.text)
+        self.budget.start()
+
+        with self.metrics.event_latency.labels().time(), self.tracer.event(
+            "event", user_id=event.user_id, text=event.text
+        ):
             try:
+                self._handle_message(event)
+            except VkClientError as e:
+                # VK не ответил вовремя или предохранитель разомкнут: это
+                # событие пропускаем, а бот продолжает слушать лонгпул
+                logger.warning("Can't handle event from %s: %r", event.user_id, e)
+                self._reply_later(event.user_id)
+
+    def _reply_later(self, user_id: int) -> None:
+        try:
+            write_msg(
+                self.group_vk,
+                user_id,
+                "ВКонтакте сейчас отвечает медленно, попробуйте ещё раз позже.",
+            )
+        except VkClientError as e:
+            logger.warning("Can't tell %s to try again later: %r", user_id, e)
+
+    def _handle_message(self, event: Event) -> None:
+        # проверим, новый ли этот пользователь или нет
+        try:
+            user = self.storage.get(User, event.user_id)
+        except ItemNotFoundInStorageError:
+            # если новый, то создадим пустого с состоянием для инициализации
+            user = User(
+                vk_id=event.user_id,
+                state=StateName.INITIAL.value,
+            )
+            try:
+                self.storage.save(user, overwrite=False)
+            except ItemAlreadyExistsInStorageError:
+                # пользователя только что создал обработчик другого события
                 user = self.storage.get(User, event.user_id)
-            except ItemNotFoundInStorageError:
-                # если новый, то создадим пустого с состоянием для инициализации
-                user = User(
-                    vk_id=event.user_id,
-                    state=StateName.INITIAL,
-                )
-                self.storage.save(user)
-
-            if event.text == "/state":
-                write_msg(
-                    self.group_session,
-                    event.user_id,
-                    (
-                        f"Пользователь находится в состоянии {user.state}. "
-                        f"Ассоциированные данные: {user.__dict__}"
-                    ),
-                )
-                states[user.state].enter(self, event)
-                continue
-
-            new_state = states[user.state].leave(self, event).value.key
+
+        if event.text == "/state":
+            write_msg(
+                self.group_vk,
+                event.user_id,
+                (
+                    f"Пользователь находится в состоянии {user.state}. "
+                    f"Ассоциированные данные: {user.__dict__}"
+                ),
+            )
+            self._enter(user.state, event)
+            return
+
+        if event.text == "/storage" and event.user_id in self.admin_ids:
+            write_msg(
+                self.group_vk,
+                event.user_id,
+                format_storage_stats(self.storage.stats()),
+            )
+            self._enter(user.state, event)
+            return
+
+        new_state = self._leave(user.state, event).value
+
+        def set_state(user: User) -> None:
             user.state = new_state
-            states[new_state].enter(self, event)
+
+        # состояние сохранило изменения пользователя, так что берём свежую копию
+        self.storage.update(User, event.user_id, set_state)
+        self._enter(new_state, event)
+
+        with self.metrics.persist_latency.labels().time():
             self.storage.persist()
 
-        raise Exception("The previous loop should never exit!")
+    def _enter(self, state: str, event: Event) -> None:
+        with self.metrics.state_latency.labels(
+            state=state, action="enter"
+        ).time(), self.tracer.span("state.enter", state=state):
+            states[state].enter(self, event)
+
+    def _leave(self, state: str, event: Event) -> StateName:
+        with self.metrics.state_latency.labels(
+            state=state, action="leave"
+        ).time(), self.tracer.span("state.leave", state=state):
+            return states[state].leave(self, event)
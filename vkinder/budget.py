@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+from vkinder.metrics import Metrics
+from vkinder.tracing import Tracer
+from vkinder.vk_client import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+class LatencyBudget:
+    """Бюджет времени на ответ пользователю в каждом состоянии.
+
+    Бюджет отсчитывается от начала обработки события (`start`), так что
+    в него входит и выход из предыдущего состояния. Необязательную часть
+    ответа (например, фотографии анкеты) состояние получает через `within`:
+    если она не успевает в оставшееся время, состояние отвечает без неё,
+    а её дожидается в фоне. Если бюджет превышается `overload_threshold`
+    раз подряд, то `overload_cooldown` секунд необязательные запросы
+    не делаются совсем.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        tracer: Tracer,
+        budgets: Mapping[str, float],
+        overload_threshold: int = 3,
+        overload_cooldown: float = 30,
+        workers: int = 4,
+    ) -> None:
+        self.tracer = tracer
+        self.budgets = dict(budgets)
+        self.overload_threshold = overload_threshold
+        self.overload_cooldown = overload_cooldown
+        self._local = threading.local()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="budget"
+        )
+        self._degraded = metrics.counter(
+            "vkinder_degraded_total",
+            "Ответы, отправленные без части данных, чтобы уложиться в бюджет",
+            ["state", "path"],
+        )
+
+    def start(self) -> None:
+        """Начало обработки события в текущем потоке."""
+        self._local.started = time.monotonic()
+
+    def remaining(self, state: str) -> Optional[float]:
+        """Сколько секунд осталось от бюджета `state`; None -- бюджета нет."""
+        budget = self.budgets.get(state)
+        if budget is None:
+            return None
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return budget
+        return budget - (time.monotonic() - started)
+
+    def _breaker(self, state: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(state)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    self.overload_threshold, self.overload_cooldown
+                )
+                self._breakers[state] = breaker
+            return breaker
+
+    def degraded(self, state: str, path: str) -> None:
+        self._degraded.labels(state=state, path=path).inc()
+
+    def within(
+        self, state: str, fn: Callable[[], R]
+    ) -> Tuple[Optional[R], "Optional[Future[R]]"]:
+        """Выполняет `fn`, если она укладывается в бюджет `state`.
+
+        Возвращает `(результат, None)`, если `fn` успела, `(None, future)`,
+        если не успела и продолжает выполняться в фоне, и `(None, None)`,
+        если из-за перегрузки `fn` даже не запускалась. Исключения `fn`,
+        успевшей в бюджет, пробрасываются.
+        """
+        remaining = self.remaining(state)
+        if remaining is None:
+            return fn(), None
+
+        breaker = self._breaker(state)
+        if not breaker.allow():
+            self.degraded(state, "skipped")
+            return None, None
+
+        future = self._executor.submit(self.tracer.bind(fn))
+        done, _ = wait([future], timeout=max(0.0, remaining))
+        if not done:
+            breaker.record_failure()
+            self.degraded(state, "deferred")
+            logger.debug("%s is over its latency budget, deferring", state)
+            return None, future
+        # даже если `fn` упала, в бюджет она уложилась -- иначе пробный
+        # вызов так и не закончится, и `fn` не будет запускаться никогда
+        breaker.record_success()
+        return future.result(), None
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
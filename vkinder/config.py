@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from pydantic import BaseSettings
 
 
@@ -6,5 +8,73 @@ class Config(BaseSettings):
     vk_group_token: str
     vk_group_id: int
 
+    # сколько секунд ждать ответа VK API по умолчанию и для отдельных методов
+    vk_default_deadline: float = 10
+    vk_deadlines: Dict[str, float] = {"users.search": 15}
+    # сколько раз повторять читающие запросы при временных ошибках
+    vk_retries: int = 2
+    # дублировать ли медленные читающие запросы через другой токен
+    vk_hedge: bool = True
+    # после скольких сбоев подряд считать VK недоступным и на сколько секунд
+    vk_breaker_threshold: int = 5
+    vk_breaker_cooldown: float = 30
+    # сколько соединений с VK API держать открытыми; по умолчанию -- по числу
+    # одновременных запросов, которые может отправить бот
+    vk_http_pool_size: Optional[int] = None
+
+    # сколько первых результатов поиска сортировать по популярности фотографий
+    # до показа первой анкеты; остальные сортируются в фоне
+    ranking_top_slice: int = 50
+    # сколько следующих результатов сортировать в фоне; остальные остаются
+    # в порядке VK, а фотографии к ним запрашиваются при просмотре
+    ranking_background_limit: int = 500
+
+    # сколько оценённых анкет помнить для каждого пользователя, чтобы не
+    # показывать их в новых поисках, и доля анкет, которые будут ошибочно
+    # считаться уже оценёнными
+    seen_capacity: int = 10_000
+    seen_error_rate: float = 0.01
+
+    # сколько секунд пользователь ждёт ответа в каждом состоянии; если
+    # фотографии анкеты не успевают, анкета отправляется без них, а они --
+    # следом. После скольких превышений подряд и на сколько секунд перестать
+    # запрашивать фотографии совсем
+    latency_budgets: Dict[str, float] = {"list_matches": 1.5}
+    latency_overload_threshold: int = 3
+    latency_overload_cooldown: float = 30
+
+    # сколько поисков запрашивать заранее, пока пользователь выбирает
+    # возраст (0 -- не запрашивать), сколько токенов оставлять при этом
+    # свободными для остальных запросов и сколько секунд хранить ответы
+    prefetch_searches: int = 2
+    prefetch_reserved_tokens: int = 1
+    prefetch_ttl: float = 120
+
+    # как часто обновлять списки стран и городов, по которым бот узнаёт
+    # названия, набранные пользователем, в секундах
+    places_refresh_interval: float = 24 * 3600
+
+    # кому из пользователей VK доступны служебные команды, например /storage
+    admin_ids: List[int] = []
+
+    # адрес эндпоинта с метриками; если порт не задан, эндпоинт не поднимается
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = None
+    # как часто писать в лог сводку по метрикам, в секундах; 0 -- никогда
+    metrics_log_interval: float = 60
+
+    # трассировка событий; включается и выключается на ходу сигналами
+    # SIGUSR1 (трассировка) и SIGUSR2 (профилирование)
+    trace_enabled: bool = False
+    trace_slow_event_ms: float = 1000
+    trace_profile: bool = False
+    # куда складывать дерево спанов и профиль медленных событий;
+    # если не задано, всё пишется в лог
+    trace_dump_dir: Optional[str] = None
 
-config = Config()
+    # куда записывать входящие события и ответы VK для воспроизведения
+    # (см. benchmarks/replay.py); если не задано, ничего не записывается
+    record_file: Optional[str] = None
+    # секрет для псевдонимов пользователей в записи, чтобы они не менялись
+    # после перезапуска бота
+    record_secret: Optional[str] = None
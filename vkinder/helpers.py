@@ -1,15 +1,16 @@
 from random import randrange
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Optional
 
-from vk_api import VkApi
+if TYPE_CHECKING:
+    from vkinder.vk_client import VkClient
 
 
 def write_msg(
-    session: VkApi,
+    session: "VkClient",
     user_id: int,
     message: str,
     attachment: Optional[str] = None,
-    keyboard: Optional[Dict[str, Any]] = None,
+    keyboard: Optional[str] = None,
 ) -> None:
     """Отправка сообщения пользователю"""
     values = {"user_id": user_id, "message": message, "random_id": randrange(10 ** 7)}
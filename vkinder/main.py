@@ -1,20 +1,77 @@
 import logging
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from vkinder.bot import Bot
-from vkinder.config import config
-from vkinder.storage.memory_storage import PersistentStorage
+if TYPE_CHECKING:
+    import requests
+
+    from vkinder.bot import Bot
+    from vkinder.config import Config
+
+DATA_FILE = Path(__file__).parent.resolve() / "data.pickle"
 
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.DEBUG)
 
-ch = logging.StreamHandler(sys.stdout)
-ch.setLevel(logging.DEBUG)
-root_logger.addHandler(ch)
 
-if __name__ == "__main__":
+def setup_logging() -> None:
+    root_logger.setLevel(logging.DEBUG)
+
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setLevel(logging.DEBUG)
+    root_logger.addHandler(ch)
+
+
+def create_bot(
+    config: "Config",
+    data_file: Path = DATA_FILE,
+    http: Optional["requests.Session"] = None,
+) -> "Bot":
+    """Собирает бота со всем, что ему нужно.
+
+    Модули бота импортируются здесь, а не при импорте `vkinder.main`.
+    База читается с диска в фоне, пока бот подключается к VK.
+    """
+    from vkinder.bot import Bot
+    from vkinder.metrics import Metrics, MetricsLogger, MetricsServer
+    from vkinder.recording import Recorder
+    from vkinder.storage.memory_storage import PersistentStorage
+    from vkinder.tracing import Tracer
+
+    storage = PersistentStorage(data_file, background=True)
+
+    metrics = Metrics()
+    if config.metrics_port is not None:
+        MetricsServer(metrics, config.metrics_host, config.metrics_port).start()
+    if config.metrics_log_interval > 0:
+        MetricsLogger(metrics, config.metrics_log_interval).start()
+    tracer = Tracer(
+        enabled=config.trace_enabled,
+        slow_threshold=config.trace_slow_event_ms / 1000,
+        profile=config.trace_profile,
+        dump_dir=config.trace_dump_dir,
+    )
+    tracer.install_signal_handlers()
+
+    recorder = None
+    if config.record_file:
+        recorder = Recorder(config.record_file, config.record_secret)
+
+    return Bot(config, storage, metrics, tracer, http=http, recorder=recorder)
+
+
+def main() -> None:
+    from vkinder.config import Config
+
+    setup_logging()
     root_logger.info("Starting bot...")
-    storage = PersistentStorage(Path(__file__).parent.resolve() / "data.pickle")
-    bot = Bot(config, storage)
-    bot.run()
+    bot = create_bot(Config())
+    try:
+        bot.run()
+    finally:
+        if bot.recorder is not None:
+            bot.recorder.close()
+
+
+if __name__ == "__main__":
+    main()
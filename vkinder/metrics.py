@@ -0,0 +1,407 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм в секундах: от миллисекунды до полуминуты
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, **extra: str) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # последняя корзина -- +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self.buckets):
+                    return self.buckets[index]
+                return float("inf")
+        return float("inf")
+
+
+class _Metric:
+    kind: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError()
+
+    def _child(self, values: LabelValues) -> Any:
+        # быстрый путь без блокировки: потомок уже создан
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, "
+                f"got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def children(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+    def render(self) -> List[str]:
+        raise NotImplementedError()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def labels(self, **labels: str) -> _CounterChild:
+        return self._child(self._label_values(labels))
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, child in self.children():
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {child.value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def labels(self, **labels: str) -> _GaugeChild:
+        return self._child(self._label_values(labels))
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, child in self.children():
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {child.value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def labels(self, **labels: str) -> _HistogramChild:
+        return self._child(self._label_values(labels))
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, child in self.children():
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Metrics:
+    """Реестр метрик бота.
+
+    Все метрики хранятся в памяти процесса и отдаются в текстовом формате
+    Prometheus через `MetricsServer`.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+        self.state_latency = self.histogram(
+            "vkinder_state_seconds",
+            "Время выполнения enter/leave состояний",
+            ["state", "action"],
+        )
+        self.vk_latency = self.histogram(
+            "vkinder_vk_request_seconds",
+            "Время выполнения запросов к VK API",
+            ["method", "token"],
+        )
+        self.vk_errors = self.counter(
+            "vkinder_vk_errors_total",
+            "Количество запросов к VK API, завершившихся ошибкой",
+            ["method", "token"],
+        )
+        self.event_latency = self.histogram(
+            "vkinder_event_seconds",
+            "Полное время обработки одного события",
+            [],
+        )
+        self.persist_latency = self.histogram(
+            "vkinder_storage_persist_seconds",
+            "Время сохранения хранилища на диск",
+            [],
+        )
+
+    def _register(self, metric: M) -> M:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered")
+                return cast(M, existing)
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str]
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str]) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        """`collector` будет обновлять метрики перед каждой выдачей."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Короткая сводка по гистограммам для периодического лога."""
+        with self._lock:
+            histograms = [m for m in self._metrics.values() if isinstance(m, Histogram)]
+        parts = []
+        for histogram in histograms:
+            for values, child in histogram.children():
+                if not child.count:
+                    continue
+                labels = ",".join(values)
+                name = f"{histogram.name}[{labels}]" if labels else histogram.name
+                parts.append(
+                    f"{name}: n={child.count} "
+                    f"avg={child.sum / child.count * 1000:.1f}ms "
+                    f"p50<={child.quantile(0.5) * 1000:g}ms "
+                    f"p99<={child.quantile(0.99) * 1000:g}ms"
+                )
+        return "; ".join(parts) if parts else "no observations yet"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        logger.debug("metrics: " + format, *args)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт `/metrics` в фоновом потоке."""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 0):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        logger.info(
+            "Metrics are served at http://%s:%s/metrics", *self._server.server_address
+        )
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsLogger:
+    """Периодически пишет сводку по метрикам в лог."""
+
+    def __init__(self, metrics: Metrics, interval: float) -> None:
+        self.metrics = metrics
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsLogger":
+        self._thread = threading.Thread(
+            target=self._loop, name="metrics-logger", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            logger.info("Metrics summary: %s", self.metrics.summary())
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Tuple
 from uuid import UUID
 
 from vkinder.storage.base import StorageItem
@@ -19,6 +19,12 @@ class User(StorageItem):
     age_to: Optional[int]
     current_search: Optional[UUID]
     current_search_item: Optional[int]
+    # просмотр истории поисков: поиск, после которого начинается текущая
+    # страница поисков, выбранный поиск и анкета, после которой начинается
+    # текущая страница понравившихся анкет
+    history_cursor: Optional[UUID] = None
+    history_search: Optional[UUID] = None
+    history_match_cursor: Optional[UUID] = None
 
     @property
     def id(self) -> int:
@@ -27,6 +33,8 @@ class User(StorageItem):
 
 class Search(StorageItem):
     type = "search"
+    indexes = (("user_id",),)
+    references = (("user_id", "user"),)
 
     uuid: UUID
     user_id: int
@@ -36,6 +44,9 @@ class Search(StorageItem):
     sex: int
     age_from: int
     age_to: int
+    # id анкет в порядке показа (см. vkinder.ranking); None -- поиск создан
+    # раньше, и порядок задаёт только `Match.rank`
+    order: Optional[Tuple[UUID, ...]] = None
 
     @property
     def id(self) -> UUID:
@@ -44,6 +55,8 @@ class Search(StorageItem):
 
 class Match(StorageItem):
     type = "match"
+    indexes = (("search_id",), ("search_id", "rank"), ("search_id", "liked"))
+    references = (("search_id", "search"),)
 
     uuid: UUID
     search_id: UUID
@@ -52,7 +65,24 @@ class Match(StorageItem):
     last_name: str
     seen: bool = False
     liked: bool = False
+    # место в выдаче и лучшие фотографии (см. vkinder.ranking)
+    rank: int = 0
+    photos: Optional[str] = None
 
     @property
     def id(self) -> UUID:
         return self.uuid
+
+
+class Seen(StorageItem):
+    type = "seen"
+
+    user_id: int
+    # слои фильтра Блума по id оценённых анкет (см. vkinder.seen); bytes,
+    # а не bytearray, чтобы копии из хранилища не делили их между собой
+    slices: Tuple[bytes, ...] = ()
+    count: int = 0
+
+    @property
+    def id(self) -> int:
+        return self.user_id
@@ -0,0 +1,326 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from vkinder.metrics import Metrics
+from vkinder.vk_client import VkClient
+
+logger = logging.getLogger(__name__)
+
+# сколько вариантов предлагать в "возможно, ты имел в виду"
+SUGGESTIONS = 4
+# среди скольких названий с самыми похожими триграммами считать расстояние
+CANDIDATES = 30
+# сколько популярных стран VK отдаёт для кнопок по умолчанию
+POPULAR_COUNTRIES = 6
+
+
+def normalize(title: str) -> str:
+    title = title.lower().replace("ё", "е")
+    return " ".join(re.split(r"[\s\-]+", title.strip()))
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int, prefix: bool = False) -> int:
+    """Расстояние Левенштейна от `a` до `b`; всё, что больше `limit`, --
+    это `limit + 1`.
+
+    С `prefix` -- расстояние до ближайшего начала `b`, на единицу больше,
+    если это не всё `b`. Считаются только клетки не дальше `limit` от
+    диагонали, так что время растёт с `limit`, а не с длиной `b`.
+    """
+    n, m = len(a), len(b)
+    big = limit + 1
+    if m < n - limit or (not prefix and m > n + limit):
+        return big
+    previous = [j if j <= limit else big for j in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [big] * (m + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        char = a[i - 1]
+        for j in range(max(1, i - limit), min(m, i + limit) + 1):
+            # min() здесь заметно медленнее сравнений
+            d = previous[j - 1] if char == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < d:
+                d = previous[j] + 1
+            if current[j - 1] + 1 < d:
+                d = current[j - 1] + 1
+            current[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > limit:
+            return big
+        previous = current
+    distance = previous[m]
+    if prefix and m > 0:
+        distance = min(distance, min(previous[:m]) + 1)
+    return min(distance, big)
+
+
+class Place(NamedTuple):
+    id: int
+    title: str
+
+
+class Resolution(NamedTuple):
+    # место с точно таким названием
+    exact: Optional[Place]
+    # похожие названия, самые похожие первыми
+    suggestions: List[Place]
+
+
+class TrigramIndex:
+    """Нечёткий поиск по названиям через индекс триграмм.
+
+    Кандидаты -- названия с наибольшим числом общих с запросом триграмм,
+    среди них выбираются те, что ближе всего по расстоянию Левенштейна
+    (начало названия считается на единицу дальше, так что "моск" находит
+    Москву). Названия можно добавлять, менять и удалять
+    по одному, не перестраивая индекс.
+    """
+
+    def __init__(self) -> None:
+        self.places: Dict[int, Place] = {}
+        # порядок, в котором VK отдал места: сначала крупные
+        self._order: Dict[int, int] = {}
+        self._next_order = 0
+        self._normalized: Dict[int, str] = {}
+        self._exact: Dict[str, List[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def first(self, count: int) -> List[Place]:
+        """Первые места в том порядке, в котором их отдал VK."""
+        with self._lock:
+            ids = heapq.nsmallest(count, self._order, key=self._order.__getitem__)
+            return [self.places[id] for id in ids]
+
+    def add(self, place: Place) -> None:
+        with self._lock:
+            if self.places.get(place.id) == place:
+                return
+            order = self._order.get(place.id)
+            if order is None:
+                order = self._next_order
+                self._next_order += 1
+            self._remove(place.id)
+            normalized = normalize(place.title)
+            self.places[place.id] = place
+            self._order[place.id] = order
+            self._normalized[place.id] = normalized
+            self._exact.setdefault(normalized, []).append(place.id)
+            for trigram in trigrams(normalized):
+                self._postings.setdefault(trigram, set()).add(place.id)
+
+    def remove(self, id: int) -> None:
+        with self._lock:
+            self._remove(id)
+
+    def _remove(self, id: int) -> None:
+        if id not in self.places:
+            return
+        del self.places[id]
+        del self._order[id]
+        normalized = self._normalized.pop(id)
+        self._exact[normalized].remove(id)
+        if not self._exact[normalized]:
+            del self._exact[normalized]
+        for trigram in trigrams(normalized):
+            self._postings[trigram].discard(id)
+
+    def update(self, places: Iterable[Place], keep: Iterable[int] = ()) -> None:
+        """Приводит индекс к `places`, меняя только то, что изменилось.
+
+        Места из `keep` остаются, даже если их нет в `places`.
+        """
+        places = list(places)
+        fresh = {place.id for place in places} | set(keep)
+        # `places` тем временем меняют `learn_cities` и другие потоки
+        with self._lock:
+            for id in set(self.places) - fresh:
+                self._remove(id)
+        for place in places:
+            self.add(place)
+
+    def resolve(self, query: str) -> Resolution:
+        query = normalize(query)
+        with self._lock:
+            exact = self._exact.get(query)
+            if exact:
+                return Resolution(self.places[exact[0]], [])
+
+            query_trigrams = trigrams(query)
+            overlap: Counter = Counter()
+            for trigram in query_trigrams:
+                overlap.update(self._postings.get(trigram, ()))
+            limit = max(1, len(query) // 4)
+            scored: List[Tuple[int, int, int]] = []
+            for id, count in overlap.most_common(CANDIDATES):
+                # каждая правка меняет не больше трёх триграмм, и ещё одна
+                # (с концом строки) теряется, если запрос -- начало названия
+                if count < len(query_trigrams) - 3 * limit - 1:
+                    break
+                distance = edit_distance(
+                    query, self._normalized[id], limit, prefix=True
+                )
+                if distance <= limit:
+                    scored.append((distance, self._order[id], id))
+                    if len(scored) >= SUGGESTIONS:
+                        # дальше интересны только не менее похожие
+                        scored.sort()
+                        del scored[SUGGESTIONS:]
+                        limit = scored[-1][0]
+            scored.sort()
+            return Resolution(
+                None, [self.places[id] for _, _, id in scored[:SUGGESTIONS]]
+            )
+
+
+class PlaceResolver:
+    """Страны и города по названиям, набранным пользователем, без VK.
+
+    Все страны, популярные страны (для кнопок) и крупные города каждой
+    страны (тот список, что VK отдаёт без поискового запроса) запрашиваются
+    один раз, при первом обращении,
+    и раз в `refresh_interval` секунд обновляются в фоне. Города, которые
+    нашлись только через поиск VK (`learn_cities`), тоже попадают в индекс.
+    """
+
+    def __init__(
+        self, vk: VkClient, metrics: Metrics, refresh_interval: float = 24 * 3600
+    ) -> None:
+        self.vk = vk
+        self.refresh_interval = refresh_interval
+        self._countries: Optional[TrigramIndex] = None
+        self._popular: List[Place] = []
+        self._cities: Dict[int, TrigramIndex] = {}
+        # города, которых нет в общем списке, а значит и в обновлениях
+        self._learned: Dict[int, Set[int]] = {}
+        self._loaded_at: Dict[Optional[int], float] = {}
+        self._refreshing: Set[Optional[int]] = set()
+        self._lock = threading.Lock()
+        self._lookups = metrics.counter(
+            "vkinder_place_lookups_total",
+            "Поиск стран и городов по названию",
+            ["kind", "result"],
+        )
+
+    def _fetch_countries(self) -> List[Place]:
+        items = self.vk.method("database.getCountries", {"need_all": 1, "count": 1000})[
+            "items"
+        ]
+        return [Place(item["id"], item["title"]) for item in items]
+
+    def _fetch_popular_countries(self) -> List[Place]:
+        # без `need_all` VK отдаёт короткий список основных стран, а полный
+        # список идёт по алфавиту и для кнопок не годится
+        items = self.vk.method(
+            "database.getCountries", {"need_all": 0, "count": POPULAR_COUNTRIES}
+        )["items"]
+        return [Place(item["id"], item["title"]) for item in items]
+
+    def _fetch_cities(self, country_id: int) -> List[Place]:
+        items = self.vk.method(
+            "database.getCities", {"country_id": country_id, "count": 1000}
+        )["items"]
+        return [Place(item["id"], item["title"]) for item in items]
+
+    def _refresh(self, country_id: Optional[int]) -> None:
+        try:
+            if country_id is None:
+                assert self._countries is not None
+                self._countries.update(self._fetch_countries())
+                self._popular = self._fetch_popular_countries()
+            else:
+                self._cities[country_id].update(
+                    self._fetch_cities(country_id), set(self._learned[country_id])
+                )
+        except Exception:
+            logger.exception("Can't refresh places of country %s", country_id)
+        finally:
+            # при ошибке старый список остаётся до следующего обновления
+            self._loaded_at[country_id] = time.monotonic()
+            with self._lock:
+                self._refreshing.discard(country_id)
+
+    def _maybe_refresh(self, country_id: Optional[int]) -> None:
+        age = time.monotonic() - self._loaded_at[country_id]
+        if age < self.refresh_interval:
+            return
+        with self._lock:
+            if country_id in self._refreshing:
+                return
+            self._refreshing.add(country_id)
+        threading.Thread(
+            target=self._refresh, args=(country_id,), name="places", daemon=True
+        ).start()
+
+    def countries(self) -> TrigramIndex:
+        if self._countries is None:
+            with self._lock:
+                if self._countries is None:
+                    index = TrigramIndex()
+                    index.update(self._fetch_countries())
+                    self._popular = self._fetch_popular_countries()
+                    self._loaded_at[None] = time.monotonic()
+                    self._countries = index
+        self._maybe_refresh(None)
+        return self._countries
+
+    def popular_countries(self) -> List[Place]:
+        """Страны для кнопок по умолчанию, в порядке VK."""
+        self.countries()
+        return self._popular
+
+    def cities(self, country_id: int) -> TrigramIndex:
+        index = self._cities.get(country_id)
+        if index is None:
+            with self._lock:
+                index = self._cities.get(country_id)
+                if index is None:
+                    index = TrigramIndex()
+                    index.update(self._fetch_cities(country_id))
+                    self._learned[country_id] = set()
+                    self._loaded_at[country_id] = time.monotonic()
+                    self._cities[country_id] = index
+        self._maybe_refresh(country_id)
+        return index
+
+    def country(self, title: str) -> Resolution:
+        resolution = self.countries().resolve(title)
+        self._count("country", resolution)
+        return resolution
+
+    def city(self, country_id: int, title: str) -> Resolution:
+        resolution = self.cities(country_id).resolve(title)
+        self._count("city", resolution)
+        return resolution
+
+    def learn_cities(self, country_id: int, items: Iterable[Dict[str, Any]]) -> None:
+        """Добавляет в индекс города из ответа `database.getCities` с `q`."""
+        index = self.cities(country_id)
+        for item in items:
+            self._learned[country_id].add(item["id"])
+            index.add(Place(item["id"], item["title"]))
+
+    def _count(self, kind: str, resolution: Resolution) -> None:
+        if resolution.exact is not None:
+            result = "exact"
+        elif resolution.suggestions:
+            result = "suggested"
+        else:
+            result = "missed"
+        self._lookups.labels(kind=kind, result=result).inc()
@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from vkinder.metrics import Metrics
+from vkinder.vk_client import VkClient
+
+logger = logging.getLogger(__name__)
+
+SearchKey = Tuple[Tuple[str, Any], ...]
+
+
+def search_key(values: Dict[str, Any]) -> SearchKey:
+    return tuple(sorted(values.items()))
+
+
+class _Prefetch:
+    __slots__ = ("future", "started")
+
+    def __init__(self, future: "Future[Optional[Tuple[Any, float]]]") -> None:
+        self.future = future
+        self.started = time.monotonic()
+
+
+class SearchPrefetcher:
+    """Поиски, запрошенные заранее, пока пользователь выбирает возраст.
+
+    К выбору возраста страна, город и пол уже известны, а выбирают обычно
+    одну из кнопок. Поэтому при входе в `SelectAgeState` запрашиваются
+    поиски для `count` самых популярных кнопок, и если пользователь нажмёт
+    одну из них, ответ уже готов (или хотя бы уже в пути).
+
+    Такие запросы идут, только пока свободно больше `reserve` токенов, без
+    повторов и дублирования, так что запросам пользователей они не мешают.
+    Ненужные отменяются, если ещё не начались, а ответы на остальные
+    выбрасываются.
+    """
+
+    def __init__(
+        self,
+        vk: VkClient,
+        metrics: Metrics,
+        count: int = 2,
+        reserve: int = 1,
+        ttl: float = 120,
+    ) -> None:
+        self.vk = vk
+        self.count = count
+        self.reserve = reserve
+        self.ttl = ttl
+        self._pending: Dict[int, Dict[SearchKey, _Prefetch]] = {}
+        # сколько раз выбирали каждый вариант
+        self._popularity: Counter = Counter()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, count), thread_name_prefix="prefetch"
+        )
+        self._results = metrics.counter(
+            "vkinder_prefetch_total",
+            "Поиски, запрошенные заранее, по тому, чем они закончились",
+            ["result"],
+        )
+        self._saved = metrics.counter(
+            "vkinder_prefetch_saved_seconds_total",
+            "Сколько времени ожидания поиска сэкономили запросы заранее",
+            [],
+        )
+
+    def _fetch(self, values: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        if self.vk.idle_sessions() <= self.reserve:
+            self._results.labels(result="skipped").inc()
+            return None
+        started = time.perf_counter()
+        try:
+            response = self.vk.method("users.search", values, idempotent=False)
+        except Exception as e:
+            self._results.labels(result="failed").inc()
+            logger.debug("Prefetch failed: %r", e)
+            return None
+        self._results.labels(result="fetched").inc()
+        return response, time.perf_counter() - started
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for user_id, pending in list(self._pending.items()):
+                for key, prefetch in list(pending.items()):
+                    if now - prefetch.started > self.ttl:
+                        prefetch.future.cancel()
+                        del pending[key]
+                if not pending:
+                    del self._pending[user_id]
+
+    def prefetch(
+        self,
+        user_id: int,
+        params: Dict[str, Any],
+        choices: Sequence[Dict[str, Any]],
+    ) -> None:
+        """Запрашивает поиски с `params` и самыми популярными из `choices`."""
+        if self.count <= 0:
+            return
+        self._expire()
+        ranked = sorted(
+            choices, key=lambda choice: -self._popularity[search_key(choice)]
+        )
+        with self._lock:
+            pending = self._pending.setdefault(user_id, {})
+            for choice in ranked[: self.count]:
+                values = {**params, **choice}
+                key = search_key(values)
+                if key not in pending:
+                    pending[key] = _Prefetch(self._executor.submit(self._fetch, values))
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            pending = self._pending.pop(user_id, {})
+        for prefetch in pending.values():
+            future = prefetch.future
+            if future.cancel() or (future.done() and future.result() is None):
+                continue
+            # запрос уже ушёл в VK, так что ответ просто выбрасывается
+            self._results.labels(result="wasted").inc()
+
+    def take(
+        self, user_id: int, values: Dict[str, Any], choice: Dict[str, Any]
+    ) -> Optional[Any]:
+        """Ответ `users.search` с `values`, если его запросили заранее.
+
+        Ещё не пришедший ответ дожидается, а остальные поиски пользователя
+        отбрасываются. `choice` -- выбранный вариант, для популярности.
+        """
+        with self._lock:
+            self._popularity[search_key(choice)] += 1
+            pending = self._pending.get(user_id, {})
+            prefetch = pending.pop(search_key(values), None)
+        self.discard(user_id)
+
+        if prefetch is None:
+            self._results.labels(result="miss").inc()
+            return None
+        waiting = time.perf_counter()
+        try:
+            outcome = prefetch.future.result(
+                timeout=self.vk.deadlines.get("users.search", self.vk.default_deadline)
+            )
+        except (CancelledError, FutureTimeoutError):
+            outcome = None
+        if outcome is None:
+            self._results.labels(result="miss").inc()
+            return None
+        response, duration = outcome
+        self._results.labels(result="hit").inc()
+        self._saved.labels().inc(max(0.0, duration - (time.perf_counter() - waiting)))
+        return response
+
+    def stats(self) -> Dict[str, float]:
+        """Сводка для отчётов: запросы по результатам, доля попаданий
+        и сэкономленное время."""
+        stats = {values[0]: child.value for values, child in self._results.children()}
+        taken = stats.get("hit", 0) + stats.get("miss", 0)
+        stats["hit_rate"] = stats.get("hit", 0) / taken if taken else 0.0
+        stats["saved_seconds"] = self._saved.labels().value
+        return stats
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
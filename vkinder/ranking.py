@@ -0,0 +1,230 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from uuid import UUID
+
+from more_itertools import chunked
+
+from vkinder.metrics import Metrics
+from vkinder.models import Match, Search, User
+from vkinder.storage.base import BaseStorage
+from vkinder.vk_client import VkClient, VkClientError
+
+logger = logging.getLogger(__name__)
+
+# больше 25 обращений к API за один execute VK не разрешает
+EXECUTE_BATCH = 25
+# сколько фотографий прикладывать к анкете
+TOP_PHOTOS = 3
+
+# VKScript для execute: фотографии профиля каждого из `Args.owner_ids`.
+# Чтобы не гонять лишнее, для каждой анкеты возвращаются только id фотографий
+# и число лайков; для закрытых профилей photos.get вернёт false.
+RANK_CODE = """
+var owner_ids = Args.owner_ids.split(",");
+var result = [];
+var i = 0;
+while (i < owner_ids.length) {
+    var photos = API.photos.get({
+        "owner_id": owner_ids[i], "album_id": "profile", "extended": 1,
+        "count": 1000
+    });
+    if (photos) {
+        result.push({"ids": photos.items@.id, "likes": photos.items@.likes@.count});
+    } else {
+        result.push(null);
+    }
+    i = i + 1;
+}
+return result;
+"""
+
+
+def score_photos(
+    owner_id: int, photos: Optional[Dict[str, List[int]]]
+) -> Tuple[int, str]:
+    """Оценка анкеты и вложения для неё: самые залайканные фотографии профиля.
+
+    Оценка -- сумма лайков под теми фотографиями, что будут приложены.
+    """
+    if not photos:
+        return 0, ""
+    top = sorted(zip(photos["likes"], photos["ids"]), reverse=True)[:TOP_PHOTOS]
+    attachment = ",".join(f"photo{owner_id}_{photo_id}" for _, photo_id in top)
+    return sum(likes for likes, _ in top), attachment
+
+
+class Ranker:
+    """Сортировка результатов поиска по популярности фотографий.
+
+    Лайки фотографий запрашиваются пачками по `EXECUTE_BATCH` анкет через
+    `execute`, пачки идут параллельно через все токены. Первые `top_slice`
+    анкет оцениваются сразу, чтобы пользователь начал смотреть уже
+    отсортированные анкеты, а следующие `background_limit` -- в фоне; когда
+    фоновая оценка закончена, переставляются только те анкеты, до которых
+    пользователь ещё не дошёл. Анкеты дальше остаются в порядке VK.
+    Оценки и места сохраняются анкетам пачками, одним проходом по хранилищу
+    на пачку.
+
+    Порядок хранится в `Search.order` (и повторяется в `Match.rank`), а лучшие
+    фотографии -- в `Match.photos`, так что при просмотре анкет фотографии
+    больше не запрашиваются.
+    """
+
+    def __init__(
+        self,
+        vk: VkClient,
+        storage: BaseStorage,
+        metrics: Metrics,
+        top_slice: int = 50,
+        background_limit: int = 500,
+        workers: int = 1,
+    ) -> None:
+        self.vk = vk
+        self.storage = storage
+        self.top_slice = top_slice
+        self.background_limit = background_limit
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ranker"
+        )
+        # фоновая оценка идёт по одному поиску за раз
+        self._background = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ranker-background"
+        )
+        self._latency = metrics.histogram(
+            "vkinder_ranking_seconds",
+            "Время оценки результатов поиска",
+            ["stage"],
+        )
+        self._ranked = metrics.counter(
+            "vkinder_ranked_matches_total",
+            "Анкеты, оценённые по популярности фотографий",
+            ["stage"],
+        )
+
+    def _fetch(self, matches: Sequence[Match]) -> Optional[List[Any]]:
+        try:
+            return self.vk.method(
+                "execute",
+                {
+                    "code": RANK_CODE,
+                    "owner_ids": ",".join(str(match.vk_id) for match in matches),
+                },
+                # скрипт ничего не меняет, так что его можно повторять
+                idempotent=True,
+            )
+        except VkClientError as e:
+            logger.warning("Can't rank %s matches: %r", len(matches), e)
+        except Exception:
+            logger.exception("Can't rank %s matches", len(matches))
+        return None
+
+    def _score(self, matches: Sequence[Match], stage: str) -> Dict[UUID, int]:
+        """Оценивает анкеты и сохраняет им фотографии; возвращает оценки по id."""
+        scores: Dict[UUID, int] = {}
+        with self._latency.labels(stage=stage).time():
+            # пачки отправляются волнами по числу потоков, чтобы фоновая
+            # оценка не занимала очередь и начало новой выдачи не ждало её
+            for wave in chunked(chunked(matches, EXECUTE_BATCH), self.workers):
+                for batch, response in zip(wave, self._executor.map(self._fetch, wave)):
+                    items = response if isinstance(response, list) else []
+                    if response is not None and len(items) < len(batch):
+                        logger.warning(
+                            "execute answered for %s of %s matches",
+                            len(items),
+                            len(batch),
+                        )
+                    photos: Dict[UUID, Dict[str, Any]] = {}
+                    for match, item in zip(batch, items):
+                        scores[match.id], match.photos = score_photos(match.vk_id, item)
+                        photos[match.id] = {"photos": match.photos}
+                    self._set(photos)
+                    # фотографии анкет без ответа запросятся при просмотре
+                    for match in batch[len(items) :]:
+                        scores[match.id] = 0
+        self._ranked.labels(stage=stage).inc(len(matches))
+        return scores
+
+    def _set(self, fields: Mapping[UUID, Dict[str, Any]]) -> None:
+        """Меняет поля анкет в хранилище одним проходом, не затирая отметки
+        пользователя; `fields` -- новые значения полей по id анкеты."""
+        if not fields:
+            return
+
+        def change(stored: Match) -> None:
+            for field, value in fields[stored.id].items():
+                setattr(stored, field, value)
+
+        self.storage.update_many(Match, {id: change for id in fields})
+
+    def _reorder(self, matches: Sequence[Match], scores: Dict[UUID, int]) -> None:
+        """Раздаёт анкетам их же места в выдаче, но по убыванию оценки.
+
+        Новый порядок сохраняется в `Search.order` одной записью, так что
+        при просмотре виден либо старый порядок, либо новый целиком, без
+        повторов и пропусков. `Match.rank` обновляется следом.
+        """
+        if not matches:
+            return
+        ordered = sorted(matches, key=lambda match: scores[match.id], reverse=True)
+        reordered = {match.id: match for match in matches}
+
+        def change(search: Search) -> None:
+            order = list(search.order or ())
+            places = [i for i, id in enumerate(order) if id in reordered]
+            for place, match in zip(places, ordered):
+                order[place] = match.id
+            search.order = tuple(order)
+
+        search = self.storage.update(Search, matches[0].search_id, change)
+        assert search.order is not None
+        ranks: Dict[UUID, Dict[str, Any]] = {}
+        for rank, id in enumerate(search.order):
+            match = reordered.get(id)
+            if match is not None and match.rank != rank:
+                match.rank = rank
+                ranks[id] = {"rank": rank}
+        self._set(ranks)
+
+    def rank(self, user_id: int, matches: Sequence[Match]) -> None:
+        """Оценивает начало выдачи сразу, а следующие анкеты -- в фоне.
+
+        `matches` -- анкеты одного поиска с номерами `rank` по порядку.
+        """
+        top = matches[: self.top_slice]
+        rest = matches[self.top_slice : self.top_slice + self.background_limit]
+        try:
+            self._reorder(top, self._score(top, "top"))
+        except Exception:
+            # поиск уже сохранён, так что анкеты покажутся в порядке VK
+            logger.exception("Ranking failed")
+        if rest:
+            self._background.submit(self._rank_rest, user_id, rest)
+
+    def _rank_rest(self, user_id: int, matches: Sequence[Match]) -> None:
+        started = time.perf_counter()
+        try:
+            scores = self._score(matches, "rest")
+
+            # анкеты, которые пользователь уже видел, и следующую, которую бот
+            # может показывать прямо сейчас, оставляем на месте
+            user = self.storage.get(User, user_id)
+            if user.current_search == matches[0].search_id:
+                assert user.current_search_item is not None
+                shown = user.current_search_item + 1
+                matches = [match for match in matches if match.rank > shown]
+            self._reorder(matches, scores)
+        except Exception:
+            logger.exception("Background ranking failed")
+        else:
+            logger.debug(
+                "Ranked %s matches in background in %.2fs",
+                len(scores),
+                time.perf_counter() - started,
+            )
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._background.shutdown(wait=wait)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# параметры запросов, которые не нужны для воспроизведения и могут содержать
+# токены или персональные данные
+_DROPPED_PARAMS = {
+    "access_token",
+    "v",
+    "random_id",
+    "message",
+    "keyboard",
+    "attachment",
+    "code",
+}
+# параметры запросов, в которых передаются id пользователей
+_USER_ID_PARAMS = {"user_id", "user_ids", "owner_id", "owner_ids"}
+# методы, в ответах которых есть профили пользователей
+_USER_LIST_METHODS = {"users.get", "users.search"}
+# поля профиля, которые нужны боту; остальные не записываются
+_USER_FIELDS = {"is_closed", "can_access_closed", "country", "city"}
+# параметры запросов с текстом, который набрал пользователь
+_TEXT_PARAMS = {"q"}
+# как часто сбрасывать буфер gzip на диск, в записях
+_FLUSH_EVERY = 100
+
+# контакты в тексте сообщений: почта, ссылки и номера телефонов
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_URL_RE = re.compile(
+    r"(?:https?://|www\.)\S+"
+    r"|\b[\w-]+(?:\.[\w-]+)*\.(?:ru|su|com|net|org|me|рф)\b\S*",
+    re.IGNORECASE,
+)
+_NUMBER_RE = re.compile(r"\+?\d[\d\s()-]*\d")
+# столько цифр подряд (возможно, с пробелами и скобками) -- уже не возраст
+_PHONE_DIGITS = 7
+# сообщения длиннее -- это не кнопка, не название и не возраст
+_MAX_TEXT_LENGTH = 64
+
+
+def _scrub_number(match: "re.Match[str]") -> str:
+    digits = sum(char.isdigit() for char in match.group())
+    return "<number>" if digits >= _PHONE_DIGITS else match.group()
+
+
+def scrub_text(text: str) -> str:
+    """Текст, набранный пользователем, без ссылок, почты и номеров телефонов.
+
+    Кнопки, названия стран и городов и возрасты остаются как есть, чтобы
+    запись можно было воспроизвести; длинный текст заменяется целиком.
+    """
+    if len(text) > _MAX_TEXT_LENGTH:
+        return "<text>"
+    text = _EMAIL_RE.sub("<email>", text)
+    text = _URL_RE.sub("<url>", text)
+    return _NUMBER_RE.sub(_scrub_number, text)
+
+
+class Recorder:
+    """Запись входящих событий и ответов VK API для последующего воспроизведения.
+
+    Записи -- JSON-строки в gzip-файле, по одной на событие или запрос, так что
+    файл можно читать потоково, а после перезапуска бота дописывать в конец.
+    Все id пользователей заменяются на псевдонимы (хеш с секретом), имена --
+    на заглушки, а из входящих сообщений убираются ссылки, почта и номера
+    телефонов (см. `scrub_text`); токены, тексты исходящих сообщений
+    и вложения не записываются вовсе. Если `secret` не задан, он
+    генерируется случайно, и псевдонимы одного и того же пользователя будут
+    разными после перезапуска.
+    """
+
+    def __init__(
+        self, file: Union[os.PathLike, str], secret: Optional[str] = None
+    ) -> None:
+        self._file = gzip.open(file, "at", encoding="utf-8")
+        self._key = (secret or secrets.token_hex(16)).encode("utf-8")[:64]
+        self._started = time.monotonic()
+        self._written = 0
+        self._lock = threading.Lock()
+        self._write({"kind": "start"})
+
+    def pseudonym(self, user_id: int) -> int:
+        digest = hashlib.blake2b(
+            str(int(user_id)).encode("ascii"), key=self._key, digest_size=6
+        ).digest()
+        return int.from_bytes(digest, "big")
+
+    def _anonymize_ids(self, value: Any) -> Any:
+        if isinstance(value, int):
+            return self.pseudonym(value)
+        return ",".join(str(self.pseudonym(int(id))) for id in str(value).split(","))
+
+    def _anonymize_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        pseudonym = self.pseudonym(user["id"])
+        anonymized = {k: v for k, v in user.items() if k in _USER_FIELDS}
+        anonymized["id"] = pseudonym
+        anonymized["first_name"] = f"Имя{pseudonym}"
+        anonymized["last_name"] = f"Фамилия{pseudonym}"
+        return anonymized
+
+    def _anonymize_response(self, method: str, response: Any) -> Any:
+        if method in _USER_LIST_METHODS:
+            if isinstance(response, dict):
+                items = [self._anonymize_user(user) for user in response["items"]]
+                return {**response, "items": items}
+            return [self._anonymize_user(user) for user in response]
+        if method == "photos.get":
+            items = [
+                {
+                    "id": photo["id"],
+                    "owner_id": self.pseudonym(photo["owner_id"]),
+                    "likes": photo.get("likes", {}),
+                }
+                for photo in response["items"]
+            ]
+            return {"count": response["count"], "items": items}
+        return response
+
+    def anonymize_params(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        anonymized = _scrub_params(values)
+        return {
+            k: self._anonymize_ids(v) if k in _USER_ID_PARAMS else v
+            for k, v in anonymized.items()
+        }
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        record["t"] = round(time.monotonic() - self._started, 3)
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._written += 1
+            if self._written % _FLUSH_EVERY == 0:
+                self._file.flush()
+
+    def record_event(self, user_id: int, text: str) -> None:
+        self._write(
+            {
+                "kind": "event",
+                "user_id": self.pseudonym(user_id),
+                "text": scrub_text(text),
+            }
+        )
+
+    def record_vk(self, method: str, values: Dict[str, Any], response: Any) -> None:
+        try:
+            record = {
+                "kind": "vk",
+                "method": method,
+                "params": self.anonymize_params(values),
+                "response": self._anonymize_response(method, response),
+            }
+        except (KeyError, TypeError, ValueError):
+            logger.exception("Can't record response of %s", method)
+            return
+        self._write(record)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _scrub_params(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: scrub_text(v) if k in _TEXT_PARAMS and isinstance(v, str) else v
+        for k, v in values.items()
+        if k not in _DROPPED_PARAMS
+    }
+
+
+def request_key(method: str, params: Dict[str, Any]) -> str:
+    """Ключ запроса, по которому при воспроизведении ищется записанный ответ."""
+    # при воспроизведении тексты уже очищены, а `scrub_text` их не меняет
+    kept = _scrub_params(params)
+    return method + json.dumps(kept, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def read_recording(file: Union[os.PathLike, str]) -> Iterator[Dict[str, Any]]:
+    """Потоковое чтение записи; оборванный хвост файла молча пропускается."""
+    with gzip.open(file, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except EOFError:
+            return
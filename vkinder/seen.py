@@ -0,0 +1,158 @@
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from vkinder.metrics import Metrics
+from vkinder.models import Seen
+from vkinder.storage.base import (
+    BaseStorage,
+    ItemAlreadyExistsInStorageError,
+    ItemNotFoundInStorageError,
+)
+
+# вместимость первого слоя фильтра; каждый следующий вдвое больше
+FIRST_SLICE_CAPACITY = 256
+# на сколько слоёв делится допустимая доля ложных срабатываний
+MAX_SLICES = 8
+
+
+class SeenFilter:
+    """Масштабируемый фильтр Блума по id анкет.
+
+    Фильтр состоит из слоёв: когда последний слой заполнен, добавляется
+    новый, вдвое больше. Так память растёт вместе с числом анкет, а не
+    выделяется сразу под `capacity`. Когда в слоях помещается больше
+    `capacity` анкет, самые старые слои выбрасываются -- фильтр забывает
+    давно просмотренные анкеты.
+
+    Анкету, которую добавили, фильтр узнаёт всегда, а не добавленную
+    ошибочно узнаёт с вероятностью не больше `error_rate`.
+    """
+
+    def __init__(
+        self,
+        slices: Sequence[bytes] = (),
+        count: int = 0,
+        capacity: int = 10_000,
+        error_rate: float = 0.01,
+    ) -> None:
+        self.capacity = capacity
+        # у каждого слоя своя доля ложных срабатываний, чтобы в сумме
+        # они не превышали `error_rate`
+        self.hashes = math.ceil(math.log2(MAX_SLICES / error_rate))
+        self._slices: List[bytearray] = [bytearray(bits) for bits in slices]
+        # сколько анкет добавлено в последний слой
+        self.count = count
+
+    @property
+    def slices(self) -> Tuple[bytes, ...]:
+        return tuple(bytes(bits) for bits in self._slices)
+
+    def _slice_capacity(self, bits: bytearray) -> int:
+        return int(len(bits) * 8 * math.log(2) / self.hashes)
+
+    def _new_slice(self) -> bytearray:
+        if self._slices:
+            capacity = 2 * self._slice_capacity(self._slices[-1])
+        else:
+            capacity = FIRST_SLICE_CAPACITY
+        capacity = max(1, min(capacity, self.capacity // 2))
+        return bytearray(math.ceil(capacity * self.hashes / math.log(2) / 8))
+
+    def _positions(self, vk_id: int, size: int) -> Iterator[int]:
+        digest = hashlib.blake2b(
+            vk_id.to_bytes(8, "little", signed=True), digest_size=16
+        ).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % size for i in range(self.hashes))
+
+    def __contains__(self, vk_id: int) -> bool:
+        for bits in self._slices:
+            if all(
+                bits[position >> 3] & (1 << (position & 7))
+                for position in self._positions(vk_id, len(bits) * 8)
+            ):
+                return True
+        return False
+
+    def add(self, vk_id: int) -> bool:
+        """Добавляет анкету; возвращает False, если она уже была в фильтре."""
+        if vk_id in self:
+            return False
+        if not self._slices or self.count >= self._slice_capacity(self._slices[-1]):
+            self._slices.append(self._new_slice())
+            self.count = 0
+            while len(self._slices) > 1 and (
+                sum(self._slice_capacity(bits) for bits in self._slices[:-1])
+                > self.capacity - self._slice_capacity(self._slices[-1])
+            ):
+                del self._slices[0]
+        bits = self._slices[-1]
+        for position in self._positions(vk_id, len(bits) * 8):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        return True
+
+
+class SeenProfiles:
+    """Анкеты, которые пользователь уже оценил, во всех его поисках.
+
+    Для каждого пользователя хранится `SeenFilter` (см. `vkinder.models.Seen`),
+    так что новый поиск не показывает уже оценённых людей и для этого не
+    приходится перебирать старые `Match` пользователя.
+    """
+
+    def __init__(
+        self,
+        storage: BaseStorage,
+        metrics: Metrics,
+        capacity: int = 10_000,
+        error_rate: float = 0.01,
+    ) -> None:
+        self.storage = storage
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._skipped = metrics.counter(
+            "vkinder_seen_skipped_total",
+            "Результаты поиска, пропущенные как уже оценённые",
+            [],
+        )
+
+    def _filter(self, seen: Seen) -> SeenFilter:
+        return SeenFilter(seen.slices, seen.count, self.capacity, self.error_rate)
+
+    def get(self, user_id: int) -> SeenFilter:
+        try:
+            return self._filter(self.storage.get(Seen, user_id))
+        except ItemNotFoundInStorageError:
+            return SeenFilter(capacity=self.capacity, error_rate=self.error_rate)
+
+    def add(self, user_id: int, vk_id: int) -> None:
+        def change(seen: Seen) -> None:
+            bloom = self._filter(seen)
+            if bloom.add(vk_id):
+                seen.slices = bloom.slices
+                seen.count = bloom.count
+
+        try:
+            self.storage.update(Seen, user_id, change)
+        except ItemNotFoundInStorageError:
+            seen = Seen(user_id=user_id)
+            change(seen)
+            try:
+                self.storage.save(seen, overwrite=False)
+            except ItemAlreadyExistsInStorageError:
+                # фильтр успели создать из другого потока
+                self.storage.update(Seen, user_id, change)
+
+    def unseen(
+        self, user_id: int, people: Iterable[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """Пропускает из `people` тех, кого пользователь уже оценил."""
+        bloom = self.get(user_id)
+        for person in people:
+            if person["id"] in bloom:
+                self._skipped.labels().inc()
+            else:
+                yield person
@@ -0,0 +1,55 @@
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import requests
+import vk_api
+
+from vkinder.metrics import Metrics
+from vkinder.tracing import Tracer
+
+if TYPE_CHECKING:
+    from vkinder.recording import Recorder
+
+
+class VkSession(vk_api.VkApi):
+    """Сессия VK API, которая замеряет и трассирует каждый запрос.
+
+    `label` попадает в метрики вместо самого токена, чтобы токены
+    не утекали наружу через эндпоинт с метриками. Через `http` можно
+    подменить HTTP-сессию, которой пользуется `vk_api`, а через `recorder` --
+    записывать ответы для последующего воспроизведения.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        metrics: Metrics,
+        tracer: Tracer,
+        label: str,
+        http: Optional[requests.Session] = None,
+        recorder: Optional["Recorder"] = None,
+    ) -> None:
+        super().__init__(token=token, session=http)
+        self.metrics = metrics
+        self.tracer = tracer
+        self.label = label
+        self.recorder = recorder
+
+    def method(
+        self, method: str, values: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            with self.tracer.span("vk", method=method, token=self.label):
+                response = super().method(method, values, **kwargs)
+        except Exception:
+            self.metrics.vk_errors.labels(method=method, token=self.label).inc()
+            raise
+        finally:
+            self.metrics.vk_latency.labels(method=method, token=self.label).observe(
+                time.perf_counter() - started
+            )
+
+        if self.recorder is not None:
+            self.recorder.record_vk(method, values or {}, response)
+        return response
@@ -1,37 +1,94 @@
 import enum
+import importlib
+import threading
+from typing import TYPE_CHECKING, Dict, Iterator, Mapping, Type
 
-from vkinder.state.hello import HelloAgainState, HelloErrorState, HelloState
-from vkinder.state.initial import InitialState
-from vkinder.state.list_matches import ListMatchesState
-from vkinder.state.select_age import SelectAgeErrorState, SelectAgeState
-from vkinder.state.select_city import SelectCityErrorState, SelectCityState
-from vkinder.state.select_country import SelectCountryErrorState, SelectCountryState
-from vkinder.state.select_sex import SelectSexErrorState, SelectSexState
+if TYPE_CHECKING:
+    from vkinder.state._base import State
 
 
 class StateName(enum.Enum):
     # новый пользователь
-    INITIAL = InitialState
+    INITIAL = "initial"
     # приветствие
-    HELLO = HelloState
-    HELLO_ERROR = HelloErrorState
-    HELLO_AGAIN = HelloAgainState
+    HELLO = "hello"
+    HELLO_ERROR = "hello_error"
+    HELLO_AGAIN = "hello_again"
     # выбор страны
-    SELECT_COUNTRY = SelectCountryState
-    SELECT_COUNTRY_ERROR = SelectCountryErrorState
+    SELECT_COUNTRY = "select_country"
+    SELECT_COUNTRY_ERROR = "select_country_error"
     # выбор города
-    SELECT_CITY = SelectCityState
-    SELECT_CITY_ERROR = SelectCityErrorState
+    SELECT_CITY = "select_city"
+    SELECT_CITY_ERROR = "select_city_error"
     # выбор пола
-    SELECT_SEX = SelectSexState
-    SELECT_SEX_ERROR = SelectSexErrorState
+    SELECT_SEX = "select_sex"
+    SELECT_SEX_ERROR = "select_sex_error"
     # выбор возраста
-    SELECT_AGE = SelectAgeState
-    SELECT_AGE_ERROR = SelectAgeErrorState
+    SELECT_AGE = "select_age"
+    SELECT_AGE_ERROR = "select_age_error"
     # просмотр результатов поиска
-    LIST_MATCHES = ListMatchesState
+    LIST_MATCHES = "list_matches"
+    # история поисков
+    SEARCH_HISTORY = "search_history"
+    SEARCH_HISTORY_ERROR = "search_history_error"
+    LIKED_MATCHES = "liked_matches"
+    LIKED_MATCHES_ERROR = "liked_matches_error"
 
 
-all_states = [state.value for state in StateName]
+# где лежит класс каждого состояния
+_STATE_CLASSES = {
+    StateName.INITIAL: "vkinder.state.initial:InitialState",
+    StateName.HELLO: "vkinder.state.hello:HelloState",
+    StateName.HELLO_ERROR: "vkinder.state.hello:HelloErrorState",
+    StateName.HELLO_AGAIN: "vkinder.state.hello:HelloAgainState",
+    StateName.SELECT_COUNTRY: "vkinder.state.select_country:SelectCountryState",
+    StateName.SELECT_COUNTRY_ERROR: (
+        "vkinder.state.select_country:SelectCountryErrorState"
+    ),
+    StateName.SELECT_CITY: "vkinder.state.select_city:SelectCityState",
+    StateName.SELECT_CITY_ERROR: "vkinder.state.select_city:SelectCityErrorState",
+    StateName.SELECT_SEX: "vkinder.state.select_sex:SelectSexState",
+    StateName.SELECT_SEX_ERROR: "vkinder.state.select_sex:SelectSexErrorState",
+    StateName.SELECT_AGE: "vkinder.state.select_age:SelectAgeState",
+    StateName.SELECT_AGE_ERROR: "vkinder.state.select_age:SelectAgeErrorState",
+    StateName.LIST_MATCHES: "vkinder.state.list_matches:ListMatchesState",
+    StateName.SEARCH_HISTORY: "vkinder.state.history:SearchHistoryState",
+    StateName.SEARCH_HISTORY_ERROR: "vkinder.state.history:SearchHistoryErrorState",
+    StateName.LIKED_MATCHES: "vkinder.state.history:LikedMatchesState",
+    StateName.LIKED_MATCHES_ERROR: "vkinder.state.history:LikedMatchesErrorState",
+}
 
-states = {state.key: state for state in all_states}
+
+class StateRegistry(Mapping[str, Type["State"]]):
+    """Классы состояний по ключам.
+
+    Модуль состояния импортируется, а его статические части собираются
+    (`State.compile`) при первом обращении к состоянию, а не при запуске.
+    """
+
+    def __init__(self, paths: Mapping[StateName, str]) -> None:
+        self._paths = {name.value: path for name, path in paths.items()}
+        self._loaded: Dict[str, Type["State"]] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> Type["State"]:
+        state = self._loaded.get(key)
+        if state is not None:
+            return state
+        with self._lock:
+            if key not in self._loaded:
+                module, name = self._paths[key].split(":")
+                state = getattr(importlib.import_module(module), name)
+                assert state.key == key
+                state.compile()
+                self._loaded[key] = state
+        return self._loaded[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+states = StateRegistry(_STATE_CLASSES)
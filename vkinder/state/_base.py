@@ -1,8 +1,10 @@
 import abc
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 from vk_api.longpoll import Event
 
+from vkinder.state._render import Layout, render_keyboard
+
 if TYPE_CHECKING:
     from vkinder.bot import Bot
     from vkinder.state import StateName
@@ -13,6 +15,16 @@ TOTAL_STEPS = 4
 class State(abc.ABC):
     key: str
 
+    # статическая клавиатура состояния, если есть
+    keyboard: Optional[Layout] = None
+    keyboard_json: Optional[str] = None
+
+    @classmethod
+    def compile(cls) -> None:
+        """Заранее собирает статические части ответов состояния."""
+        if cls.keyboard is not None:
+            cls.keyboard_json = render_keyboard(cls.keyboard)
+
     @classmethod
     @abc.abstractmethod
     def enter(cls, bot: "Bot", event: Event) -> None:
@@ -0,0 +1,26 @@
+from functools import lru_cache
+from typing import Tuple
+
+from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+
+Button = Tuple[str, VkKeyboardColor]
+# клавиатура -- это ряды кнопок
+Layout = Tuple[Tuple[Button, ...], ...]
+
+
+@lru_cache(maxsize=4096)
+def render_keyboard(layout: Layout) -> str:
+    """JSON клавиатуры для `messages.send`.
+
+    Результат зависит только от раскладки, поэтому запоминается: статические
+    клавиатуры состояний собираются один раз при построении реестра
+    состояний, а динамические (со странами и городами) -- один раз на каждый
+    набор кнопок.
+    """
+    keyboard = VkKeyboard(one_time=True)
+    for i, row in enumerate(layout):
+        if i:
+            keyboard.add_line()
+        for label, color in row:
+            keyboard.add_button(label, color=color)
+    return keyboard.get_keyboard()
@@ -1,11 +1,12 @@
 from typing import TYPE_CHECKING
 
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
 from vkinder.models import User
 from vkinder.state._base import State
+from vkinder.state._render import Layout
 
 if TYPE_CHECKING:
     from vkinder.bot import Bot
@@ -23,18 +24,17 @@ class HelloState(State):
         "Жми на кнопку!"
     )
 
+    keyboard: Layout = ((("Новый поиск", VkKeyboardColor.PRIMARY),),)
+
     @classmethod
     def enter(cls, bot: "Bot", event: Event) -> None:
         user = bot.storage.get(User, event.user_id)
 
-        keyboard = VkKeyboard(one_time=True)
-        keyboard.add_button("Новый поиск", color=VkKeyboardColor.PRIMARY)
-
         write_msg(
-            bot.group_session,
+            bot.group_vk,
             event.user_id,
             cls.text.format(first_name=user.first_name),
-            keyboard=keyboard.get_keyboard(),
+            keyboard=cls.keyboard_json,
         )
 
     @classmethod
@@ -43,6 +43,8 @@ class HelloState(State):
 
         if event.text == "Новый поиск":
             return StateName.SELECT_COUNTRY
+        elif event.text == "История поисков":
+            return StateName.SEARCH_HISTORY
         else:
             return StateName.HELLO_ERROR
 
@@ -65,3 +67,8 @@ class HelloAgainState(HelloState):
         "Если ты уже искал людей раньше, то можно просмотреть результаты "
         "предыдущих поисков."
     )
+
+    keyboard = (
+        (("Новый поиск", VkKeyboardColor.PRIMARY),),
+        (("История поисков", VkKeyboardColor.SECONDARY),),
+    )
@@ -0,0 +1,210 @@
+import datetime
+from typing import TYPE_CHECKING, List, Tuple, TypeVar
+
+from more_itertools import chunked
+from vk_api.keyboard import VkKeyboardColor
+from vk_api.longpoll import Event
+
+from vkinder.helpers import write_msg
+from vkinder.models import Match, Search, User
+from vkinder.state._base import State
+from vkinder.state._render import Layout, render_keyboard
+from vkinder.storage.base import Query, StorageItem
+
+if TYPE_CHECKING:
+    from vkinder.bot import Bot
+    from vkinder.state import StateName
+
+T = TypeVar("T", bound=StorageItem)
+
+# сколько поисков и анкет показывать на одной странице
+SEARCHES_PAGE = 5
+MATCHES_PAGE = 10
+
+SEX_TITLES = {0: "любой пол", 1: "женщины", 2: "мужчины"}
+
+
+def city_id(search: Search) -> int:
+    # поиски, сохранённые до исправления `SelectAgeState`, хранили город
+    # в поле `city`, как в параметрах users.search
+    return getattr(search, "city_id", None) or getattr(search, "city")
+
+
+def page(query: Query[T], size: int) -> Tuple[List[T], bool]:
+    """Страница выдачи и признак того, что за ней есть ещё."""
+    items = list(query.limit(size + 1))
+    return items[:size], len(items) > size
+
+
+class SearchHistoryState(State):
+    key = "search_history"
+
+    text = (
+        "Твои поиски, начиная с последнего. Выбери поиск, чтобы увидеть, "
+        "кто тебе в нём понравился:"
+    )
+    empty_text = "Ты ещё ничего не искал. Давай начнём новый поиск!"
+
+    @staticmethod
+    def searches(bot: "Bot", user: User) -> Tuple[List[Search], bool]:
+        """Текущая страница поисков пользователя."""
+        query = bot.storage.query(Search).filter(user_id=user.vk_id).reversed()
+        if user.history_cursor is not None:
+            query = query.after(user.history_cursor)
+        return page(query, SEARCHES_PAGE)
+
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        user = bot.storage.get(User, event.user_id)
+
+        searches, more = cls.searches(bot, user)
+        if not searches:
+            write_msg(
+                bot.group_vk,
+                event.user_id,
+                cls.empty_text,
+                keyboard=render_keyboard(((("Назад", VkKeyboardColor.SECONDARY),),)),
+            )
+            return
+
+        city_ids = ",".join(str(city_id(search)) for search in searches)
+        cities = {
+            city["id"]: city["title"]
+            for city in bot.vk.method("database.getCitiesById", {"city_ids": city_ids})
+        }
+
+        lines = [cls.text]
+        for number, search in enumerate(searches, start=1):
+            date = datetime.datetime.fromisoformat(search.datetime)
+            lines.append(
+                f"{number}. {date:%d.%m.%Y}: {cities.get(city_id(search), '?')}, "
+                f"{SEX_TITLES.get(search.sex, '?')}, "
+                f"{search.age_from}-{search.age_to} лет"
+            )
+
+        layout: Layout = tuple(
+            tuple((str(number), VkKeyboardColor.PRIMARY) for number in row)
+            for row in chunked(range(1, len(searches) + 1), 5)
+        )
+        if more:
+            layout += ((("Ещё", VkKeyboardColor.SECONDARY),),)
+        layout += ((("Назад", VkKeyboardColor.SECONDARY),),)
+
+        write_msg(
+            bot.group_vk,
+            event.user_id,
+            "\n".join(lines),
+            keyboard=render_keyboard(layout),
+        )
+
+    @classmethod
+    def leave(cls, bot: "Bot", event: Event) -> "StateName":
+        from vkinder.state import StateName
+
+        user = bot.storage.get(User, event.user_id)
+
+        if event.text == "Назад":
+            user.history_cursor = None
+            bot.storage.save(user)
+            return StateName.HELLO_AGAIN
+
+        searches, more = cls.searches(bot, user)
+
+        if event.text == "Ещё" and more:
+            user.history_cursor = searches[-1].uuid
+            bot.storage.save(user)
+            return StateName.SEARCH_HISTORY
+
+        try:
+            search = searches[int(event.text) - 1]
+        except (ValueError, IndexError):
+            return StateName.SEARCH_HISTORY_ERROR
+
+        user.history_search = search.uuid
+        user.history_match_cursor = None
+        bot.storage.save(user)
+        return StateName.LIKED_MATCHES
+
+
+class SearchHistoryErrorState(SearchHistoryState):
+    key = "search_history_error"
+
+    text = "Не понял, какой поиск открыть. Нажми на кнопку с его номером:"
+
+
+class LikedMatchesState(State):
+    key = "liked_matches"
+
+    text = "Понравились тебе в этом поиске:"
+    empty_text = "В этом поиске тебе никто не понравился."
+
+    @staticmethod
+    def matches(bot: "Bot", user: User) -> Tuple[List[Match], bool]:
+        """Текущая страница понравившихся анкет выбранного поиска."""
+        query = bot.storage.query(Match).filter(
+            search_id=user.history_search, liked=True
+        )
+        if user.history_match_cursor is not None:
+            query = query.after(user.history_match_cursor)
+        return page(query, MATCHES_PAGE)
+
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        user = bot.storage.get(User, event.user_id)
+
+        matches, more = cls.matches(bot, user)
+
+        lines = [cls.text if matches else cls.empty_text]
+        lines.extend(
+            f"{match.first_name} {match.last_name}: https://vk.com/id{match.vk_id}"
+            for match in matches
+        )
+
+        layout: Layout = ()
+        if more:
+            layout += ((("Ещё", VkKeyboardColor.PRIMARY),),)
+        layout += (
+            (
+                ("Назад", VkKeyboardColor.SECONDARY),
+                ("Отмена", VkKeyboardColor.NEGATIVE),
+            ),
+        )
+
+        write_msg(
+            bot.group_vk,
+            event.user_id,
+            "\n".join(lines),
+            keyboard=render_keyboard(layout),
+        )
+
+    @classmethod
+    def leave(cls, bot: "Bot", event: Event) -> "StateName":
+        from vkinder.state import StateName
+
+        user = bot.storage.get(User, event.user_id)
+
+        if event.text == "Отмена":
+            user.history_cursor = None
+            user.history_search = None
+            user.history_match_cursor = None
+            bot.storage.save(user)
+            return StateName.HELLO_AGAIN
+        if event.text == "Назад":
+            user.history_search = None
+            user.history_match_cursor = None
+            bot.storage.save(user)
+            return StateName.SEARCH_HISTORY
+
+        matches, more = cls.matches(bot, user)
+        if event.text == "Ещё" and more:
+            user.history_match_cursor = matches[-1].uuid
+            bot.storage.save(user)
+            return StateName.LIKED_MATCHES
+
+        return StateName.LIKED_MATCHES_ERROR
+
+
+class LikedMatchesErrorState(LikedMatchesState):
+    key = "liked_matches_error"
+
+    text = "Используй, пожалуйста, кнопки. Понравились тебе в этом поиске:"
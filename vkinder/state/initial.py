@@ -23,7 +23,7 @@ class InitialState(State):
 
         user = bot.storage.get(User, event.user_id)
 
-        user_info = bot.session.method(
+        user_info = bot.vk.method(
             "users.get", {"user_ids": event.user_id, "fields": "country,city"}
         )[0]
         first_name = user_info["first_name"]
@@ -1,40 +1,95 @@
-from typing import TYPE_CHECKING
+import logging
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
-from vkinder.models import Match, User
+from vkinder.models import Match, Search, User
 from vkinder.state._base import State
 
 if TYPE_CHECKING:
     from vkinder.bot import Bot
     from vkinder.state import StateName
 
+logger = logging.getLogger(__name__)
+
 
 class ListMatchesState(State):
     key = "list_matches"
 
-    @classmethod
-    def enter(cls, bot: "Bot", event: Event) -> None:
-        user = bot.storage.get(User, event.user_id)
+    keyboard = (
+        (("Да", VkKeyboardColor.POSITIVE), ("Нет", VkKeyboardColor.NEGATIVE)),
+        (("Отмена", VkKeyboardColor.NEGATIVE),),
+    )
 
+    @staticmethod
+    def current_match(bot: "Bot", user: User) -> Tuple[int, Match]:
+        """Номер и анкета, которую пользователь смотрит сейчас."""
         assert user.current_search
         assert user.current_search_item is not None
+        item_index = user.current_search_item
 
-        search_id = user.current_search
+        # порядок меняется в vkinder.ranking одной записью поиска, поэтому
+        # берётся из поиска целиком, а не по `Match.rank` анкеты за анкетой
+        search = bot.storage.get(Search, user.current_search)
+        if search.order is not None:
+            assert 0 <= item_index < len(search.order)
+            return item_index, bot.storage.get(Match, search.order[item_index])
 
-        matches = bot.storage.find(Match, lambda match: match.search_id == search_id)
+        matches = bot.storage.query(Match).filter(search_id=user.current_search)
+        assert 0 <= item_index < matches.count()
 
-        item_index = user.current_search_item
-        assert 0 <= item_index < len(matches)
+        match = matches.filter(rank=item_index).first()
+        if match is None:
+            # поиск создан до появления `Match.rank` -- анкеты лежат по порядку
+            match = matches.offset(item_index).first()
+        assert match is not None
+        return item_index, match
+
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        user = bot.storage.get(User, event.user_id)
+
+        item_index, match = cls.current_match(bot, user)
+
+        text = (
+            f"{item_index+1}. {match.first_name} {match.last_name}: "
+            f"https://vk.com/id{match.vk_id}"
+        )
+        photos = match.photos
+        late: "Optional[Future[str]]" = None
+        if photos is None:
+            # анкета ещё не оценена (см. vkinder.ranking); если VK медлит,
+            # анкета отправляется без фотографий, а они -- следом
+            photos, late = bot.budget.within(
+                cls.key, lambda: cls.fetch_photos(bot, match.vk_id)
+            )
+
+        write_msg(bot.group_vk, event.user_id, text, attachment=photos)
 
-        match = matches[item_index]
+        write_msg(
+            bot.group_vk,
+            event.user_id,
+            "Нравится?",
+            keyboard=cls.keyboard_json,
+        )
 
-        photos = bot.session.method(
+        if late is not None:
+            late.add_done_callback(
+                lambda future: cls.send_late_photos(
+                    bot, event.user_id, item_index, text, future
+                )
+            )
+
+    @staticmethod
+    def fetch_photos(bot: "Bot", owner_id: int) -> str:
+        """Три самые залайканные фотографии профиля для вложения."""
+        items = bot.vk.method(
             "photos.get",
             values={
-                "owner_id": match.vk_id,
+                "owner_id": owner_id,
                 "album_id": "profile",
                 "count": 1000,
                 "extended": 1,
@@ -42,31 +97,32 @@ class ListMatchesState(State):
                 "type": "m",
             },
         )["items"]
-        photos = sorted(photos, key=lambda p: p["likes"]["count"], reverse=True)[:3]
-        photos = ",".join(f"photo{p['owner_id']}_{p['id']}" for p in photos)
+        items = sorted(items, key=lambda p: p["likes"]["count"], reverse=True)[:3]
+        return ",".join(f"photo{p['owner_id']}_{p['id']}" for p in items)
 
-        write_msg(
-            bot.group_session,
-            event.user_id,
-            (
-                f"{item_index+1}. {match.first_name} {match.last_name}: "
-                f"https://vk.com/id{match.vk_id}"
-            ),
-            attachment=photos,
-        )
-
-        keyboard = VkKeyboard(one_time=True)
-        keyboard.add_button("Да", color=VkKeyboardColor.POSITIVE)
-        keyboard.add_button("Нет", color=VkKeyboardColor.NEGATIVE)
-        keyboard.add_line()
-        keyboard.add_button("Отмена", color=VkKeyboardColor.NEGATIVE)
-
-        write_msg(
-            bot.group_session,
-            event.user_id,
-            "Нравится?",
-            keyboard=keyboard.get_keyboard(),
-        )
+    @classmethod
+    def send_late_photos(
+        cls,
+        bot: "Bot",
+        user_id: int,
+        item_index: int,
+        text: str,
+        future: "Future[str]",
+    ) -> None:
+        """Досылает фотографии, не успевшие к анкете, если пользователь
+        всё ещё её смотрит."""
+        try:
+            photos = future.result()
+            user = bot.storage.get(User, user_id)
+            if not photos or not (
+                user.state == cls.key and user.current_search_item == item_index
+            ):
+                bot.budget.degraded(cls.key, "dropped")
+                return
+            write_msg(bot.group_vk, user_id, text, attachment=photos)
+        except Exception:
+            bot.budget.degraded(cls.key, "dropped")
+            logger.exception("Can't send late photos to %s", user_id)
 
     @classmethod
     def leave(cls, bot: "Bot", event: Event) -> "StateName":
@@ -80,26 +136,17 @@ class ListMatchesState(State):
             bot.storage.save(user)
             return StateName.HELLO_AGAIN
 
-        assert user.current_search
-        assert user.current_search_item is not None
-
-        search_id = user.current_search
-
-        matches = bot.storage.find(Match, lambda match: match.search_id == search_id)
-
-        item_index = user.current_search_item
-        assert 0 <= item_index < len(matches)
-
-        match = matches[item_index]
+        item_index, match = cls.current_match(bot, user)
 
-        match.seen = True
+        def mark(match: Match) -> None:
+            match.seen = True
+            match.liked = event.text == "Да"
 
-        if event.text == "Да":
-            match.liked = True
-        else:
-            match.liked = False
+        # анкету в это время может менять vkinder.ranking
+        bot.storage.update(Match, match.id, mark)
+        bot.seen.add(event.user_id, match.vk_id)
 
-        user.current_search_item += 1
+        user.current_search_item = item_index + 1
 
         bot.storage.save(user)
         return StateName.LIST_MATCHES
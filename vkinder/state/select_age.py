@@ -1,8 +1,8 @@
 import datetime
 import uuid
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict
 
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
@@ -25,34 +25,56 @@ class SelectAgeState(State):
         "можно отправить одно число, например: 42."
     ) % (TOTAL_STEPS,)
 
-    @classmethod
-    def enter(cls, bot: "Bot", event: Event) -> None:
-        keyboard = VkKeyboard(one_time=True)
+    keyboard = (
+        (("16-20", VkKeyboardColor.SECONDARY), ("20-25", VkKeyboardColor.SECONDARY)),
+        (("25-30", VkKeyboardColor.SECONDARY), ("30-35", VkKeyboardColor.SECONDARY)),
+        (("35-40", VkKeyboardColor.SECONDARY), ("40-50", VkKeyboardColor.SECONDARY)),
+        (
+            ("Назад", VkKeyboardColor.SECONDARY),
+            ("Отмена", VkKeyboardColor.NEGATIVE),
+        ),
+    )
 
-        keyboard.add_button("16-20")
-        keyboard.add_button("20-25")
-        keyboard.add_line()
-        keyboard.add_button("25-30")
-        keyboard.add_button("30-35")
-        keyboard.add_line()
-        keyboard.add_button("35-40")
-        keyboard.add_button("40-50")
-        keyboard.add_line()
+    # возрастные диапазоны на кнопках
+    presets = [
+        {"age_from": int(age_from), "age_to": int(age_to)}
+        for row in keyboard[:-1]
+        for label, _ in row
+        for age_from, age_to in [label.split("-")]
+    ]
+
+    @staticmethod
+    def search_values(user: User) -> Dict[str, Any]:
+        """Параметры users.search без возраста."""
+        return {
+            "sort": 0,
+            "count": 1000,
+            "has_photo": 1,
+            "status": "6",
+            "can_access_closed": 1,
+            "is_closed": 0,
+            "country": user.country_id,
+            "city": user.city_id,
+            "sex": user.sex,
+        }
 
-        keyboard.add_button("Назад", color=VkKeyboardColor.SECONDARY)
-        keyboard.add_button("Отмена", color=VkKeyboardColor.NEGATIVE)
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        write_msg(bot.group_vk, event.user_id, cls.text, keyboard=cls.keyboard_json)
 
-        write_msg(
-            bot.group_session, event.user_id, cls.text, keyboard=keyboard.get_keyboard()
-        )
+        # пока пользователь выбирает, поищем для самых популярных кнопок
+        user = bot.storage.get(User, event.user_id)
+        bot.prefetcher.prefetch(event.user_id, cls.search_values(user), cls.presets)
 
     @classmethod
     def leave(cls, bot: "Bot", event: Event) -> "StateName":
         from vkinder.state import StateName
 
         if event.text == "Отмена":
+            bot.prefetcher.discard(event.user_id)
             return StateName.HELLO_AGAIN
         if event.text == "Назад":
+            bot.prefetcher.discard(event.user_id)
             return StateName.SELECT_SEX
 
         user = bot.storage.get(User, event.user_id)
@@ -78,7 +100,7 @@ class SelectAgeState(State):
         user.age_from = age_from
         user.age_to = age_to
         write_msg(
-            bot.group_session,
+            bot.group_vk,
             event.user_id,
             (
                 f"Выбран возрастной диапазон: {age_from}-{age_to} лет. "
@@ -92,53 +114,51 @@ class SelectAgeState(State):
         assert user.age_from
         assert user.age_to
 
-        search_params = {
-            "country": user.country_id,
-            "city": user.city_id,
-            "sex": user.sex,
-            "age_from": user.age_from,
-            "age_to": user.age_to,
-        }
-
-        search_results = bot.session.method(
-            "users.search",
-            {
-                "sort": 0,
-                "count": 1000,
-                "has_photo": 1,
-                "status": "6",
-                "fields": "id,verified,domain",
-                "can_access_closed": 1,
-                "is_closed": 0,
-                **search_params,
-            },
-        )["items"]
-        search_results = [
-            person for person in search_results if not person["is_closed"]
-        ]
+        choice = {"age_from": user.age_from, "age_to": user.age_to}
+        values = {**cls.search_values(user), **choice}
+        response = bot.prefetcher.take(event.user_id, values, choice)
+        if response is None:
+            response = bot.vk.method("users.search", values)
+        search_results = response["items"]
+        open_profiles = [person for person in search_results if not person["is_closed"]]
+        # уже оценённых в прошлых поисках не показываем, а если новых
+        # не нашлось -- показываем всех заново
+        search_results = list(bot.seen.unseen(event.user_id, open_profiles))
+        if not search_results:
+            search_results = open_profiles
 
         search_id = uuid.uuid4()
-        search = Search(
-            uuid=search_id,
-            user_id=event.user_id,
-            datetime=datetime.datetime.utcnow().isoformat(),
-            **search_params,
-        )
-        bot.storage.save(search)
-
-        for person in search_results:
-            match = Match(
+        matches = [
+            Match(
                 uuid=uuid.uuid4(),
                 search_id=search_id,
                 vk_id=person["id"],
                 first_name=person["first_name"],
                 last_name=person["last_name"],
+                rank=rank,
             )
+            for rank, person in enumerate(search_results)
+        ]
+        search = Search(
+            uuid=search_id,
+            user_id=event.user_id,
+            datetime=datetime.datetime.utcnow().isoformat(),
+            country_id=user.country_id,
+            city_id=user.city_id,
+            sex=user.sex,
+            age_from=user.age_from,
+            age_to=user.age_to,
+            order=tuple(match.id for match in matches),
+        )
+        bot.storage.save(search)
+        for match in matches:
             bot.storage.save(match)
 
         user.current_search = search_id
         user.current_search_item = 0
         bot.storage.save(user)
+
+        bot.ranker.rank(event.user_id, matches)
         return StateName.LIST_MATCHES
 
 
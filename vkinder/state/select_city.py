@@ -1,12 +1,14 @@
 from typing import TYPE_CHECKING
 
 from more_itertools import chunked
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
 from vkinder.models import User
+from vkinder.places import Place
 from vkinder.state._base import TOTAL_STEPS, State
+from vkinder.state._render import Layout, render_keyboard
 
 if TYPE_CHECKING:
     from vkinder.bot import Bot
@@ -21,6 +23,11 @@ class SelectCityState(State):
         "Если для твоего города нет кнопки, то введи название текстом."
     ) % (TOTAL_STEPS,)
 
+    # искать ли через VK название, на которое похожи города из индекса:
+    # в первый раз пользователю предлагаются похожие, а если он ввёл
+    # название снова, то, видимо, ищет город, которого в индексе нет
+    ask_vk = False
+
     @classmethod
     def enter(cls, bot: "Bot", event: Event) -> None:
         user = bot.storage.get(User, event.user_id)
@@ -30,36 +37,42 @@ class SelectCityState(State):
         country_id = user.country_id
         city_id = user.city_id
 
-        keyboard = VkKeyboard(one_time=True)
+        cities = bot.places.cities(country_id)
+
+        layout: Layout = ()
 
         city_title = None
         if city_id:
-            city_title = bot.session.method(
-                "database.getCitiesById", {"city_ids": city_id}
-            )[0]["title"]
-            keyboard.add_button(city_title, color=VkKeyboardColor.PRIMARY)
-            keyboard.add_line()
+            saved = cities.places.get(city_id)
+            if saved is not None:
+                city_title = saved.title
+            else:
+                # города нет среди крупных и найденных поиском -- спросим VK
+                city_title = bot.vk.method(
+                    "database.getCitiesById", {"city_ids": city_id}
+                )[0]["title"]
+            layout += (((city_title, VkKeyboardColor.PRIMARY),),)
 
         city_titles = [
-            city["title"]
-            for city in bot.session.method(
-                "database.getCities", {"country_id": country_id, "count": 6}
-            )["items"]
-            if city["title"] != city_title
+            city.title for city in cities.first(6) if city.title != city_title
         ]
-        for cities_row in chunked(city_titles, 2):
-            for title in cities_row:
-                keyboard.add_button(title, color=VkKeyboardColor.SECONDARY)
-            keyboard.add_line()
+        layout += tuple(
+            tuple((title, VkKeyboardColor.SECONDARY) for title in cities_row)
+            for cities_row in chunked(city_titles, 2)
+        )
 
-        keyboard.add_button("Назад", color=VkKeyboardColor.SECONDARY)
-        keyboard.add_button("Отмена", color=VkKeyboardColor.NEGATIVE)
+        layout += (
+            (
+                ("Назад", VkKeyboardColor.SECONDARY),
+                ("Отмена", VkKeyboardColor.NEGATIVE),
+            ),
+        )
 
         write_msg(
-            bot.group_session,
+            bot.group_vk,
             event.user_id,
             cls.text,
-            keyboard=keyboard.get_keyboard(),
+            keyboard=render_keyboard(layout),
         )
 
     @classmethod
@@ -74,21 +87,27 @@ class SelectCityState(State):
         user = bot.storage.get(User, event.user_id)
 
         country_id = user.country_id
+        assert country_id
+
+        resolution = bot.places.city(country_id, event.text)
+        city = resolution.exact
+        if city is None:
+            if resolution.suggestions and not cls.ask_vk:
+                return StateName.SELECT_CITY_ERROR
+            # в индексе только крупные города, так что остальные ищем через VK
+            found_cities = bot.vk.method(
+                "database.getCities",
+                {"country_id": country_id, "q": event.text.lower(), "count": 1},
+            )["items"]
+            if not found_cities:
+                return StateName.SELECT_CITY_ERROR
+            bot.places.learn_cities(country_id, found_cities)
+            city = Place(found_cities[0]["id"], found_cities[0]["title"])
 
-        found_cities = bot.session.method(
-            "database.getCities",
-            {"country_id": country_id, "q": event.text.lower(), "count": 1},
-        )["items"]
-
-        if not found_cities:
-            return StateName.SELECT_CITY_ERROR
-
-        city = found_cities[0]
-        city_title = city["title"]
-        city_id = city["id"]
+        city_id, city_title = city
 
         user.city_id = city_id
-        write_msg(bot.group_session, event.user_id, f"Выбран город: {city_title}")
+        write_msg(bot.group_vk, event.user_id, f"Выбран город: {city_title}")
         bot.storage.save(user)
         return StateName.SELECT_SEX
 
@@ -102,3 +121,38 @@ class SelectCityErrorState(SelectCityState):
         "и давай попробуем ещё раз. "
         "Введи название города или выбери его на клавиатуре ниже."
     )
+
+    ask_vk = True
+
+    suggestions_text = (
+        "Не нашёл такого города в выбранной стране. Может быть, ты имел в виду "
+        "один из этих? Если нет, введи название ещё раз."
+    )
+
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        user = bot.storage.get(User, event.user_id)
+        assert user.country_id
+
+        suggestions = bot.places.cities(user.country_id).resolve(event.text).suggestions
+        if not suggestions:
+            super().enter(bot, event)
+            return
+
+        layout: Layout = tuple(
+            tuple((city.title, VkKeyboardColor.PRIMARY) for city in row)
+            for row in chunked(suggestions, 2)
+        )
+        layout += (
+            (
+                ("Назад", VkKeyboardColor.SECONDARY),
+                ("Отмена", VkKeyboardColor.NEGATIVE),
+            ),
+        )
+
+        write_msg(
+            bot.group_vk,
+            event.user_id,
+            cls.suggestions_text,
+            keyboard=render_keyboard(layout),
+        )
@@ -1,12 +1,13 @@
 from typing import TYPE_CHECKING
 
 from more_itertools import chunked
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
 from vkinder.models import User
 from vkinder.state._base import TOTAL_STEPS, State
+from vkinder.state._render import Layout, render_keyboard
 
 if TYPE_CHECKING:
     from vkinder.bot import Bot
@@ -26,37 +27,34 @@ class SelectCountryState(State):
     def enter(cls, bot: "Bot", event: Event) -> None:
         user = bot.storage.get(User, event.user_id)
 
-        country_id = user.country_id
+        # все страны уже есть в индексе, так что VK не спрашиваем
+        countries = bot.places.countries()
 
-        keyboard = VkKeyboard(one_time=True)
+        layout: Layout = ()
 
         country_title = None
-        if country_id:
-            country_title = bot.session.method(
-                "database.getCountriesById", {"country_ids": country_id}
-            )[0]["title"]
-            keyboard.add_button(country_title, color=VkKeyboardColor.PRIMARY)
-            keyboard.add_line()
+        saved = countries.places.get(user.country_id) if user.country_id else None
+        if saved is not None:
+            country_title = saved.title
+            layout += (((country_title, VkKeyboardColor.PRIMARY),),)
 
         country_titles = [
-            country["title"]
-            for country in bot.session.method("database.getCountries", {"count": 6})[
-                "items"
-            ]
-            if country["title"] != country_title
+            country.title
+            for country in bot.places.popular_countries()
+            if country.title != country_title
         ]
-        for countries_row in chunked(country_titles, 2):
-            for title in countries_row:
-                keyboard.add_button(title, color=VkKeyboardColor.SECONDARY)
-            keyboard.add_line()
+        layout += tuple(
+            tuple((title, VkKeyboardColor.SECONDARY) for title in countries_row)
+            for countries_row in chunked(country_titles, 2)
+        )
 
-        keyboard.add_button("Отмена", color=VkKeyboardColor.NEGATIVE)
+        layout += ((("Отмена", VkKeyboardColor.NEGATIVE),),)
 
         write_msg(
-            bot.group_session,
+            bot.group_vk,
             event.user_id,
             cls.text,
-            keyboard=keyboard.get_keyboard(),
+            keyboard=render_keyboard(layout),
         )
 
     @classmethod
@@ -68,24 +66,13 @@ class SelectCountryState(State):
 
         user = bot.storage.get(User, event.user_id)
 
-        country_title_query = event.text.lower()
-
-        countries = bot.session.method(
-            "database.getCountries", {"need_all": 1, "count": 1000}
-        )["items"]
-
-        country_id: int
-        country_title: str
-        for country in countries:
-            if country["title"].lower() == country_title_query:
-                country_id = country["id"]
-                country_title = country["title"]
-                break
-        else:
+        country = bot.places.country(event.text).exact
+        if country is None:
             return StateName.SELECT_COUNTRY_ERROR
+        country_id, country_title = country
 
         user.country_id = country_id
-        write_msg(bot.group_session, event.user_id, f"Выбрана страна: {country_title}")
+        write_msg(bot.group_vk, event.user_id, f"Выбрана страна: {country_title}")
         bot.storage.save(user)
         return StateName.SELECT_CITY
 
@@ -97,3 +84,28 @@ class SelectCountryErrorState(SelectCountryState):
         "Хм, я не знаю такой страны. Убедись, пожалуйста, что название "
         "набрано без ошибок и попробуй снова."
     )
+
+    suggestions_text = (
+        "Хм, я не знаю такой страны. Может быть, ты имел в виду одну из этих? "
+        "Если нет, набери название ещё раз."
+    )
+
+    @classmethod
+    def enter(cls, bot: "Bot", event: Event) -> None:
+        suggestions = bot.places.countries().resolve(event.text).suggestions
+        if not suggestions:
+            super().enter(bot, event)
+            return
+
+        layout: Layout = tuple(
+            tuple((country.title, VkKeyboardColor.PRIMARY) for country in row)
+            for row in chunked(suggestions, 2)
+        )
+        layout += ((("Отмена", VkKeyboardColor.NEGATIVE),),)
+
+        write_msg(
+            bot.group_vk,
+            event.user_id,
+            cls.suggestions_text,
+            keyboard=render_keyboard(layout),
+        )
@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
 
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
+from vk_api.keyboard import VkKeyboardColor
 from vk_api.longpoll import Event
 
 from vkinder.helpers import write_msg
@@ -19,22 +19,21 @@ class SelectSexState(State):
         "Шаг 3 из %s. Отлично! Теперь выбери пол второй половинки, которую ты ищешь."
     ) % (TOTAL_STEPS,)
 
+    keyboard = (
+        (
+            ("Мужской", VkKeyboardColor.PRIMARY),
+            ("Женский", VkKeyboardColor.PRIMARY),
+        ),
+        (("Любой", VkKeyboardColor.SECONDARY),),
+        (
+            ("Назад", VkKeyboardColor.SECONDARY),
+            ("Отмена", VkKeyboardColor.NEGATIVE),
+        ),
+    )
+
     @classmethod
     def enter(cls, bot: "Bot", event: Event) -> None:
-        keyboard = VkKeyboard(one_time=True)
-
-        keyboard.add_button("Мужской", color=VkKeyboardColor.PRIMARY)
-        keyboard.add_button("Женский", color=VkKeyboardColor.PRIMARY)
-        keyboard.add_line()
-        keyboard.add_button("Любой", color=VkKeyboardColor.SECONDARY)
-        keyboard.add_line()
-
-        keyboard.add_button("Назад", color=VkKeyboardColor.SECONDARY)
-        keyboard.add_button("Отмена", color=VkKeyboardColor.NEGATIVE)
-
-        write_msg(
-            bot.group_session, event.user_id, cls.text, keyboard=keyboard.get_keyboard()
-        )
+        write_msg(bot.group_vk, event.user_id, cls.text, keyboard=cls.keyboard_json)
 
     @classmethod
     def leave(cls, bot: "Bot", event: Event) -> "StateName":
@@ -60,9 +59,7 @@ class SelectSexState(State):
         else:
             return StateName.SELECT_SEX_ERROR
 
-        write_msg(
-            bot.group_session, event.user_id, f"Отлично! Будем искать {selected_sex}!"
-        )
+        write_msg(bot.group_vk, event.user_id, f"Отлично! Будем искать {selected_sex}!")
         bot.storage.save(user)
         return StateName.SELECT_AGE
 
@@ -1,9 +1,30 @@
 import abc
-from typing import Any, Callable, List, Type, TypeVar
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 
 class StorageItem(abc.ABC):
     type: str
+    # наборы полей, по которым хранилище может построить индексы для `query`
+    indexes: Tuple[Tuple[str, ...], ...] = ()
+    # поля со ссылками на объекты других типов: (поле, тип), для статистики
+    references: Tuple[Tuple[str, str], ...] = ()
+    # номер версии объекта в хранилище; 0 -- объект ещё не сохранялся
+    version: int = 0
 
     def __init__(self, **kwargs) -> None:
         for k, v in kwargs.items():
@@ -18,6 +39,145 @@ class StorageItem(abc.ABC):
 T = TypeVar("T", bound=StorageItem)
 
 
+class Query(Generic[T]):
+    """Ленивый запрос к хранилищу.
+
+    Запрос -- неизменяемый: `filter`, `order_by`, `offset` и `limit`
+    возвращают новый запрос. Выполняется он только при итерации или вызове
+    `count`/`first`, и хранилище может выполнить его по индексу.
+    """
+
+    def __init__(
+        self,
+        storage: "BaseStorage",
+        type: Type[T],
+        filters: Optional[Dict[str, Any]] = None,
+        ordering: Optional[Tuple[str, bool]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+        cursor: Optional[Any] = None,
+    ) -> None:
+        self.storage = storage
+        self.type = type
+        self.filters = filters or {}
+        # поле и признак сортировки по убыванию
+        self.ordering = ordering
+        self.start = offset
+        self.stop = limit
+        self.reverse = reverse
+        # id объекта, после которого начинается выдача
+        self.cursor = cursor
+
+    def _replace(self, **kwargs: Any) -> "Query[T]":
+        params = {
+            "filters": self.filters,
+            "ordering": self.ordering,
+            "offset": self.start,
+            "limit": self.stop,
+            "reverse": self.reverse,
+            "cursor": self.cursor,
+            **kwargs,
+        }
+        return Query(self.storage, self.type, **params)
+
+    def filter(self, **conditions: Any) -> "Query[T]":
+        """Только объекты, у которых поля равны заданным значениям."""
+        return self._replace(filters={**self.filters, **conditions})
+
+    def order_by(self, field: str) -> "Query[T]":
+        """Сортировка по полю; `-field` -- по убыванию."""
+        descending = field.startswith("-")
+        return self._replace(ordering=(field.lstrip("-"), descending))
+
+    def reversed(self) -> "Query[T]":
+        """Тот же запрос в обратном порядке.
+
+        Без `order_by` объекты идут в порядке добавления, так что
+        `reversed()` -- это сначала новые.
+        """
+        return self._replace(reverse=not self.reverse)
+
+    def after(self, id: Any) -> "Query[T]":
+        """Только объекты, идущие в выдаче после объекта с этим id.
+
+        Курсор для постраничного просмотра: следующая страница -- это
+        `after(id последнего объекта страницы)`. В отличие от `offset`,
+        страницы не съезжают, когда в начало выдачи добавляются объекты.
+        Если объекта с таким id в выдаче нет, запрос пустой.
+        """
+        return self._replace(cursor=id)
+
+    def offset(self, offset: int) -> "Query[T]":
+        """Пропускает первые `offset` объектов выдачи; повторные вызовы
+        складываются.
+
+        Как в SQL `LIMIT ... OFFSET`, порядок вызовов `offset` и `limit` не
+        важен: `limit` всегда отсчитывается от первого не пропущенного объекта.
+        """
+        if offset < 0:
+            raise ValueError("Offset must be non-negative")
+        return self._replace(offset=self.start + offset)
+
+    def limit(self, limit: int) -> "Query[T]":
+        """Не больше `limit` объектов после пропущенных `offset`; повторный
+        вызов может только уменьшить предел."""
+        if limit < 0:
+            raise ValueError("Limit must be non-negative")
+        if self.stop is not None:
+            limit = min(limit, self.stop)
+        return self._replace(limit=limit)
+
+    def __iter__(self) -> Iterator[T]:
+        return self.storage.execute(self)
+
+    def count(self) -> int:
+        return self.storage.count(self)
+
+    def first(self) -> Optional[T]:
+        return next(iter(self.limit(1)), None)
+
+    def matches(self, item: StorageItem) -> bool:
+        return all(getattr(item, k, None) == v for k, v in self.filters.items())
+
+    def skip_to_cursor(self, items: Iterable[T]) -> Iterator[T]:
+        """Пропускает из упорядоченных `items` всё до курсора включительно."""
+        rest = iter(items)
+        if self.cursor is not None:
+            for item in rest:
+                if item.id == self.cursor:
+                    break
+            else:
+                return iter(())
+        return rest
+
+
+class TableStats(NamedTuple):
+    rows: int
+    # примерный объём объектов в памяти
+    bytes: int
+
+
+class ReferenceStats(NamedTuple):
+    # значения ссылки, на которые ссылается больше всего объектов, и число
+    # таких объектов
+    largest: List[Tuple[Any, int]]
+    # объекты, ссылающиеся на то, чего в хранилище нет
+    orphaned: int
+    # посчитано не по всем объектам, а по выборке
+    sampled: bool = False
+
+
+class StorageStats(NamedTuple):
+    # по `StorageItem.type`
+    tables: Dict[str, TableStats]
+    # по "тип.поле" из `StorageItem.references`
+    references: Dict[str, ReferenceStats]
+    # последнее сохранение на диск, если хранилище туда сохраняется
+    persist_seconds: Optional[float] = None
+    snapshot_bytes: Optional[int] = None
+
+
 class ItemNotFoundInStorageError(Exception):
     """Item not found in storage."""
 
@@ -26,7 +186,21 @@ class ItemAlreadyExistsInStorageError(Exception):
     """Item already exists in storage."""
 
 
+class ItemVersionConflictError(Exception):
+    """Item was changed in storage since it had been read."""
+
+
 class BaseStorage(abc.ABC):
+    """Хранилище объектов.
+
+    Изменения -- оптимистичные: `get` отдаёт копию объекта, а `save`
+    сохраняет её, только если объект в хранилище с тех пор не менялся
+    (версии совпадают), иначе бросает `ItemVersionConflictError`. Объект
+    с версией 0 (созданный, а не прочитанный из хранилища) сохраняется
+    поверх существующего без проверки. Для изменений, которые можно
+    повторить, есть `update`.
+    """
+
     @abc.abstractmethod
     def get(self, type: Type[T], id: Any) -> T:
         raise NotImplementedError()
@@ -42,3 +216,64 @@ class BaseStorage(abc.ABC):
     @abc.abstractmethod
     def persist(self) -> None:
         raise NotImplementedError()
+
+    def query(self, type: Type[T]) -> Query[T]:
+        return Query(self, type)
+
+    def execute(self, query: Query[T]) -> Iterator[T]:
+        """Выполнение запроса.
+
+        Реализация по умолчанию перебирает все объекты через `find`;
+        хранилища переопределяют её, чтобы пользоваться индексами.
+        """
+        items = self.find(query.type, query.matches)
+        if query.ordering is not None:
+            field, descending = query.ordering
+            items.sort(key=lambda item: getattr(item, field), reverse=descending)
+        if query.reverse:
+            items.reverse()
+        stop = None if query.stop is None else query.start + query.stop
+        return islice(query.skip_to_cursor(items), query.start, stop)
+
+    def count(self, query: Query[T]) -> int:
+        return sum(1 for _ in self.execute(query))
+
+    def stats(self, top: int = 5) -> StorageStats:
+        """Сводка по содержимому хранилища, `top` самых больших групп для
+        каждой ссылки.
+
+        Реализация по умолчанию ничего не знает о содержимом; хранилища
+        переопределяют её, считая статистику без перебора всех объектов.
+        """
+        return StorageStats(tables={}, references={})
+
+    def update(
+        self, type: Type[T], id: Any, change: Callable[[T], None], attempts: int = 5
+    ) -> T:
+        """Читает объект, применяет к нему `change` и сохраняет.
+
+        Если объект успели изменить, всё повторяется со свежей копией,
+        так что `change` должна быть готова к повторным вызовам.
+        """
+        for attempt in range(attempts):
+            item = self.get(type, id)
+            change(item)
+            try:
+                self.save(item)
+            except ItemVersionConflictError:
+                if attempt == attempts - 1:
+                    raise
+            else:
+                return item
+        raise AssertionError("unreachable")
+
+    def update_many(
+        self, type: Type[T], changes: Mapping[Any, Callable[[T], None]]
+    ) -> None:
+        """`update` для нескольких объектов: `changes` -- изменения по id.
+
+        Реализация по умолчанию обновляет объекты по одному; хранилища
+        переопределяют её, чтобы менять их все за один проход.
+        """
+        for id, change in changes.items():
+            self.update(type, id, change)
@@ -1,50 +1,440 @@
+import copy
+import heapq
 import os
 import pickle
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import islice
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Type, TypeVar, Union, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 from vkinder.storage.base import (
     BaseStorage,
     ItemAlreadyExistsInStorageError,
     ItemNotFoundInStorageError,
+    ItemVersionConflictError,
+    Query,
+    ReferenceStats,
     StorageItem,
+    StorageStats,
+    TableStats,
 )
 
 T = TypeVar("T", bound=StorageItem)
 
+# на сколько частей делятся блокировки объектов
+LOCK_STRIPES = 64
+# размер объектов для статистики меряется у каждого такого по счёту
+# сохранённого объекта, а после чтения с диска -- у стольких первых
+SIZE_SAMPLE_EVERY = 16
+SIZE_SAMPLE_ON_LOAD = 64
+# по скольким объектам считать статистику ссылки, если по ней нет индекса
+REFERENCE_SAMPLE = 10_000
+# примерная цена места в словаре таблицы: хеш, ключ и значение
+DICT_ENTRY_BYTES = 3 * 8
+
+
+def approximate_size(item: StorageItem) -> int:
+    """Примерный объём объекта в памяти вместе с его полями."""
+    fields = item.__dict__
+    size = sys.getsizeof(item) + sys.getsizeof(fields) + DICT_ENTRY_BYTES
+    size += sys.getsizeof(item.id)
+    for value in fields.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, tuple):
+            size += sum(sys.getsizeof(element) for element in value)
+    return size
+
+
+def _first(table: Dict[Any, StorageItem], count: int) -> List[StorageItem]:
+    """Первые `count` объектов таблицы, не копируя её целиком."""
+    try:
+        return list(islice(table.values(), count))
+    except RuntimeError:
+        # таблицу изменили во время обхода -- для статистики не страшно
+        return []
+
+
+class _SizeSample:
+    """Средний размер объекта одного типа по выборке."""
+
+    __slots__ = ("saves", "total", "count")
+
+    def __init__(self) -> None:
+        self.saves = 0
+        self.total = 0
+        self.count = 0
+
+    def add(self, item: StorageItem) -> None:
+        # счётчики меняются без блокировки: редкие потерянные замеры
+        # на среднее почти не влияют
+        self.total += approximate_size(item)
+        self.count += 1
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class _Index:
+    """Индекс по равенству набора полей.
+
+    Для каждого значения полей хранит список id в порядке добавления в индекс
+    и место каждого id в его списке, так что "N-й объект с такими значениями"
+    и "объекты после такого-то" достаются срезом, без перебора.
+    """
+
+    def __init__(self, fields: Tuple[str, ...]) -> None:
+        self.fields = fields
+        self.buckets: Dict[Tuple[Any, ...], List[Any]] = {}
+        # по какому значению объект сейчас лежит в индексе и на каком месте
+        self.keys: Dict[Any, Tuple[Any, ...]] = {}
+        self.positions: Dict[Any, int] = {}
+        self.lock = threading.Lock()
+
+    def key(self, item: StorageItem) -> Tuple[Any, ...]:
+        return tuple([getattr(item, field, None) for field in self.fields])
+
+    def _append(self, id: Any, key: Tuple[Any, ...]) -> None:
+        bucket = self.buckets.setdefault(key, [])
+        self.positions[id] = len(bucket)
+        bucket.append(id)
+        self.keys[id] = key
+
+    def add(self, item: StorageItem) -> None:
+        key = self.key(item)
+        with self.lock:
+            old_key = self.keys.get(item.id)
+            if old_key == key:
+                return
+            if old_key is not None:
+                bucket = self.buckets[old_key]
+                position = self.positions[item.id]
+                del bucket[position]
+                for i in range(position, len(bucket)):
+                    self.positions[bucket[i]] = i
+            self._append(item.id, key)
+
+    def position(self, ids: List[Any], id: Any) -> Optional[int]:
+        """Место `id` в списке `ids` из этого индекса или None."""
+        position = self.positions.get(id)
+        if position is not None and position < len(ids) and ids[position] == id:
+            return position
+        return None
+
+    def fill(self, items: Iterable[StorageItem]) -> None:
+        """Добавляет объекты, которых в индексе ещё нет.
+
+        Те, что уже есть, попали в индекс из `save` и новее переданных.
+        """
+        keyed = [(item.id, self.key(item)) for item in items]
+        with self.lock:
+            for id, key in keyed:
+                if id not in self.keys:
+                    self._append(id, key)
+
 
 class MemoryStorage(BaseStorage):
+    """Хранилище в памяти процесса.
+
+    Запросы `query` с фильтрами по полям из `StorageItem.indexes` выполняются
+    по индексам, которые строятся при первом таком запросе и дальше
+    обновляются в `save`. На тех же индексах (по полям из
+    `StorageItem.references`, если они уже построены) и на выборке размеров
+    объектов из `save` держится `stats`, так что она не перебирает все
+    объекты.
+
+    Хранятся и отдаются наружу копии объектов, так что сохранённый объект
+    никто не меняет на месте: сравнение версий и запись в `save` защищены
+    блокировкой, одной на группу объектов, а не на всё хранилище.
+    """
+
     _data: Dict[str, Dict[Any, StorageItem]]
+    _indexes: Dict[str, Dict[Tuple[str, ...], _Index]]
+    # последнее сохранение на диск (см. `PersistentStorage`)
+    persist_seconds: Optional[float] = None
+    snapshot_bytes: Optional[int] = None
 
     def __init__(self) -> None:
         self._data = {}
+        self._indexes = {}
+        self._sizes: Dict[str, _SizeSample] = {}
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._indexes_lock = threading.Lock()
+
+    def _lock(self, type: str, id: Any) -> threading.Lock:
+        return self._locks[hash((type, id)) % LOCK_STRIPES]
 
     def get(self, type: Type[T], id: Any) -> T:
         table = self._data.setdefault(type.type, {})
         if id not in table:
             raise ItemNotFoundInStorageError()
-        return cast(T, table[id])
+        return cast(T, copy.copy(table[id]))
 
     def save(self, item: StorageItem, overwrite: bool = True) -> None:
         table = self._data.setdefault(item.type, {})
-        if item.id in table and not overwrite:
-            raise ItemAlreadyExistsInStorageError()
-        table[item.id] = item
+        with self._lock(item.type, item.id):
+            stored = table.get(item.id)
+            if stored is not None:
+                if not overwrite:
+                    raise ItemAlreadyExistsInStorageError()
+                if item.version and item.version != stored.version:
+                    raise ItemVersionConflictError()
+                version = stored.version + 1
+            else:
+                version = 1
+            saved = self._write(table, item, version)
+        self._sample(saved)
+        item.version = version
+
+    def update_many(
+        self, type: Type[T], changes: Mapping[Any, Callable[[T], None]]
+    ) -> None:
+        """Меняет объекты за один проход.
+
+        Каждое изменение применяется к копии объекта под его блокировкой,
+        так что конфликтов версий и повторов, как в `update`, не бывает.
+        """
+        table = self._data.setdefault(type.type, {})
+        for id, change in changes.items():
+            with self._lock(type.type, id):
+                stored = table.get(id)
+                if stored is None:
+                    raise ItemNotFoundInStorageError()
+                item = cast(T, copy.copy(stored))
+                change(item)
+                saved = self._write(table, item, stored.version + 1)
+            self._sample(saved)
+
+    def _write(
+        self, table: Dict[Any, StorageItem], item: StorageItem, version: int
+    ) -> StorageItem:
+        """Кладёт копию объекта в таблицу и индексы; вызывается под
+        блокировкой объекта."""
+        saved = copy.copy(item)
+        saved.version = version
+        table[item.id] = saved
+        for index in list(self._indexes.get(item.type, {}).values()):
+            index.add(saved)
+        return saved
+
+    def _sample(self, item: StorageItem) -> None:
+        sample = self._sizes.get(item.type)
+        if sample is None:
+            sample = self._sizes.setdefault(item.type, _SizeSample())
+        if sample.saves % SIZE_SAMPLE_EVERY == 0:
+            sample.add(item)
+        sample.saves += 1
 
     def find(self, type: Type[T], where: Callable[[T], bool]) -> List[T]:
         table = cast(Dict[Any, T], self._data.setdefault(type.type, {}))
-        matching = [item for item in table.values() if where(item)]
+        matching = [copy.copy(item) for item in list(table.values()) if where(item)]
         return matching
 
     def persist(self) -> None:
         pass
 
+    def _average_size(self, type: str, table: Dict[Any, StorageItem]) -> float:
+        sample = self._sizes.get(type)
+        if sample is None or not sample.count:
+            # таблица прочитана с диска и с тех пор не менялась
+            sample = _SizeSample()
+            for item in _first(table, SIZE_SAMPLE_ON_LOAD):
+                sample.add(item)
+            self._sizes.setdefault(type, sample)
+        return sample.average
+
+    def _reference_stats(
+        self, item_type: Type[StorageItem], field: str, target: str, top: int
+    ) -> ReferenceStats:
+        # индекс ради статистики не строится: на большой таблице это дорого,
+        # так что без индекса считаем по первым `REFERENCE_SAMPLE` объектам
+        index = self._indexes.get(item_type.type, {}).get((field,))
+        if index is not None:
+            with index.lock:
+                groups = [
+                    (key[0], len(ids)) for key, ids in index.buckets.items() if ids
+                ]
+            sampled = False
+        else:
+            table = self._data.get(item_type.type, {})
+            sample = _first(table, REFERENCE_SAMPLE)
+            groups = list(
+                Counter(getattr(item, field, None) for item in sample).items()
+            )
+            sampled = len(table) > len(sample)
+        targets = self._data.get(target, {})
+        return ReferenceStats(
+            largest=heapq.nlargest(top, groups, key=lambda group: group[1]),
+            orphaned=sum(size for id, size in groups if id not in targets),
+            sampled=sampled,
+        )
+
+    def stats(self, top: int = 5) -> StorageStats:
+        tables: Dict[str, TableStats] = {}
+        references: Dict[str, ReferenceStats] = {}
+        for type, table in list(self._data.items()):
+            rows = len(table)
+            tables[type] = TableStats(rows, int(rows * self._average_size(type, table)))
+            for item in _first(table, 1):
+                for field, target in item.references:
+                    references[f"{type}.{field}"] = self._reference_stats(
+                        item.__class__, field, target, top
+                    )
+        return StorageStats(
+            tables, references, self.persist_seconds, self.snapshot_bytes
+        )
+
+    def _index(self, type: Type[T], fields: Tuple[str, ...]) -> _Index:
+        indexes = self._indexes.setdefault(type.type, {})
+        index = indexes.get(fields)
+        if index is not None:
+            return index
+        with self._indexes_lock:
+            index = indexes.get(fields)
+            if index is None:
+                index = _Index(fields)
+                # индекс регистрируется до заполнения, чтобы объекты,
+                # сохранённые во время заполнения, тоже в него попали
+                with index.lock:
+                    indexes[fields] = index
+                    items = list(self._data.get(type.type, {}).values())
+                index.fill(items)
+        return index
+
+    def _best_index(self, query: Query[T]) -> Optional[_Index]:
+        """Самый подробный из объявленных индексов, подходящих под фильтры."""
+        suitable = [
+            fields
+            for fields in query.type.indexes
+            if fields and set(fields) <= set(query.filters)
+        ]
+        if not suitable:
+            return None
+        return self._index(query.type, max(suitable, key=len))
+
+    def _candidate_ids(
+        self, query: Query[T]
+    ) -> Tuple[List[Any], bool, Optional[_Index]]:
+        """id, среди которых надо искать, признак того, что они все подходят,
+        и индекс, из которого они взяты."""
+        index = self._best_index(query)
+        if index is None:
+            ids = list(self._data.get(query.type.type, {}))
+            return ids, not query.filters, None
+        key = tuple(query.filters[field] for field in index.fields)
+        exact = len(index.fields) == len(query.filters)
+        return index.buckets.get(key, []), exact, index
+
+    def _bounds(
+        self, query: Query[T], ids: List[Any], index: Optional[_Index], total: int
+    ) -> Tuple[int, int]:
+        """Начало и конец выдачи среди первых `total` из `ids`, считая в
+        порядке запроса (с конца, если он `reverse`)."""
+        begin = 0
+        if query.cursor is not None:
+            position = None if index is None else index.position(ids, query.cursor)
+            if position is None:
+                try:
+                    position = ids.index(query.cursor, 0, total)
+                except ValueError:
+                    return 0, 0
+            begin = total - position if query.reverse else position + 1
+        begin = min(begin + query.start, total)
+        end = total if query.stop is None else min(total, begin + query.stop)
+        return begin, end
+
+    def execute(self, query: Query[T]) -> Iterator[T]:
+        table = cast(Dict[Any, T], self._data.get(query.type.type, {}))
+        ids, exact, index = self._candidate_ids(query)
+
+        if query.ordering is None and exact:
+            # всё уже отфильтровано и упорядочено -- достаточно среза
+            total = len(ids)
+            begin, end = self._bounds(query, ids, index, total)
+            if query.reverse:
+                page = ids[total - end : total - begin][::-1]
+            else:
+                page = ids[begin:end]
+            return (copy.copy(table[id]) for id in page)
+
+        items: Iterable[T] = (copy.copy(table[id]) for id in list(ids))
+        if not exact:
+            items = (item for item in items if query.matches(item))
+        if query.ordering is not None:
+            field, descending = query.ordering
+            items = sorted(
+                items, key=lambda item: getattr(item, field), reverse=descending
+            )
+        if query.reverse:
+            items = reversed(list(items))
+        stop = None if query.stop is None else query.start + query.stop
+        return islice(query.skip_to_cursor(items), query.start, stop)
+
+    def count(self, query: Query[T]) -> int:
+        ids, exact, index = self._candidate_ids(query)
+        if not exact or (query.cursor is not None and query.ordering is not None):
+            return super().count(query)
+        begin, end = self._bounds(query, ids, index, len(ids))
+        return end - begin
+
 
 class PersistentStorage(MemoryStorage):
-    def __init__(self, file: Union[os.PathLike, str]) -> None:
+    """Хранилище в памяти, которое сохраняется в файл.
+
+    С `background=True` файл читается в отдельном потоке, например пока бот
+    подключается к VK, а первое обращение к данным дожидается конца чтения.
+    """
+
+    def __init__(self, file: Union[os.PathLike, str], background: bool = False) -> None:
+        self._loading: Optional[threading.Thread] = None
+        self._load_error: Optional[BaseException] = None
         super().__init__()
         self.file = Path(file)
-        self._load()
+        if background:
+            self._loading = threading.Thread(
+                target=self._load_in_background, name="storage-load", daemon=True
+            )
+            self._loading.start()
+        else:
+            self._load()
+
+    @property  # type: ignore[override]
+    def _data(self) -> Dict[str, Dict[Any, StorageItem]]:
+        loading = self._loading
+        if loading is not None and loading is not threading.current_thread():
+            loading.join()
+            self._loading = None
+        if self._load_error is not None:
+            # с пустыми данными работать нельзя: persist затрёт ими файл
+            raise self._load_error
+        return self.__dict__["_data"]
+
+    @_data.setter
+    def _data(self, data: Dict[str, Dict[Any, StorageItem]]) -> None:
+        self.__dict__["_data"] = data
+
+    def _load_in_background(self) -> None:
+        try:
+            self._load()
+        except BaseException as e:
+            self._load_error = e
 
     def _load(self) -> None:
         if not self.file.exists():
@@ -52,7 +442,24 @@ class PersistentStorage(MemoryStorage):
 
         with self.file.open("rb") as f:
             self._data = pickle.load(f)
+        # индексы не сохраняются на диск, так что строим их заново сразу,
+        # чтобы не тратить на это время первого запроса
+        self._indexes = {}
+        for table in self._data.values():
+            for item in islice(table.values(), 1):
+                for fields in item.indexes:
+                    self._index(type(item), fields)
 
     def persist(self) -> None:
-        with self.file.open("wb") as f:
-            pickle.dump(self._data, f)
+        # сохранённые объекты не меняются на месте, так что для снимка
+        # достаточно скопировать словари, а сериализовать его можно уже
+        # не мешая остальным потокам
+        started = time.perf_counter()
+        snapshot = {type: table.copy() for type, table in list(self._data.items())}
+        tmp_file = self.file.with_name(self.file.name + ".tmp")
+        with tmp_file.open("wb") as f:
+            pickle.dump(snapshot, f)
+            size = f.tell()
+        os.replace(tmp_file, self.file)
+        self.persist_seconds = time.perf_counter() - started
+        self.snapshot_bytes = size
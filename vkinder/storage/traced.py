@@ -0,0 +1,52 @@
+from typing import Any, Callable, Iterator, List, Mapping, Type, TypeVar
+
+from vkinder.storage.base import BaseStorage, Query, StorageItem, StorageStats
+from vkinder.tracing import Tracer
+
+T = TypeVar("T", bound=StorageItem)
+
+
+class TracedStorage(BaseStorage):
+    """Обёртка над хранилищем, добавляющая спаны на каждую операцию."""
+
+    def __init__(self, storage: BaseStorage, tracer: Tracer) -> None:
+        self.storage = storage
+        self.tracer = tracer
+
+    def get(self, type: Type[T], id: Any) -> T:
+        with self.tracer.span("storage.get", type=type.type):
+            return self.storage.get(type, id)
+
+    def save(self, item: StorageItem, overwrite: bool = True) -> None:
+        with self.tracer.span("storage.save", type=item.type):
+            self.storage.save(item, overwrite)
+
+    def update_many(
+        self, type: Type[T], changes: Mapping[Any, Callable[[T], None]]
+    ) -> None:
+        with self.tracer.span("storage.update_many", type=type.type):
+            self.storage.update_many(type, changes)
+
+    def find(self, type: Type[T], where: Callable[[T], bool]) -> List[T]:
+        with self.tracer.span("storage.find", type=type.type):
+            return self.storage.find(type, where)
+
+    def execute(self, query: Query[T]) -> Iterator[T]:
+        # спан покрывает только подготовку запроса: сами объекты выдаются лениво
+        with self.tracer.span("storage.query", type=query.type.type):
+            return self.storage.execute(query)
+
+    def count(self, query: Query[T]) -> int:
+        with self.tracer.span("storage.count", type=query.type.type):
+            return self.storage.count(query)
+
+    def persist(self) -> None:
+        with self.tracer.span("storage.persist"):
+            self.storage.persist()
+
+    def stats(self, top: int = 5) -> StorageStats:
+        with self.tracer.span("storage.stats"):
+            return self.storage.stats(top)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.storage, name)
@@ -0,0 +1,201 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import threading
+import time
+from itertools import count, groupby
+from pathlib import Path
+from typing import Any, Callable, List, Optional, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+class Span:
+    __slots__ = ("name", "attrs", "started", "finished", "children", "error")
+
+    def __init__(self, name: str, attrs: dict) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        finished = self.finished if self.finished is not None else time.perf_counter()
+        return finished - self.started
+
+    def format(self, indent: int = 0) -> List[str]:
+        parts = [self.name]
+        parts.extend(f"{k}={v!r}" for k, v in self.attrs.items())
+        parts.append(f"{self.duration * 1000:.1f}ms")
+        if self.error:
+            parts.append(f"error={self.error}")
+        lines = ["  " * indent + " ".join(parts)]
+        # одинаковые соседние спаны без детей (например, тысяча storage.save
+        # при создании поиска) схлопываем в одну строку
+        for (name, leaf), group in groupby(
+            self.children, key=lambda s: (s.name, not s.children)
+        ):
+            spans = list(group)
+            if leaf and len(spans) > 1:
+                total = sum(span.duration for span in spans)
+                lines.append(
+                    f"{'  ' * (indent + 1)}{name} x{len(spans)} {total * 1000:.1f}ms"
+                )
+            else:
+                for span in spans:
+                    lines.extend(span.format(indent + 1))
+        return lines
+
+
+class _ActiveSpan:
+    __slots__ = ("tracer", "span")
+
+    def __init__(self, tracer: "Tracer", span: Span) -> None:
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.span.finished = time.perf_counter()
+        if exc_type is not None:
+            self.span.error = exc_type.__name__
+        self.tracer._local.stack.pop()
+
+
+class _NoopSpan:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        pass
+
+
+_noop_span = _NoopSpan()
+
+
+class _EventTrace:
+    def __init__(self, tracer: "Tracer", span: Span) -> None:
+        self.tracer = tracer
+        self.span = span
+        self.profile: Optional[cProfile.Profile] = None
+
+    def __enter__(self) -> Span:
+        self.tracer._local.stack = [self.span]
+        if self.tracer.profile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+        self.span.finished = time.perf_counter()
+        if exc_type is not None:
+            self.span.error = exc_type.__name__
+        self.tracer._local.stack = None
+        if self.span.duration >= self.tracer.slow_threshold:
+            self.tracer._dump(self.span, self.profile)
+
+
+class Tracer:
+    """Трассировка обработки событий.
+
+    На каждое событие создаётся корневой спан, внутри которого собираются
+    дочерние спаны для состояний, запросов к VK и операций с хранилищем.
+    Если событие обрабатывалось дольше `slow_threshold` секунд, дерево спанов
+    (и, если включено, профиль cProfile) выгружается в лог или в `dump_dir`.
+
+    Выключенный трейсер почти ничего не стоит, поэтому его можно включать
+    и выключать на ходу, не перезапуская бота (см. `install_signal_handlers`).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        slow_threshold: float = 1.0,
+        profile: bool = False,
+        dump_dir: Union[os.PathLike, str, None] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.profile = profile
+        self.dump_dir = Path(dump_dir) if dump_dir is not None else None
+        self._local = threading.local()
+        self._dumps = count()
+
+    def event(self, name: str, **attrs: Any) -> Union[_EventTrace, _NoopSpan]:
+        if not self.enabled:
+            return _noop_span
+        return _EventTrace(self, Span(name, attrs))
+
+    def span(self, name: str, **attrs: Any) -> Union[_ActiveSpan, _NoopSpan]:
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            return _noop_span
+        span = Span(name, attrs)
+        stack[-1].children.append(span)
+        stack.append(span)
+        return _ActiveSpan(self, span)
+
+    def bind(self, fn: Callable[..., R]) -> Callable[..., R]:
+        """Привязывает функцию к текущему спану.
+
+        Спаны, открытые внутри функции, попадут в дерево текущего события,
+        даже если сама функция выполняется в другом потоке.
+        """
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            return fn
+        parent = stack[-1]
+
+        def bound(*args: Any, **kwargs: Any) -> R:
+            previous = getattr(self._local, "stack", None)
+            self._local.stack = [parent]
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.stack = previous
+
+        return bound
+
+    def _dump(self, span: Span, profile: Optional[cProfile.Profile]) -> None:
+        tree = "\n".join(span.format())
+        if self.dump_dir is None:
+            logger.warning("Slow event:\n%s", tree)
+            if profile is not None:
+                stream = io.StringIO()
+                stats = pstats.Stats(profile, stream=stream)
+                stats.sort_stats("cumulative").print_stats(30)
+                logger.warning("Profile of slow event:\n%s", stream.getvalue())
+            return
+
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        # номер нужен, если события закончились в одну и ту же микросекунду
+        stem = f"slow-event-{time.time():.6f}-{next(self._dumps)}"
+        (self.dump_dir / f"{stem}.txt").write_text(tree + "\n", encoding="utf-8")
+        if profile is not None:
+            profile.dump_stats(str(self.dump_dir / f"{stem}.prof"))
+        logger.warning("Slow event dumped to %s.*", self.dump_dir / stem)
+
+    def toggle(self) -> None:
+        self.enabled = not self.enabled
+        logger.info("Tracing is %s", "enabled" if self.enabled else "disabled")
+
+    def toggle_profile(self) -> None:
+        self.profile = not self.profile
+        logger.info("Profiling is %s", "enabled" if self.profile else "disabled")
+
+    def install_signal_handlers(self) -> None:
+        """SIGUSR1 включает/выключает трассировку, SIGUSR2 -- профилирование."""
+        signal.signal(signal.SIGUSR1, lambda *_: self.toggle())
+        signal.signal(signal.SIGUSR2, lambda *_: self.toggle_profile())
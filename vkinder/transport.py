@@ -0,0 +1,136 @@
+from typing import Any, Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+
+from vkinder.metrics import Metrics
+
+# сколько ждать установки соединения и ответа, в секундах; общий срок запроса
+# ограничивает `VkClient`, а это -- страховка от навсегда зависших сокетов
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+
+class _TrackedPoolMixin:
+    on_connect: Optional[Callable[[], None]] = None
+
+    def _get_conn(self, timeout: Optional[float] = None) -> Any:
+        conn = super()._get_conn(timeout)  # type: ignore[misc]
+        # сокета нет у нового соединения и у того, что закрыл сервер,
+        # пока оно простаивало, -- оба будут подключаться заново
+        if conn.sock is None and self.on_connect is not None:
+            self.on_connect()
+        return conn
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _TrackedPoolManager(PoolManager):
+    """Пул соединений, который сообщает о каждом новом соединении."""
+
+    def __init__(self, on_connect: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.on_connect = on_connect
+        self.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, *args: Any, **kwargs: Any) -> Any:
+        pool = super()._new_pool(*args, **kwargs)
+        if isinstance(pool, _TrackedPoolMixin):
+            pool.on_connect = self.on_connect
+        return pool
+
+
+class _TrackedHTTPAdapter(HTTPAdapter):
+    def __init__(self, on_connect: Callable[[], None], **kwargs: Any) -> None:
+        # HTTPAdapter.__init__ сразу создаёт пул, так что колбэк нужен до него
+        self.on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(
+        self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: Any
+    ) -> None:
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _TrackedPoolManager(
+            self.on_connect,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs,
+        )
+
+
+class VkTransport(requests.Session):
+    """Общая HTTP-сессия для всех сессий VK API.
+
+    Если у каждого токена своя `requests.Session`, то при переборе токенов
+    соединения с api.vk.ru простаивают, закрываются сервером, и TLS
+    приходится устанавливать заново. Общий пул держит тёплыми столько
+    соединений, сколько запросов реально идёт одновременно (`pool_size`),
+    и отдаёт последнее использованное.
+
+    Ответы VK запрашиваются сжатыми (gzip), а в метрики пишется, сколько
+    открыто соединений на сколько запросов и сколько байт передано по сети
+    и после распаковки.
+    """
+
+    def __init__(self, metrics: Metrics, pool_size: int = 16) -> None:
+        super().__init__()
+        self.headers["User-Agent"] = "vkinder"
+        self.headers["Accept-Encoding"] = "gzip, deflate"
+        self.headers["Connection"] = "keep-alive"
+
+        self.requests_total = metrics.counter(
+            "vkinder_http_requests_total", "HTTP-запросы к VK API", []
+        )
+        self.connections_total = metrics.counter(
+            "vkinder_http_connections_total",
+            "Новые HTTP-соединения; остальные запросы идут по уже открытым",
+            [],
+        )
+        self.bytes_total = metrics.counter(
+            "vkinder_http_bytes_total",
+            "Байты, переданные VK API и полученные от него",
+            ["direction"],
+        )
+
+        adapter = _TrackedHTTPAdapter(
+            self.connections_total.inc,
+            pool_connections=4,
+            pool_maxsize=pool_size,
+            max_retries=0,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(  # type: ignore[override]
+        self, method: str, url: str, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        return super().request(method, url, *args, **kwargs)
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        response = super().send(request, **kwargs)
+        self.requests_total.inc()
+        if isinstance(request.body, (bytes, str)):
+            self.bytes_total.labels(direction="sent").inc(len(request.body))
+        if not kwargs.get("stream"):
+            # тело уже прочитано: raw.tell() -- сколько пришло по сети
+            # (сжатым), content -- сколько получилось после распаковки
+            self.bytes_total.labels(direction="received").inc(response.raw.tell())
+            self.bytes_total.labels(direction="decoded").inc(len(response.content))
+        return response
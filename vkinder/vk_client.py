@@ -0,0 +1,286 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence
+
+import requests
+import vk_api
+from vk_api.exceptions import ApiError, ApiHttpError
+
+from vkinder.metrics import Metrics
+from vkinder.tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+# методы, которые ничего не меняют, и поэтому их можно повторять и дублировать
+READ_METHODS = {
+    "users.get",
+    "users.search",
+    "photos.get",
+    "database.getCountries",
+    "database.getCountriesById",
+    "database.getCities",
+    "database.getCitiesById",
+}
+# коды ошибок VK API, которые говорят о проблемах на стороне VK, а не о
+# неправильном запросе: "too many requests", "internal server error" и т.п.
+TRANSIENT_ERROR_CODES = {1, 6, 9, 10}
+# сколько последних замеров хранить для оценки p95
+LATENCY_WINDOW = 200
+# меньше замеров -- оценке p95 не верим и запрос не дублируем
+MIN_LATENCY_SAMPLES = 20
+
+
+class VkClientError(Exception):
+    """Base error of VK API client."""
+
+
+class DeadlineExceededError(VkClientError):
+    """VK API didn't answer in time."""
+
+
+class CircuitOpenError(VkClientError):
+    """VK API is considered degraded, requests are rejected without trying."""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (DeadlineExceededError, requests.RequestException)):
+        return True
+    if isinstance(error, ApiHttpError):
+        return True
+    if isinstance(error, ApiError):
+        return error.code in TRANSIENT_ERROR_CODES
+    return False
+
+
+class CircuitBreaker:
+    """Размыкается после `threshold` сбоев подряд и `cooldown` секунд
+    отклоняет все запросы, после чего пропускает один пробный."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("VK API looks degraded, opening circuit breaker")
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class VkClient:
+    """Клиент VK API поверх пула сессий (по одной на токен).
+
+    Каждый запрос ограничен по времени (`deadlines` по методам или
+    `default_deadline`). Читающие методы при временных ошибках повторяются
+    с экспоненциальной задержкой со случайным разбросом, а если ответ не
+    пришёл за p95 обычного времени ответа, запрос дублируется через другой
+    токен, и берётся тот ответ, что пришёл первым. Если VK раз за разом не
+    отвечает, `CircuitBreaker` какое-то время отклоняет запросы сразу.
+    """
+
+    def __init__(
+        self,
+        sessions: Sequence[vk_api.VkApi],
+        metrics: Metrics,
+        tracer: Tracer,
+        label: str = "user",
+        deadlines: Optional[Mapping[str, float]] = None,
+        default_deadline: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.2,
+        hedge: bool = True,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+    ) -> None:
+        if not sessions:
+            raise ValueError("At least one session is required")
+        self.sessions = list(sessions)
+        self.metrics = metrics
+        self.tracer = tracer
+        self.label = label
+        self.deadlines = dict(deadlines or {})
+        self.default_deadline = default_deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge and len(self.sessions) > 1
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+        self._next = 0
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        # зависшие запросы продолжают занимать поток, пока не отвалятся сами,
+        # поэтому потоков с запасом
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.sessions) * 4, thread_name_prefix=f"vk-{label}"
+        )
+
+        self._retries = metrics.counter(
+            "vkinder_vk_client_retries_total",
+            "Повторы запросов к VK API после временных ошибок",
+            ["client", "method"],
+        )
+        self._hedges = metrics.counter(
+            "vkinder_vk_client_hedges_total",
+            "Дублирующие запросы к VK API через другой токен",
+            ["client", "method", "winner"],
+        )
+        self._deadline_exceeded = metrics.counter(
+            "vkinder_vk_client_deadline_exceeded_total",
+            "Запросы к VK API, не уложившиеся в отведённое время",
+            ["client", "method"],
+        )
+        self._rejected = metrics.counter(
+            "vkinder_vk_client_rejected_total",
+            "Запросы, отклонённые разомкнутым предохранителем",
+            ["client", "method"],
+        )
+
+    def _session(self) -> vk_api.VkApi:
+        """Следующая по кругу сессия, по возможности -- не занятая запросом."""
+        with self._lock:
+            for _ in range(len(self.sessions)):
+                session = self.sessions[self._next]
+                self._next = (self._next + 1) % len(self.sessions)
+                if not session.lock.locked():
+                    return session
+            return session
+
+    def idle_sessions(self) -> int:
+        """Сколько токенов сейчас не заняты запросами."""
+        return sum(not session.lock.locked() for session in self.sessions)
+
+    def _hedge_delay(self, method: str) -> Optional[float]:
+        latencies = self._latencies.get(method)
+        if latencies is None or len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _observe(self, method: str, latency: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(method, deque(maxlen=LATENCY_WINDOW))
+        latencies.append(latency)
+
+    def _submit(self, method: str, values: Dict[str, Any]) -> "Future[Any]":
+        session = self._session()
+        started = time.perf_counter()
+
+        def observe(future: "Future[Any]") -> None:
+            if future.exception() is None:
+                self._observe(method, time.perf_counter() - started)
+
+        future = self._executor.submit(self.tracer.bind(session.method), method, values)
+        future.add_done_callback(observe)
+        return future
+
+    def _attempt(
+        self, method: str, values: Dict[str, Any], deadline: float, hedge: bool
+    ) -> Any:
+        started = time.monotonic()
+        futures: List["Future[Any]"] = [self._submit(method, values)]
+
+        hedge_delay = self._hedge_delay(method) if hedge else None
+        if hedge_delay is not None and hedge_delay < deadline:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                futures.append(self._submit(method, values))
+
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(
+                pending, timeout=remaining, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1:
+                        winner = "hedge" if future is futures[1] else "primary"
+                        self._hedges.labels(
+                            client=self.label, method=method, winner=winner
+                        ).inc()
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+
+        self._deadline_exceeded.labels(client=self.label, method=method).inc()
+        raise DeadlineExceededError(f"{method} didn't answer in {deadline}s")
+
+    def method(
+        self,
+        method: str,
+        values: Optional[Dict[str, Any]] = None,
+        idempotent: Optional[bool] = None,
+    ) -> Any:
+        """Вызов метода VK API, аналог `vk_api.VkApi.method`.
+
+        `idempotent` указывает, можно ли повторять и дублировать запрос;
+        по умолчанию это разрешено только для методов из `READ_METHODS`.
+        """
+        if idempotent is None:
+            idempotent = method in READ_METHODS
+        values = values or {}
+        deadline = self.deadlines.get(method, self.default_deadline)
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._rejected.labels(client=self.label, method=method).inc()
+                raise CircuitOpenError(f"VK API is degraded, {method} rejected")
+            try:
+                response = self._attempt(
+                    method, values, deadline, hedge=idempotent and self.hedge
+                )
+            except Exception as e:
+                if not is_transient(e):
+                    # VK ответил, просто запрос плохой -- с VK всё в порядке
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+                self._retries.labels(client=self.label, method=method).inc()
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                logger.warning("%s failed with %r, retrying in %.2fs", method, e, delay)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return response
+
+        raise AssertionError("unreachable")
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)